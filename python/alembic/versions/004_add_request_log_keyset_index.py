@@ -0,0 +1,31 @@
+"""Add composite index for request log keyset pagination
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 按隧道游标分页：WHERE tunnel_domain = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC
+    op.create_index(
+        'idx_tunnel_request_logs_domain_ts_id',
+        'tunnel_request_logs',
+        ['tunnel_domain', 'timestamp', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_tunnel_request_logs_domain_ts_id', table_name='tunnel_request_logs')
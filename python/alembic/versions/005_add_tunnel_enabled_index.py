@@ -0,0 +1,31 @@
+"""Add composite index for listing enabled tunnels
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 只列启用隧道的游标分页：WHERE enabled = ? AND id < ? ORDER BY id DESC
+    op.create_index(
+        'idx_tunnels_enabled_id',
+        'tunnels',
+        ['enabled', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_tunnels_enabled_id', table_name='tunnels')
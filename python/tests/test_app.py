@@ -0,0 +1,119 @@
+"""
+应用层测试（子域名转发中间件）
+"""
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from tunely import app as app_module
+from tunely.app import create_full_app
+from tunely.protocol import TunnelResponse
+
+
+@pytest.fixture
+def tunnel_app(monkeypatch):
+    """创建带模拟隧道服务器的应用"""
+    application = create_full_app(
+        domain="tunely.test",
+        database_url="sqlite+aiosqlite:///:memory:",
+    )
+    server = MagicMock()
+    server.manager.is_connected.return_value = True
+    server.forward = AsyncMock(return_value=TunnelResponse(
+        id="req-001",
+        status=200,
+        headers={"content-type": "text/plain"},
+        body="from tunnel",
+    ))
+    monkeypatch.setattr(app_module, "tunnel_server", server)
+    return application, server
+
+
+def make_http_client(application) -> httpx.AsyncClient:
+    """创建直接调用 ASGI 应用的 HTTP 客户端"""
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=application), base_url="http://tunely.test"
+    )
+
+
+class TestSubdomainProxyMiddleware:
+    """测试子域名转发中间件"""
+
+    @pytest.mark.asyncio
+    async def test_subdomain_forwarded_with_query(self, tunnel_app):
+        """测试子域名请求连同查询参数转发到隧道"""
+        application, server = tunnel_app
+        async with make_http_client(application) as client:
+            response = await client.get(
+                "/api/chat?q=hello&page=2", headers={"host": "my-agent.tunely.test:8000"}
+            )
+
+        assert response.status_code == 200
+        assert response.text == "from tunnel"
+        kwargs = server.forward.await_args.kwargs
+        assert kwargs["domain"] == "my-agent"
+        assert kwargs["path"] == "/api/chat?q=hello&page=2"
+        assert "host" not in kwargs["headers"]
+
+    @pytest.mark.asyncio
+    async def test_subdomain_shadows_builtin_routes(self, tunnel_app):
+        """测试子域名下的 /health 同样转发到隧道"""
+        application, server = tunnel_app
+        async with make_http_client(application) as client:
+            response = await client.get("/health", headers={"host": "my-agent.tunely.test"})
+
+        assert response.text == "from tunnel"
+        assert server.forward.await_args.kwargs["path"] == "/health"
+
+    @pytest.mark.asyncio
+    async def test_main_domain_falls_through(self, tunnel_app):
+        """测试主域名请求交给 FastAPI 路由处理"""
+        application, server = tunnel_app
+        async with make_http_client(application) as client:
+            response = await client.get("/")
+
+        assert response.status_code == 200
+        assert response.json()["service"] == "Tunely Server"
+        server.forward.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_main_domain_unknown_path(self, tunnel_app):
+        """测试主域名下未知路径返回 404"""
+        application, server = tunnel_app
+        async with make_http_client(application) as client:
+            response = await client.get("/no-such-path")
+
+        assert response.status_code == 404
+        server.forward.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_cors_headers_on_proxied_response(self, tunnel_app):
+        """测试转发响应同样带上 CORS 头"""
+        application, _ = tunnel_app
+        async with make_http_client(application) as client:
+            response = await client.get(
+                "/api/chat",
+                headers={"host": "my-agent.tunely.test", "origin": "https://example.com"},
+            )
+
+        assert response.status_code == 200
+        assert response.headers["access-control-allow-origin"] == "*"
+
+    @pytest.mark.asyncio
+    async def test_request_body_parsing(self, tunnel_app):
+        """测试 JSON 对象原文透传，其余 JSON 值解析，非 JSON 请求体按文本转发"""
+        application, server = tunnel_app
+        async with make_http_client(application) as client:
+            await client.post("/api", content=b'{"q": [1, 2]}', headers={"host": "a.tunely.test"})
+            kwargs = server.forward.await_args.kwargs
+            assert kwargs["body"] == '{"q": [1, 2]}'
+            assert kwargs["body_is_json"] is True
+
+            await client.post("/api", content=b"42", headers={"host": "a.tunely.test"})
+            kwargs = server.forward.await_args.kwargs
+            assert kwargs["body"] == 42
+            assert kwargs["body_is_json"] is False
+
+            await client.post("/api", content=b"plain \xff", headers={"host": "a.tunely.test"})
+            assert server.forward.await_args.kwargs["body"] == "plain �"
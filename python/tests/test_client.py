@@ -0,0 +1,553 @@
+"""
+客户端测试
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from tunely.client import TunnelClient, coalesce_chunks, forward_headers, iter_utf8
+from tunely.protocol import (
+    PONG_FRAME,
+    PingMessage,
+    TunnelRequest,
+    TunnelResponse,
+    dump_message,
+)
+
+
+class FakeWebSocket:
+    """按顺序产出预设消息的 WebSocket 替身"""
+
+    def __init__(self, messages: list[str]):
+        self._messages = messages
+        self.sent: list[str] = []
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for message in self._messages:
+            yield message
+
+    async def send(self, message: str | bytes, text: bool | None = None) -> None:
+        # JSON 消息以 UTF-8 字节作为文本帧发送时还原为文本，便于断言
+        self.sent.append(message.decode() if text else message)
+
+
+def make_client() -> TunnelClient:
+    return TunnelClient(
+        server_url="ws://localhost:8000/ws/tunnel",
+        token="test-token",
+        target_url="http://localhost:8080",
+    )
+
+
+def mock_target(client: TunnelClient, handler) -> list[httpx.Request]:
+    """将客户端的目标服务替换为 MockTransport，返回收到的请求列表"""
+    received: list[httpx.Request] = []
+
+    def record(request: httpx.Request) -> httpx.Response:
+        received.append(request)
+        return handler(request)
+
+    client._http_client = httpx.AsyncClient(transport=httpx.MockTransport(record))
+    return received
+
+
+class TestExecuteRequest:
+    """测试请求执行"""
+
+    @pytest.mark.asyncio
+    async def test_json_body_forwarded_as_is(self):
+        """测试 JSON 请求体原样转发并补充 Content-Type"""
+        client = make_client()
+        received = mock_target(client, lambda r: httpx.Response(200, text="ok"))
+        body = json.dumps({"message": "hello"})
+
+        response = await client._execute_request(
+            TunnelRequest(id="req-1", method="POST", path="/api/chat", body=body)
+        )
+
+        assert response.status == 200
+        assert received[0].content == body.encode()
+        assert received[0].headers["content-type"] == "application/json"
+
+    @pytest.mark.asyncio
+    async def test_text_body_decoded(self):
+        """测试文本请求体（JSON 字符串）解码后发送"""
+        client = make_client()
+        received = mock_target(client, lambda r: httpx.Response(200, text="ok"))
+
+        await client._execute_request(
+            TunnelRequest(
+                id="req-1",
+                method="POST",
+                path="/upload",
+                headers={"content-type": "text/plain"},
+                body=json.dumps("plain text"),
+            )
+        )
+
+        assert received[0].content == b"plain text"
+        assert received[0].headers["content-type"] == "text/plain"
+
+
+class TestTargetTransport:
+    """测试目标服务连接方式"""
+
+    @pytest.mark.asyncio
+    async def test_unix_socket_target(self, tmp_path):
+        """测试 unix: 目标通过 Unix 域套接字访问"""
+        sock = str(tmp_path / "app.sock")
+
+        async def handle(reader, writer):
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            body = request_line.split()[1]
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_unix_server(handle, path=sock)
+        client = TunnelClient(
+            server_url="ws://localhost:8000/ws/tunnel",
+            token="test-token",
+            target_url=f"unix:{sock}",
+        )
+        try:
+            response = await client._execute_request(
+                TunnelRequest(id="req-1", method="GET", path="/hello?x=1")
+            )
+        finally:
+            await client._close_http_client()
+            server.close()
+
+        assert response.status == 200
+        assert response.body == "/hello?x=1"
+
+    @pytest.mark.asyncio
+    async def test_cookies_not_shared_between_requests(self, tmp_path):
+        """测试目标服务下发的 Cookie 不会被带到后续请求中"""
+        sock = str(tmp_path / "cookie.sock")
+        received: list[bytes] = []
+
+        async def handle(reader, writer):
+            await reader.readline()
+            cookie = b""
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                if line.lower().startswith(b"cookie:"):
+                    cookie = line.split(b":", 1)[1].strip()
+            received.append(cookie)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nSet-Cookie: session=USER_A; Path=/\r\n"
+                b"Content-Length: 2\r\n\r\nok"
+            )
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_unix_server(handle, path=sock)
+        client = TunnelClient(
+            server_url="ws://localhost:8000/ws/tunnel",
+            token="test-token",
+            target_url=f"unix:{sock}",
+        )
+        try:
+            for i in range(2):
+                await client._execute_request(
+                    TunnelRequest(id=f"req-{i}", method="GET", path="/")
+                )
+        finally:
+            await client._close_http_client()
+            server.close()
+
+        assert received == [b"", b""]
+
+    @pytest.mark.asyncio
+    async def test_user_provided_client(self):
+        """测试使用调用方传入的 HTTP 客户端（进程内 ASGI 应用），且不由隧道客户端关闭"""
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": scope["path"].encode()})
+
+        http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+        client = TunnelClient(
+            server_url="ws://localhost:8000/ws/tunnel",
+            token="test-token",
+            target_url="http://app",
+            http_client=http_client,
+        )
+
+        response = await client._execute_request(
+            TunnelRequest(id="req-1", method="GET", path="/in-process")
+        )
+        await client._close_http_client()
+
+        assert response.body == "/in-process"
+        assert not http_client.is_closed
+        await http_client.aclose()
+
+
+class TestForwardHeaders:
+    """测试响应头转发过滤"""
+
+    def test_hop_by_hop_removed(self):
+        """测试逐跳头及 Connection 中列出的头被移除"""
+        headers = httpx.Headers([
+            ("Content-Type", "text/plain"),
+            ("Transfer-Encoding", "chunked"),
+            ("Connection", "keep-alive, X-Internal"),
+            ("Keep-Alive", "timeout=5"),
+            ("X-Internal", "1"),
+            ("Content-Length", "10"),
+        ])
+        assert forward_headers(headers) == {
+            "content-type": "text/plain",
+            "content-length": "10",
+        }
+
+    def test_duplicate_headers_joined(self):
+        """测试同名头合并，与 dict(httpx.Headers) 行为一致"""
+        headers = httpx.Headers([("Vary", "Accept"), ("vary", "Origin")])
+        assert forward_headers(headers) == {"vary": "Accept, Origin"}
+
+
+class TestErrorResponse:
+    """测试目标服务错误响应"""
+
+    @pytest.mark.asyncio
+    async def test_connect_error(self):
+        """测试目标服务不可用时返回 503 并可正常序列化"""
+        client = make_client()
+
+        def refuse(request: httpx.Request) -> httpx.Response:
+            raise httpx.ConnectError("refused", request=request)
+
+        mock_target(client, refuse)
+        response = await client._execute_request(
+            TunnelRequest(id="req-1", method="GET", path="/")
+        )
+
+        frame = json.loads(dump_message(response))
+        assert frame["type"] == "response"
+        assert frame["id"] == "req-1"
+        assert frame["status"] == 503
+        assert frame["error"] == "Target service unavailable: refused"
+        assert frame["headers"] == {}
+        assert frame["body"] is None
+
+    @pytest.mark.asyncio
+    async def test_timeout(self):
+        """测试目标服务超时返回 504"""
+        client = make_client()
+
+        def timeout(request: httpx.Request) -> httpx.Response:
+            raise httpx.ReadTimeout("slow", request=request)
+
+        mock_target(client, timeout)
+        response = await client._execute_request(
+            TunnelRequest(id="req-1", method="GET", path="/")
+        )
+
+        assert response.status == 504
+        assert response.error == "Target service timeout"
+
+
+class TestStreamResponse:
+    """测试大响应流式返回"""
+
+    @pytest.mark.asyncio
+    async def test_large_response_streamed(self):
+        """测试超过阈值的响应以流式消息返回"""
+        client = make_client()
+        client.config.stream_response_threshold = 10
+        client.config.stream_batch_size = 8
+        client._websocket = FakeWebSocket([])
+        mock_target(client, lambda r: httpx.Response(200, text="x" * 20))
+
+        response = await client._execute_request(
+            TunnelRequest(id="req-1", method="GET", path="/", allow_stream=True)
+        )
+
+        assert response is None
+        frames = [json.loads(frame) for frame in client._websocket.sent]
+        assert [f["type"] for f in frames] == [
+            "stream_start", "stream_chunk", "stream_chunk", "stream_chunk", "stream_end"
+        ]
+        assert "".join(f["data"] for f in frames[1:-1]) == "x" * 20
+        assert frames[-1]["total_chunks"] == 3
+
+    @pytest.mark.asyncio
+    async def test_streamed_decoding_matches_buffered(self):
+        """测试流式返回与完整缓冲使用相同的 UTF-8 解码"""
+        client = make_client()
+        client.config.stream_response_threshold = 10
+        client.config.stream_batch_size = 8
+        client._websocket = FakeWebSocket([])
+        body = "你好".encode() * 4 + b"caf\xe9"
+        mock_target(client, lambda r: httpx.Response(
+            200, headers={"content-type": "text/plain; charset=latin-1"}, content=body
+        ))
+
+        buffered = await client._execute_request(
+            TunnelRequest(id="req-1", method="GET", path="/")
+        )
+        await client._execute_request(
+            TunnelRequest(id="req-2", method="GET", path="/", allow_stream=True)
+        )
+
+        frames = [json.loads(frame) for frame in client._websocket.sent]
+        streamed = "".join(f["data"] for f in frames if f["type"] == "stream_chunk")
+        assert streamed == buffered.body == "你好" * 4 + "caf\ufffd"
+
+    @pytest.mark.asyncio
+    async def test_large_response_buffered_without_allow_stream(self):
+        """测试服务端不支持流式返回时仍完整缓冲"""
+        client = make_client()
+        client.config.stream_response_threshold = 10
+        client._websocket = FakeWebSocket([])
+        mock_target(client, lambda r: httpx.Response(200, text="x" * 20))
+
+        response = await client._execute_request(
+            TunnelRequest(id="req-1", method="GET", path="/")
+        )
+
+        assert response.body == "x" * 20
+        assert client._websocket.sent == []
+
+
+class TestMessageLoop:
+    """测试消息循环"""
+
+    @pytest.mark.asyncio
+    async def test_requests_are_dispatched_concurrently(self):
+        """测试请求并发执行，不阻塞消息循环"""
+        client = make_client()
+        running = 0
+        max_running = 0
+
+        async def execute(request: TunnelRequest) -> TunnelResponse:
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+            return TunnelResponse(id=request.id, status=200)
+
+        client._execute_request = execute
+        websocket = FakeWebSocket([
+            TunnelRequest(id=f"req-{i}", method="GET", path="/").model_dump_json()
+            for i in range(3)
+        ])
+
+        await client._message_loop(websocket)
+        await asyncio.gather(*client._inflight)
+
+        assert max_running == 3
+        assert len(websocket.sent) == 3
+
+    @pytest.mark.asyncio
+    async def test_cancel_inflight(self):
+        """测试断开连接时取消执行中的请求"""
+        client = make_client()
+
+        async def execute(request: TunnelRequest) -> TunnelResponse:
+            await asyncio.sleep(10)
+            return TunnelResponse(id=request.id, status=200)
+
+        client._execute_request = execute
+        websocket = FakeWebSocket([
+            TunnelRequest(id="req-1", method="GET", path="/").model_dump_json()
+        ])
+
+        await client._message_loop(websocket)
+        assert len(client._inflight) == 1
+
+        await client._cancel_inflight()
+        assert len(client._inflight) == 0
+        assert websocket.sent == []
+
+    @pytest.mark.asyncio
+    async def test_overload_returns_503(self):
+        """测试请求配额耗尽时新请求立即返回 503"""
+        client = make_client()
+        client._request_semaphore = asyncio.BoundedSemaphore(1)
+        finish = asyncio.Event()
+
+        async def execute(request: TunnelRequest) -> TunnelResponse:
+            await finish.wait()
+            return TunnelResponse(id=request.id, status=200)
+
+        client._execute_request = execute
+        websocket = FakeWebSocket([
+            TunnelRequest(id=f"req-{i}", method="GET", path="/").model_dump_json()
+            for i in range(2)
+        ])
+
+        await client._message_loop(websocket)
+        assert len(websocket.sent) == 1
+        rejected = json.loads(websocket.sent[0])
+        assert rejected["id"] == "req-1"
+        assert rejected["status"] == 503
+
+        finish.set()
+        await asyncio.gather(*client._inflight)
+        assert json.loads(websocket.sent[1])["id"] == "req-0"
+        assert client._slot_holders == set()
+
+    @pytest.mark.asyncio
+    async def test_reads_continue_during_long_stall(self):
+        """测试请求长时间占满配额时仍继续读取消息并响应心跳"""
+        client = make_client()
+        client._request_semaphore = asyncio.BoundedSemaphore(1)
+
+        async def execute(request: TunnelRequest) -> TunnelResponse:
+            # 模拟超过 WebSocket 心跳超时窗口仍未完成的请求
+            await asyncio.sleep(3600)
+
+        client._execute_request = execute
+        websocket = FakeWebSocket([
+            TunnelRequest(id="req-0", method="GET", path="/").model_dump_json(),
+            TunnelRequest(id="req-1", method="GET", path="/").model_dump_json(),
+            PingMessage().model_dump_json(),
+        ])
+
+        # 消息循环不能等待执行中的请求
+        await asyncio.wait_for(client._message_loop(websocket), timeout=1)
+        assert json.loads(websocket.sent[0])["status"] == 503
+        assert websocket.sent[1] == PONG_FRAME
+        assert len(client._inflight) == 1
+
+        await client._cancel_inflight()
+        assert not client._request_semaphore.locked()
+
+    @pytest.mark.asyncio
+    async def test_sse_releases_slot(self):
+        """测试 SSE 长连接开始流式发送后归还配额"""
+        client = make_client()
+        client._request_semaphore = asyncio.BoundedSemaphore(1)
+        client._websocket = FakeWebSocket([])
+        finish = asyncio.Event()
+
+        class EventStream(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                yield b"data: 1\n\n"
+                await finish.wait()
+
+        mock_target(client, lambda r: httpx.Response(
+            200, headers={"content-type": "text/event-stream"}, stream=EventStream()
+        ))
+        websocket = FakeWebSocket([
+            TunnelRequest(id="req-0", method="GET", path="/").model_dump_json()
+        ])
+
+        await client._message_loop(websocket)
+        for _ in range(100):
+            if not client._request_semaphore.locked():
+                break
+            await asyncio.sleep(0.01)
+
+        assert not client._request_semaphore.locked()
+        assert len(client._inflight) == 1
+
+        finish.set()
+        await asyncio.gather(*client._inflight)
+
+
+async def timed_chunks(items: list[tuple[float, str]]):
+    """按给定延迟依次产出数据块"""
+    for delay, chunk in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield chunk
+
+
+class TestCoalesceChunks:
+    """测试 SSE 数据块合并"""
+
+    @pytest.mark.asyncio
+    async def test_burst_is_merged(self):
+        """测试连续到达的小数据块被合并"""
+        chunks = timed_chunks([(0, "a"), (0, "b"), (0, "c")])
+        result = [c async for c in coalesce_chunks(chunks, flush_interval=0.05, max_size=1024)]
+        assert result == ["abc"]
+
+    @pytest.mark.asyncio
+    async def test_slow_chunks_flush_separately(self):
+        """测试间隔超过合并窗口的数据块分别输出"""
+        chunks = timed_chunks([(0, "a"), (0.05, "b"), (0.05, "c")])
+        result = [c async for c in coalesce_chunks(chunks, flush_interval=0.01, max_size=1024)]
+        assert result == ["a", "b", "c"]
+
+    @pytest.mark.asyncio
+    async def test_max_size_forces_flush(self):
+        """测试缓冲达到上限时立即输出"""
+        chunks = timed_chunks([(0, "aa"), (0, "bb"), (0, "cc")])
+        result = [c async for c in coalesce_chunks(chunks, flush_interval=0.05, max_size=4)]
+        assert result == ["aabb", "cc"]
+
+    @pytest.mark.asyncio
+    async def test_empty_chunks_skipped(self):
+        """测试空数据块被忽略"""
+        chunks = timed_chunks([(0, ""), (0, "a"), (0, "")])
+        result = [c async for c in coalesce_chunks(chunks, flush_interval=0.01, max_size=1024)]
+        assert result == ["a"]
+
+
+class TestIterUtf8:
+    """测试 SSE 字节流解码"""
+
+    @pytest.mark.asyncio
+    async def test_split_multibyte_character(self):
+        """测试跨数据块的多字节字符被完整解码"""
+        encoded = "data: 你好\n\n".encode()
+        chunks = timed_chunks([(0, encoded[:7]), (0, encoded[7:])])
+        result = [c async for c in iter_utf8(chunks)]
+        assert "".join(result) == "data: 你好\n\n"
+        assert result[0] == "data: "
+
+    @pytest.mark.asyncio
+    async def test_invalid_bytes_replaced(self):
+        """测试非法字节被替换而不是中断流"""
+        chunks = timed_chunks([(0, b"ok\xff"), (0, b"\xe4")])
+        result = [c async for c in iter_utf8(chunks)]
+        assert result == ["ok\ufffd", "\ufffd"]
+
+
+class TestIsSseResponse:
+    """测试 SSE 响应识别"""
+
+    @pytest.mark.parametrize(
+        "content_type, expected",
+        [
+            ("text/event-stream", True),
+            ("text/event-stream; charset=utf-8", True),
+            ("Text/Event-Stream", True),
+            ("application/json", False),
+            ("Application/JSON", False),
+            (None, False),
+        ],
+    )
+    def test_content_type(self, content_type, expected):
+        """测试按 Content-Type 判断，大小写不敏感"""
+        headers = {} if content_type is None else {"content-type": content_type}
+        assert make_client()._is_sse_response(headers) is expected
+
+
+class TestWsExtensions:
+    """测试 WebSocket 扩展配置"""
+
+    def test_compression_enabled_by_default(self):
+        """测试默认启用 permessage-deflate"""
+        extensions = make_client()._ws_extensions()
+        assert [e.name for e in extensions] == ["permessage-deflate"]
+
+    def test_compression_disabled(self):
+        """测试关闭压缩时不协商扩展"""
+        client = make_client()
+        client.config.ws_compression = False
+        assert client._ws_extensions() == []
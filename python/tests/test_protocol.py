@@ -2,7 +2,10 @@
 协议测试
 """
 
+import json
+
 import pytest
+from pydantic import ValidationError
 from tunely.protocol import (
     MessageType,
     AuthMessage,
@@ -15,7 +18,13 @@ from tunely.protocol import (
     StreamStartMessage,
     StreamChunkMessage,
     StreamEndMessage,
+    PING_FRAME,
+    PONG_FRAME,
+    dump_message,
+    dump_message_bytes,
+    parse_auth_response,
     parse_message,
+    parse_trusted_message,
 )
 
 
@@ -70,6 +79,17 @@ class TestMessageTypes:
         assert msg.status == 200
         assert msg.duration_ms == 100
 
+    def test_timestamp_is_iso_seconds(self):
+        """测试时间戳为精确到秒的 ISO 字符串"""
+        from datetime import datetime
+
+        first = TunnelRequest(id="req-001", method="GET", path="/")
+        second = TunnelResponse(id="req-001", status=200)
+        parsed = datetime.fromisoformat(first.timestamp)
+        assert parsed.microsecond == 0
+        assert abs((datetime.now() - parsed).total_seconds()) < 2
+        assert second.timestamp >= first.timestamp
+
     def test_ping_pong_messages(self):
         """测试心跳消息"""
         ping = PingMessage()
@@ -105,6 +125,19 @@ class TestStreamMessages:
         assert msg.data == "data: hello world\n\n"
         assert msg.sequence == 0
 
+    def test_stream_chunk_without_timestamp(self):
+        """测试数据块不携带时间戳，且兼容旧版本发来的 timestamp"""
+        msg = StreamChunkMessage(id="req-001", data="x")
+        assert "timestamp" not in msg.model_dump()
+
+        parsed = parse_message({
+            "type": "stream_chunk",
+            "id": "req-001",
+            "data": "x",
+            "timestamp": "2024-01-01T00:00:00",
+        })
+        assert parsed == msg
+
     def test_stream_end_message(self):
         """测试流结束消息"""
         msg = StreamEndMessage(
@@ -165,6 +198,16 @@ class TestParseMessage:
         assert isinstance(msg, TunnelResponse)
         assert msg.status == 200
 
+    def test_parse_enum_type(self):
+        """解析 type 为枚举值的字典（model_dump 的结果）"""
+        msg = parse_message(PingMessage().model_dump())
+        assert isinstance(msg, PingMessage)
+
+    def test_parse_non_string_type(self):
+        """解析 type 不是字符串的消息"""
+        with pytest.raises(ValueError):
+            parse_message({"type": ["ping"]})
+
     def test_parse_unknown_type(self):
         """解析未知消息类型"""
         data = {"type": "unknown"}
@@ -208,6 +251,93 @@ class TestParseMessage:
         assert msg.total_chunks == 5
 
 
+class TestParseAuthResponse:
+    """测试认证响应解析"""
+
+    def test_auth_ok(self):
+        """解析认证成功响应"""
+        raw = AuthOkMessage(domain="test", tunnel_id="1", features=["binary_tcp"]).model_dump_json()
+        msg = parse_auth_response(raw)
+        assert isinstance(msg, AuthOkMessage)
+        assert msg.features == ["binary_tcp"]
+
+    def test_auth_error(self):
+        """解析认证失败响应"""
+        msg = parse_auth_response(b'{"type": "auth_error", "error": "Invalid token"}')
+        assert isinstance(msg, AuthErrorMessage)
+        assert msg.error == "Invalid token"
+
+    def test_unexpected_type(self):
+        """非认证响应抛出校验错误"""
+        with pytest.raises(ValidationError):
+            parse_auth_response(PING_FRAME)
+
+
+class TestParseTrustedMessage:
+    """测试可信消息解析"""
+
+    def test_request_is_constructed(self):
+        """高频消息直接构造"""
+        data = {"type": "request", "id": "req-001", "method": "GET", "path": "/"}
+        msg = parse_trusted_message(data)
+        assert isinstance(msg, TunnelRequest)
+        assert msg.id == "req-001"
+        assert msg.headers == {}
+        assert msg.timeout == 1800.0
+
+    def test_ping_reuses_instance(self):
+        """心跳消息复用同一实例"""
+        first = parse_trusted_message({"type": "ping"})
+        second = parse_trusted_message({"type": "ping", "timestamp": "x"})
+        assert isinstance(first, PingMessage)
+        assert first is second
+
+    def test_stream_chunk_is_constructed(self):
+        """流式数据块直接构造，兼容旧版本携带的 timestamp"""
+        data = {"type": "stream_chunk", "id": "req-001", "data": "x", "timestamp": "t"}
+        msg = parse_trusted_message(data)
+        assert isinstance(msg, StreamChunkMessage)
+        assert msg.data == "x"
+        assert msg.sequence == 0
+        assert "timestamp" not in msg.__dict__
+
+    def test_pong_reuses_instance(self):
+        """心跳响应复用同一实例"""
+        assert parse_trusted_message({"type": "pong"}) is parse_trusted_message({"type": "pong"})
+
+    def test_response_is_validated(self):
+        """普通响应仍完整校验"""
+        with pytest.raises(ValueError):
+            parse_trusted_message({"type": "response", "id": "req-001", "status": "bad"})
+
+    def test_auth_messages_are_validated(self):
+        """认证消息仍完整校验"""
+        with pytest.raises(ValueError):
+            parse_trusted_message({"type": "auth_ok", "domain": "test-domain"})
+
+    def test_unknown_type(self):
+        """未知消息类型"""
+        with pytest.raises(ValueError):
+            parse_trusted_message({"type": "unknown"})
+
+    @pytest.mark.parametrize("data", [[1], "x", None, {}])
+    def test_non_object_or_untyped(self, data):
+        """非 JSON 对象或缺少 type 的消息抛出 ValueError"""
+        with pytest.raises(ValueError):
+            parse_trusted_message(data)
+
+    @pytest.mark.parametrize("data", [
+        {"type": "stream_chunk", "data": "x"},
+        {"type": "stream_start", "status": 200},
+        {"type": "stream_end", "id": 1},
+        {"type": "tcp_data", "data": ""},
+    ])
+    def test_constructed_requires_identifier(self, data):
+        """直接构造的消息缺少标识字段时抛出 ValueError"""
+        with pytest.raises(ValueError):
+            parse_trusted_message(data)
+
+
 class TestMessageSerialization:
     """测试消息序列化"""
 
@@ -230,3 +360,24 @@ class TestMessageSerialization:
         json_str = msg.model_dump_json()
         assert "req-001" in json_str
         assert "POST" in json_str
+
+    def test_heartbeat_frames(self):
+        """预编码心跳帧可被解析为对应消息"""
+        assert isinstance(parse_message(json.loads(PING_FRAME)), PingMessage)
+        assert isinstance(parse_message(json.loads(PONG_FRAME)), PongMessage)
+
+    def test_dump_message_matches_pydantic(self):
+        """orjson 直接序列化与 Pydantic 序列化结果一致"""
+        msg = TunnelResponse.model_construct(
+            id="req-001",
+            status=200,
+            headers={"content-type": "text/plain"},
+            body="你好 \"quoted\"",
+            duration_ms=12,
+        )
+        assert json.loads(dump_message(msg)) == json.loads(msg.model_dump_json())
+
+    def test_dump_message_bytes(self):
+        """字节版本与文本版本内容一致"""
+        msg = TunnelResponse.model_construct(id="req-001", status=200, body="你好")
+        assert dump_message_bytes(msg) == dump_message(msg).encode()
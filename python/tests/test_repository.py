@@ -2,9 +2,23 @@
 数据仓库测试
 """
 
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
 import pytest
 from tunely.database import DatabaseManager
-from tunely.repository import TunnelRepository
+from tunely.models import Tunnel, TunnelRequestLog
+from tunely.repository import (
+    IncrementBuffer,
+    RequestLogWriter,
+    TunnelCache,
+    TunnelRepository,
+    TunnelRequestLogRepository,
+    TunnelSnapshot,
+    decode_cursor,
+    decode_id_cursor,
+)
 
 
 class TestTunnelRepository:
@@ -146,9 +160,512 @@ class TestTunnelRepository:
 
         async with db_manager.session() as session:
             repo = TunnelRepository(session)
-            await repo.increment_requests("count_token", 5)
+            assert await repo.increment_requests("count_token", 5) == 5
+            assert await repo.increment_requests("missing_token") is None
 
         async with db_manager.session() as session:
             repo = TunnelRepository(session)
             tunnel = await repo.get_by_domain("count-test")
             assert tunnel.total_requests == 5
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("returning", [True, False])
+    async def test_update_fields(self, db_manager: DatabaseManager, monkeypatch, returning):
+        """测试更新字段并返回更新后的隧道（RETURNING 与回退查询两条路径）"""
+        async with db_manager.session() as session:
+            await TunnelRepository(session).create(domain="edit-me", token="tok-edit", name="old")
+
+        async with db_manager.session() as session:
+            monkeypatch.setattr(session.bind.dialect, "update_returning", returning)
+            repo = TunnelRepository(session)
+            tunnel = await repo.update_fields("edit-me", name="new", enabled=False)
+            assert (tunnel.name, tunnel.enabled) == ("new", False)
+            assert (await repo.update_fields("edit-me")).name == "new"
+            assert await repo.update_fields("missing", name="x") is None
+
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("returning", [True, False])
+    async def test_authenticate(self, db_manager: DatabaseManager, monkeypatch, returning):
+        """测试认证时返回隧道并只为启用的隧道更新最后连接时间"""
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            await repo.create(domain="auth-on", token="tok-on")
+            await repo.create(domain="auth-off", token="tok-off")
+            await repo.update_fields("auth-off", enabled=False)
+
+        async with db_manager.session() as session:
+            monkeypatch.setattr(session.bind.dialect, "update_returning", returning)
+            repo = TunnelRepository(session, cache=TunnelCache())
+            enabled = await repo.authenticate("tok-on")
+            disabled = await repo.authenticate("tok-off")
+            assert (enabled.domain, enabled.enabled) == ("auth-on", True)
+            assert (disabled.domain, disabled.enabled) == ("auth-off", False)
+            assert await repo.authenticate("tok-missing") is None
+            assert repo.cache.get(("token", "tok-on")) == enabled
+
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            assert (await repo.get_by_domain("auth-on")).last_connected_at is not None
+            assert (await repo.get_by_domain("auth-off")).last_connected_at is None
+
+    @pytest.mark.asyncio
+    async def test_updated_at_is_utc(self, db_manager: DatabaseManager):
+        """测试任意字段更新都以 UTC 时间写入 updated_at"""
+        async with db_manager.session() as session:
+            await TunnelRepository(session).create(domain="stamp-me", token="tok-stamp")
+
+        async with db_manager.session() as session:
+            tunnel = await TunnelRepository(session).update_fields("stamp-me", name="renamed")
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        assert abs(tunnel.updated_at.replace(tzinfo=None) - now) < timedelta(seconds=5)
+
+    @pytest.mark.asyncio
+    async def test_lookup_binds_each_value(self, db_manager: DatabaseManager):
+        """测试缓存的查询语句每次按新参数执行"""
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            for name in ("lookup-a", "lookup-b"):
+                await repo.create(domain=name, token=f"tok-{name}")
+
+            for name in ("lookup-a", "lookup-b"):
+                assert (await repo.get_by_domain(name)).token == f"tok-{name}"
+                assert (await repo.get_by_token(f"tok-{name}")).domain == name
+
+    @pytest.mark.asyncio
+    async def test_generated_token_format(self, db_manager: DatabaseManager):
+        """测试自动生成的令牌为带前缀的十六进制串"""
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            created = (await repo.create(domain="token-format")).token
+            regenerated = await repo.regenerate_token("token-format")
+
+        for token in (created, regenerated):
+            assert token.startswith("tun_")
+            assert len(token) == 52
+            int(token[4:], 16)
+        assert created != regenerated
+
+    @pytest.mark.parametrize(
+        "dialect, expected",
+        [
+            ("postgresql", "pg_advisory_xact_lock"),
+            ("mysql", "FOR UPDATE"),
+            ("sqlite", None),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_regenerate_token_locks_per_dialect(self, dialect, expected):
+        """测试重新生成令牌前按数据库类型加锁"""
+        session = MagicMock()
+        session.bind.dialect.name = dialect
+        session.execute = AsyncMock(return_value=MagicMock(rowcount=1))
+
+        await TunnelRepository(session).regenerate_token("locked")
+
+        statements = [str(call.args[0]) for call in session.execute.await_args_list]
+        if expected:
+            assert len(statements) == 2
+            assert expected in statements[0]
+        else:
+            assert len(statements) == 1
+        assert statements[-1].startswith("UPDATE")
+
+    @pytest.mark.asyncio
+    async def test_reads_routed_to_read_session(self, tmp_path):
+        """测试查询走只读会话，写操作仍走主库会话"""
+        replica_url = f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"
+        replica = DatabaseManager(replica_url)
+        await replica.initialize()
+        await replica.close()
+
+        db = DatabaseManager(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}", replica_url)
+        await db.initialize()
+        try:
+            async with db.session() as session, db.read_session() as read_session:
+                repo = TunnelRepository(session, read_session=read_session)
+                await repo.create(domain="replicated", token="tok-replicated")
+                assert await repo.increment_requests("tok-replicated") == 1
+                # 副本尚未同步
+                assert await repo.get_by_domain("replicated") is None
+
+            async with db.session() as session:
+                assert await TunnelRepository(session).get_by_domain("replicated")
+        finally:
+            await db.close()
+
+class TestKeysetPagination:
+    """测试游标分页"""
+
+    @pytest.mark.asyncio
+    async def test_enabled_list_uses_index(self, db_manager: DatabaseManager):
+        """测试只列启用隧道的查询走 (enabled, id) 复合索引"""
+        from sqlalchemy import text
+        from tunely.repository import _LIST_ENABLED_TUNNELS
+
+        query = _LIST_ENABLED_TUNNELS.where(Tunnel.id < 10).limit(5)
+        async with db_manager.session() as session:
+            compiled = query.compile(
+                session.bind, compile_kwargs={"literal_binds": True}
+            )
+            result = await session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+            plan = " ".join(str(row[-1]) for row in result)
+
+        assert "idx_tunnels_enabled_id" in plan
+
+    @pytest.mark.asyncio
+    async def test_list_page(self, db_manager: DatabaseManager):
+        """测试隧道列表游标分页覆盖全部记录且不重复"""
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            for i in range(5):
+                await repo.create(domain=f"page-{i}")
+
+        seen: list[str] = []
+        cursor = None
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            while True:
+                tunnels, cursor = await repo.list_page(limit=2, after=cursor)
+                seen.extend(t.domain for t in tunnels)
+                if cursor is None:
+                    break
+                # 游标只编码本页最后一行的 ID
+                assert decode_id_cursor(cursor) == tunnels[-1].id
+
+        assert seen == [f"page-{i}" for i in reversed(range(5))]
+
+    @pytest.mark.asyncio
+    async def test_log_pages_follow_timestamp_order(self, db_manager: DatabaseManager):
+        """测试日志按时间倒序分页，同一时间按 ID 倒序"""
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            for i in range(5):
+                await log_repo.create(tunnel_domain="logs", method="GET", path=f"/{i}")
+            await log_repo.create(tunnel_domain="other", method="GET", path="/x")
+
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            first, cursor = await log_repo.get_recent_page(tunnel_domain="logs", limit=3)
+            second, end = await log_repo.get_recent_page(
+                tunnel_domain="logs", limit=3, after=cursor
+            )
+
+        assert [log.path for log in first + second] == ["/4", "/3", "/2", "/1", "/0"]
+        assert decode_cursor(cursor)[1] == first[-1].id
+        assert end is None
+
+    @pytest.mark.asyncio
+    async def test_offset_is_deprecated(self, db_manager: DatabaseManager):
+        """测试 offset 参数仍可用但发出弃用警告"""
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            for i in range(3):
+                await log_repo.create(tunnel_domain="legacy", method="GET", path=f"/{i}")
+
+            with pytest.warns(DeprecationWarning):
+                logs = await log_repo.get_recent(tunnel_domain="legacy", limit=10, offset=1)
+
+        assert [log.path for log in logs] == ["/1", "/0"]
+
+    def test_invalid_cursor(self):
+        """测试非法游标抛出 ValueError"""
+        with pytest.raises(ValueError):
+            decode_cursor("not-a-cursor")
+        with pytest.raises(ValueError):
+            decode_id_cursor("not-a-cursor")
+
+
+class TestRequestLogRepository:
+    """测试请求日志数据仓库"""
+
+    @pytest.mark.asyncio
+    async def test_create_many(self, db_manager: DatabaseManager):
+        """测试批量写入日志并截断超长字段"""
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            await log_repo.create_many([
+                {"tunnel_domain": "bulk", "method": "GET", "path": "/a"},
+                {
+                    "tunnel_domain": "bulk",
+                    "method": "POST",
+                    "path": "/b" * 600,
+                    "request_headers": {"x-test": "1"},
+                    "status_code": 201,
+                },
+            ])
+            await log_repo.create_many([])
+
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            logs = await log_repo.get_recent(tunnel_domain="bulk")
+
+        assert len(logs) == 2
+        by_method = {log.method: log for log in logs}
+        assert len(by_method["POST"].path) == 1000
+        assert by_method["POST"].to_dict()["request_headers"] == {"x-test": "1"}
+        assert by_method["GET"].timestamp is not None
+
+    @pytest.mark.asyncio
+    async def test_has_more_and_estimate(self, db_manager: DatabaseManager):
+        """测试下一页探测与总数估算（SQLite 回退为精确统计）"""
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            await log_repo.create_many([
+                {"tunnel_domain": "probe", "method": "GET", "path": f"/{i}"}
+                for i in range(3)
+            ])
+
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            assert await log_repo.has_more("probe", limit=2)
+            assert not await log_repo.has_more("probe", limit=3)
+            _, cursor = await log_repo.get_recent_page("probe", limit=1)
+            assert await log_repo.has_more("probe", after=cursor, limit=1)
+            assert not await log_repo.has_more("probe", after=cursor, limit=2)
+            assert await log_repo.estimate_count() == 3
+
+
+    @pytest.mark.asyncio
+    async def test_stream_recent(self, db_manager: DatabaseManager):
+        """测试流式遍历日志覆盖全部记录且按时间倒序"""
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            for i in range(5):
+                await log_repo.create(tunnel_domain="stream", method="GET", path=f"/{i}")
+
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            paths = [
+                log.path
+                async for log in log_repo.stream_recent("stream", batch_size=2)
+            ]
+
+        assert paths == ["/4", "/3", "/2", "/1", "/0"]
+
+    @pytest.mark.asyncio
+    async def test_prune_older_than(self, db_manager: DatabaseManager):
+        """测试分批删除过期日志，保留期内的日志不受影响"""
+        old = datetime.now(timezone.utc) - timedelta(days=10)
+        async with db_manager.session() as session:
+            for i in range(5):
+                session.add(TunnelRequestLog(
+                    tunnel_domain="prune", method="GET", path=f"/old-{i}", timestamp=old
+                ))
+            log_repo = TunnelRequestLogRepository(session)
+            await log_repo.create(tunnel_domain="prune", method="GET", path="/new")
+
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            assert await log_repo.prune_older_than(7, batch_size=2) == 5
+            logs = await log_repo.get_recent("prune")
+
+        assert [log.path for log in logs] == ["/new"]
+
+    def test_log_values_caps_fields(self):
+        """测试超长字段被截断，未超长字段原样保留，空字符串存为 NULL"""
+        body = "b" * 100
+        values = TunnelRequestLogRepository._log_values(
+            tunnel_domain="cap",
+            method="GET",
+            path="/",
+            request_body=body,
+            response_body="r" * 20000,
+            error="",
+        )
+        assert values["request_body"] is body
+        assert len(values["response_body"]) == 10000
+        assert values["error"] is None
+
+    @pytest.mark.asyncio
+    async def test_create_populates_without_refresh(self, db_manager: DatabaseManager):
+        """测试单条创建后主键与默认值已就绪"""
+        async with db_manager.session() as session:
+            log_repo = TunnelRequestLogRepository(session)
+            log = await log_repo.create(tunnel_domain="single", method="GET", path="/")
+
+            assert log.id is not None
+            assert log.timestamp is not None
+            assert log.to_dict()["path"] == "/"
+
+class TestRequestLogWriter:
+    """测试请求日志后台写入"""
+
+    @pytest.mark.asyncio
+    async def test_flush_after_interval(self, db_manager: DatabaseManager):
+        """测试未凑满一批时等待超时后写入"""
+        writer = RequestLogWriter(db_manager, max_batch=100, flush_interval=0.01)
+        writer.start()
+        writer.enqueue({"tunnel_domain": "writer", "method": "GET", "path": "/a"})
+
+        for _ in range(100):
+            async with db_manager.session() as session:
+                if await TunnelRequestLogRepository(session).count("writer"):
+                    break
+            await asyncio.sleep(0.01)
+
+        async with db_manager.session() as session:
+            assert await TunnelRequestLogRepository(session).count("writer") == 1
+        await writer.aclose()
+
+    @pytest.mark.asyncio
+    async def test_aclose_flushes_remaining(self, db_manager: DatabaseManager):
+        """测试关闭时写完队列中剩余的日志"""
+        writer = RequestLogWriter(db_manager, max_batch=2, flush_interval=10)
+        writer.start()
+        for i in range(5):
+            writer.enqueue({"tunnel_domain": "writer", "method": "GET", "path": f"/{i}"})
+        await writer.aclose()
+
+        async with db_manager.session() as session:
+            assert await TunnelRequestLogRepository(session).count("writer") == 5
+
+    @pytest.mark.asyncio
+    async def test_queue_full_drops(self, db_manager: DatabaseManager):
+        """测试队列已满时丢弃新日志而不阻塞"""
+        writer = RequestLogWriter(db_manager, max_queue_size=1)
+        writer.enqueue({"tunnel_domain": "writer", "method": "GET", "path": "/a"})
+        writer.enqueue({"tunnel_domain": "writer", "method": "GET", "path": "/b"})
+        assert writer._queue.qsize() == 1
+
+    def test_enqueue_truncates_large_body(self, db_manager: DatabaseManager):
+        """测试入队时即截断超长字段，不在队列中保留完整大对象"""
+        writer = RequestLogWriter(db_manager)
+        writer.enqueue({
+            "tunnel_domain": "writer",
+            "method": "GET",
+            "path": "/",
+            "request_body": "short",
+            "response_body": "x" * 50000,
+        })
+        queued = writer._queue.get_nowait()
+        assert queued["request_body"] == "short"
+        assert len(queued["response_body"]) == 10000
+
+    def test_max_body_size(self, db_manager: DatabaseManager):
+        """测试按配置限制请求/响应体长度，0 表示不记录"""
+        entry = {"tunnel_domain": "writer", "method": "GET", "path": "/"}
+        writer = RequestLogWriter(db_manager, max_body_size=4)
+        writer.enqueue({**entry, "request_body": "abcdefgh", "response_body": "ab"})
+        queued = writer._queue.get_nowait()
+        assert queued["request_body"] == "abcd"
+        assert queued["response_body"] == "ab"
+
+        writer = RequestLogWriter(db_manager, max_body_size=0)
+        writer.enqueue({**entry, "request_body": "abcdefgh"})
+        assert writer._queue.get_nowait()["request_body"] is None
+
+
+class TestTunnelCache:
+    """测试隧道查询缓存"""
+
+    @pytest.mark.asyncio
+    async def test_cached_lookup_and_invalidation(self, db_manager: DatabaseManager):
+        """测试命中缓存不查库，修改隧道后缓存失效"""
+        cache = TunnelCache(ttl=60)
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session, cache=cache)
+            tunnel = await repo.create(domain="cached", token="tok-cached")
+
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session, cache=cache)
+            first = await repo.get_cached_by_domain("cached")
+            assert first.token == "tok-cached"
+            assert await repo.get_cached_by_token("tok-cached") is first
+            assert await repo.get_cached_by_domain("missing") is None
+
+            new_token = await repo.regenerate_token("cached")
+            # 提交前缓存仍是已提交的数据
+            assert await repo.get_cached_by_token("tok-cached") is first
+
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session, cache=cache)
+            assert await repo.get_cached_by_token("tok-cached") is None
+            assert (await repo.get_cached_by_domain("cached")).token == new_token
+            await repo.update_enabled("cached", False)
+
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session, cache=cache)
+            assert (await repo.get_cached_by_domain("cached")).enabled is False
+            assert (await repo.get_cached_by_domain("cached")).id == tunnel.id
+
+    @pytest.mark.asyncio
+    async def test_invalidation_after_commit_only(self, db_manager: DatabaseManager):
+        """测试提交前被并发查询回填的旧数据在提交后失效，回滚时缓存保留"""
+        cache = TunnelCache(ttl=60)
+        async with db_manager.session() as session:
+            await TunnelRepository(session).create(domain="racy", token="tok-racy")
+
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session, cache=cache)
+            tunnel = await repo.get_by_domain("racy")
+            await repo.update_enabled("racy", False)
+            # 模拟提交前并发查询读到已提交的旧数据并回填缓存
+            cache.put(TunnelSnapshot(
+                id=tunnel.id, domain="racy", token="tok-racy", enabled=True, mode="http"
+            ))
+        assert cache.get(("token", "tok-racy")) is None
+
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session, cache=cache)
+            assert (await repo.get_cached_by_domain("racy")).enabled is False
+            await repo.update_enabled("racy", True)
+            await session.rollback()
+        assert cache.get(("domain", "racy")).enabled is False
+
+    def test_expiry_and_maxsize(self):
+        """测试缓存过期与容量淘汰"""
+        cache = TunnelCache(ttl=0, maxsize=2)
+        snapshot = TunnelSnapshot(id=1, domain="a", token="t", enabled=True, mode="http")
+        cache.put(snapshot)
+        assert cache.get(("domain", "a")) is None
+
+        cache.ttl = 60
+        cache.put(snapshot)
+        cache.put(TunnelSnapshot(id=2, domain="b", token="u", enabled=True, mode="http"))
+        assert cache.get(("domain", "a")) is None
+        assert cache.get(("token", "u")).id == 2
+
+
+class TestIncrementBuffer:
+    """测试请求计数合并写入"""
+
+    @pytest.mark.asyncio
+    async def test_counts_are_merged(self, db_manager: DatabaseManager):
+        """测试多次累加合并为一次写入，关闭时写入剩余计数"""
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            await repo.create(domain="count-a", token="tok-a")
+            await repo.create(domain="count-b", token="tok-b")
+
+        buffer = IncrementBuffer(db_manager, flush_interval=10)
+        buffer.start()
+        for _ in range(3):
+            buffer.add("tok-a")
+        buffer.add("tok-b", 2)
+        await buffer.aclose()
+
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            assert (await repo.get_by_domain("count-a")).total_requests == 3
+            assert (await repo.get_by_domain("count-b")).total_requests == 2
+
+    @pytest.mark.asyncio
+    async def test_increment_many_across_batches(self, db_manager: DatabaseManager, monkeypatch):
+        """测试按批合并为 CASE 更新，未知令牌被忽略"""
+        monkeypatch.setattr("tunely.repository._INCREMENT_BATCH_SIZE", 2)
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            for name in ("a", "b", "c"):
+                await repo.create(domain=f"many-{name}", token=f"many-{name}")
+
+        async with db_manager.session() as session:
+            await TunnelRepository(session).increment_requests_many(
+                {"many-a": 1, "many-b": 5, "missing": 3, "many-c": 2}
+            )
+
+        async with db_manager.session() as session:
+            repo = TunnelRepository(session)
+            totals = [(await repo.get_by_domain(f"many-{n}")).total_requests for n in "abc"]
+            assert totals == [1, 5, 2]
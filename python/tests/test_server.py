@@ -3,12 +3,29 @@
 """
 
 import asyncio
-import pytest
-from unittest.mock import AsyncMock, MagicMock
+import json
 
-from tunely.server import TunnelManager, TunnelServer
+import pytest
+from fastapi import HTTPException, WebSocketDisconnect
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from tunely.server import (
+    CreateTunnelRequest,
+    TunnelManager,
+    TunnelServer,
+    _dump_body,
+    _next_request_id,
+    _valid_domain,
+)
 from tunely.config import TunnelServerConfig
-from tunely.protocol import TunnelResponse
+from tunely.protocol import (
+    StreamChunkMessage,
+    StreamEndMessage,
+    StreamStartMessage,
+    TunnelRequest,
+    TunnelResponse,
+    parse_message,
+)
 
 
 class TestTunnelManager:
@@ -84,6 +101,59 @@ class TestTunnelManager:
 
         assert manager.is_connected("test-domain") is True
 
+    @pytest.mark.asyncio
+    async def test_force_replace_closes_old_in_background(self):
+        """测试强制抢占时先替换映射，再在后台关闭旧连接"""
+        manager = TunnelManager()
+        old_ws = MagicMock()
+        old_ws.client_state.name = "CONNECTED"
+        old_ws.close = AsyncMock()
+        new_ws = MagicMock()
+
+        await manager.register(old_ws, 1, "test-domain", "test-token")
+        success, _ = await manager.register(new_ws, 1, "test-domain", "test-token")
+        assert success is False
+
+        success, _ = await manager.register(new_ws, 1, "test-domain", "test-token", force=True)
+        assert success is True
+        assert manager.get_connection_by_domain("test-domain").websocket is new_ws
+        assert len(manager._background_tasks) == 1
+
+        await manager.aclose()
+        old_ws.close.assert_awaited_once()
+        assert not manager._background_tasks
+
+    @pytest.mark.asyncio
+    async def test_stale_connection_is_replaced(self):
+        """测试超过 120 秒无心跳的旧连接被自动替换"""
+        manager = TunnelManager()
+        old_ws = MagicMock()
+        old_ws.client_state.name = "CONNECTED"
+        old_ws.close = AsyncMock()
+
+        await manager.register(old_ws, 1, "test-domain", "test-token")
+        manager.get_connection_by_token("test-token").last_heartbeat -= 121
+
+        success, _ = await manager.register(MagicMock(), 1, "test-domain", "test-token")
+        assert success is True
+
+    @pytest.mark.asyncio
+    async def test_unregister_replaced_connection(self):
+        """测试被替换的旧连接退出时不会注销新连接"""
+        manager = TunnelManager()
+        old_ws = MagicMock()
+        old_ws.close = AsyncMock()
+        new_ws = MagicMock()
+
+        await manager.register(old_ws, 1, "test-domain", "test-token")
+        await manager.register(new_ws, 1, "test-domain", "test-token", force=True)
+        await manager.unregister("test-token", old_ws)
+
+        assert manager.get_connection_by_domain("test-domain").websocket is new_ws
+
+        await manager.unregister("test-token", new_ws)
+        assert manager.is_connected("test-domain") is False
+
     @pytest.mark.asyncio
     async def test_list_connected_domains(self):
         """测试列出已连接域名"""
@@ -134,6 +204,100 @@ class TestTunnelManager:
             await future
 
 
+    @pytest.mark.asyncio
+    async def test_streamed_response_completes_request(self):
+        """测试以流式消息返回的大响应被组装为普通响应"""
+        manager = TunnelManager()
+
+        future = await manager.create_pending_request("req-003")
+
+        await manager.handle_stream_start(
+            StreamStartMessage(id="req-003", status=200, headers={"content-type": "text/plain"})
+        )
+        await manager.handle_stream_chunk(StreamChunkMessage(id="req-003", data="hello "))
+        await manager.handle_stream_chunk(StreamChunkMessage(id="req-003", data="world"))
+        assert not future.done()
+
+        await manager.handle_stream_end(StreamEndMessage(id="req-003", total_chunks=2))
+
+        result = await future
+        assert result.status == 200
+        assert result.headers == {"content-type": "text/plain"}
+        assert result.body == "hello world"
+
+    @pytest.mark.asyncio
+    async def test_plain_response_to_stream_request(self):
+        """测试流式请求收到普通响应时转换为流式消息"""
+        manager = TunnelManager()
+
+        pending = await manager.create_stream_request("req-004")
+        await manager.complete_request(
+            "req-004", TunnelResponse(id="req-004", status=200, body="done")
+        )
+
+        start, chunk, end, sentinel = pending.buffer
+        assert isinstance(start, StreamStartMessage)
+        assert start.status == 200
+        assert isinstance(chunk, StreamChunkMessage)
+        assert chunk.data == "done"
+        assert isinstance(end, StreamEndMessage)
+        assert sentinel is None
+
+
+    @pytest.mark.asyncio
+    async def test_stream_queue_drops_oldest(self):
+        """测试流式缓冲满时丢弃最旧的消息，不阻塞读取"""
+        manager = TunnelManager(stream_queue_size=3)
+
+        pending = await manager.create_stream_request("req-005")
+        await manager.handle_stream_start(StreamStartMessage(id="req-005", status=200))
+        for i in range(4):
+            await manager.handle_stream_chunk(StreamChunkMessage(id="req-005", data=str(i)))
+
+        # 开始消息会由 forward_stream 补发，只有数据块 "0" 计为丢失
+        assert pending.dropped == 1
+        assert [chunk.data for chunk in pending.buffer] == ["1", "2", "3"]
+
+
+class TestValidDomain:
+    """测试域名格式校验"""
+
+    @pytest.mark.parametrize("name", ["a", "my-agent", "Agent01", "x" * 63])
+    def test_valid(self, name):
+        """合法域名"""
+        assert _valid_domain(name)
+
+    @pytest.mark.parametrize(
+        "name", ["", "-agent", "x" * 64, "my_agent", "my.agent", "agent\n", "代理"]
+    )
+    def test_invalid(self, name):
+        """非法域名（含正则 $ 可匹配的结尾换行）"""
+        assert not _valid_domain(name)
+
+
+class TestRequestId:
+    """测试请求 ID 生成"""
+
+    def test_unique_with_shared_prefix(self):
+        """同一进程内的请求 ID 唯一且前缀相同"""
+        ids = [_next_request_id() for _ in range(1000)]
+        assert len(set(ids)) == 1000
+        assert len({request_id[:8] for request_id in ids}) == 1
+
+
+class TestDumpBody:
+    """测试转发请求体序列化"""
+
+    def test_matches_stdlib(self):
+        """与标准库结果语义一致（含非字符串键）"""
+        body = {"text": "你好", 1: [1.5, None, True]}
+        assert json.loads(_dump_body(body)) == json.loads(json.dumps(body))
+
+    def test_falls_back_for_big_int(self):
+        """orjson 不支持的值回退到标准库"""
+        assert json.loads(_dump_body({"n": 2**70})) == {"n": 2**70}
+
+
 class TestTunnelServer:
     """测试隧道服务器"""
 
@@ -179,3 +343,376 @@ class TestTunnelServer:
         assert "not connected" in response.error.lower()
 
         await server.close()
+
+    @pytest.mark.asyncio
+    async def test_forward_sends_request_frame(self):
+        """测试转发请求以 JSON 文本帧发送，且可被解析为 TunnelRequest"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        sent: list[str] = []
+
+        async def send_text(frame: str):
+            sent.append(frame)
+            request = parse_message(json.loads(frame))
+            await server.manager.complete_request(
+                request.id, TunnelResponse(id=request.id, status=200, body='{"ok": true}')
+            )
+
+        websocket = MagicMock()
+        websocket.send_text = send_text
+        await server.manager.register(
+            websocket=websocket, tunnel_id=1, domain="frame-test", token="frame-token"
+        )
+
+        response = await server.forward(
+            domain="frame-test", method="POST", path="/api", body={"q": 1}
+        )
+
+        assert response.status == 200
+        assert response.body == {"ok": True}
+        request = parse_message(json.loads(sent[0]))
+        assert isinstance(request, TunnelRequest)
+        assert request.body == '{"q":1}'
+        assert request.allow_stream is True
+        assert request.timestamp
+
+        raw = await server.forward(domain="frame-test", path="/api", parse_body=False)
+        assert raw.body == '{"ok": true}'
+
+        await server.forward(domain="frame-test", body='{"q": 1}', body_is_json=True)
+        assert parse_message(json.loads(sent[-1])).body == '{"q": 1}'
+
+    @pytest.mark.asyncio
+    async def test_forward_overloaded(self):
+        """测试待响应请求达到上限时直接返回 503"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+            max_pending_requests=1,
+        ))
+        websocket = MagicMock()
+        websocket.send_text = AsyncMock()
+        await server.manager.register(websocket, 1, "busy", "busy-token")
+        await server.manager.create_pending_request("in-flight")
+
+        response = await server.forward(domain="busy", path="/api")
+
+        assert response.status == 503
+        assert response.error == "overloaded"
+        websocket.send_text.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_stream_resends_dropped_start(self):
+        """测试开始消息被丢弃时 forward_stream 先补发"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+            stream_queue_size=2,
+        ))
+
+        async def send_text(frame: str):
+            request_id = json.loads(frame)["id"]
+            manager = server.manager
+            await manager.handle_stream_start(StreamStartMessage(id=request_id, status=200))
+            await manager.handle_stream_chunk(StreamChunkMessage(id=request_id, data="a"))
+            await manager.handle_stream_chunk(StreamChunkMessage(id=request_id, data="b"))
+
+        websocket = MagicMock()
+        websocket.send_text = send_text
+        await server.manager.register(websocket, 1, "slow", "slow-token")
+
+        stream = server.forward_stream(domain="slow", path="/sse")
+        first = await stream.__anext__()
+        second = await stream.__anext__()
+        await stream.aclose()
+
+        assert isinstance(first, StreamStartMessage)
+        assert second.data == "a"
+
+    @pytest.mark.asyncio
+    async def test_stream_reports_dropped_chunks(self):
+        """测试数据块因缓冲溢出被丢弃时，结束消息带上丢弃数量"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+            stream_queue_size=3,
+        ))
+
+        async def send_text(frame: str):
+            request_id = json.loads(frame)["id"]
+            manager = server.manager
+            await manager.handle_stream_start(StreamStartMessage(id=request_id, status=200))
+            for data in "abc":
+                await manager.handle_stream_chunk(StreamChunkMessage(id=request_id, data=data))
+            await manager.handle_stream_end(StreamEndMessage(id=request_id, total_chunks=3))
+
+        websocket = MagicMock()
+        websocket.send_text = send_text
+        await server.manager.register(websocket, 1, "lossy", "lossy-token")
+
+        stream = [msg async for msg in server.forward_stream(domain="lossy", path="/sse")]
+
+        assert isinstance(stream[0], StreamStartMessage)
+        assert [msg.data for msg in stream[1:-1]] == ["c"]
+        assert stream[-1].total_chunks == 3
+        assert stream[-1].error == "Dropped 2 stream chunks: consumer too slow"
+
+    @pytest.mark.asyncio
+    async def test_stream_yields_in_order_and_ends(self):
+        """测试完整流按顺序产出，收到结束消息后迭代结束"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+
+        async def send_text(frame: str):
+            request_id = json.loads(frame)["id"]
+            manager = server.manager
+            await manager.handle_stream_start(StreamStartMessage(id=request_id, status=200))
+            await manager.handle_stream_chunk(StreamChunkMessage(id=request_id, data="a"))
+            await manager.handle_stream_end(StreamEndMessage(id=request_id, total_chunks=1))
+
+        websocket = MagicMock()
+        websocket.send_text = send_text
+        await server.manager.register(websocket, 1, "sse", "sse-token")
+
+        stream = [msg async for msg in server.forward_stream(domain="sse", path="/sse")]
+        assert [type(msg) for msg in stream] == [
+            StreamStartMessage, StreamChunkMessage, StreamEndMessage
+        ]
+        assert server.manager.pending_count == 0
+
+    @pytest.mark.asyncio
+    async def test_heartbeat_monitor_disconnects_silent_client(self):
+        """测试连续未收到 pong 时注销并关闭连接"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+            heartbeat_interval=1,
+            heartbeat_timeout=2,
+        ))
+        websocket = MagicMock()
+        websocket.send_text = AsyncMock()
+        websocket.close = AsyncMock()
+        await server.manager.register(websocket, 1, "silent", "silent-token")
+
+        with patch("tunely.server.asyncio.sleep", AsyncMock()):
+            await server._monitor_heartbeat(websocket, "silent-token")
+
+        assert websocket.send_text.await_count == 2
+        websocket.close.assert_awaited_once()
+        assert server.manager.is_connected("silent") is False
+
+    @pytest.mark.asyncio
+    async def test_list_tunnels_marks_connected(self):
+        """测试隧道列表按已连接集合标记连接状态"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        await server.initialize()
+        await server._create_tunnel(CreateTunnelRequest(domain="online"), None)
+        await server._create_tunnel(CreateTunnelRequest(domain="offline"), None)
+        await server.manager.register(MagicMock(), 1, "online", "online-token")
+
+        tunnels = await server._list_tunnels(None)
+
+        assert {t.domain: t.connected for t in tunnels} == {"online": True, "offline": False}
+        assert tunnels[0].created_at is not None
+        await server.close()
+
+    @pytest.mark.asyncio
+    async def test_forward_timeout(self):
+        """测试客户端无响应时返回 504 并清理待响应请求"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        websocket = MagicMock()
+        websocket.send_text = AsyncMock()
+        await server.manager.register(websocket, 1, "mute", "mute-token")
+
+        response = await server.forward(domain="mute", path="/api", timeout=0.01)
+        assert response.status == 504
+        assert server.manager.pending_count == 0
+
+        stream = [msg async for msg in server.forward_stream(domain="mute", timeout=0.01)]
+        assert stream[-1].error == "Stream timeout"
+        assert server.manager.pending_count == 0
+
+    @pytest.mark.asyncio
+    async def test_forward_stream_disconnect(self, caplog):
+        """测试发送时隧道断开返回错误结束消息且不记录堆栈"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        websocket = MagicMock()
+        websocket.send_text = AsyncMock(side_effect=WebSocketDisconnect(1006))
+        await server.manager.register(websocket, 1, "gone", "gone-token")
+
+        stream = [msg async for msg in server.forward_stream(domain="gone")]
+        assert stream[-1].error == "Tunnel disconnected: 1006"
+        assert server.manager.pending_count == 0
+        assert not any(record.exc_info for record in caplog.records)
+
+    @pytest.mark.asyncio
+    async def test_forward_error_logged_once(self):
+        """测试发送失败时返回 500 并只记录一条错误日志"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        server._log_writer = MagicMock()
+        websocket = MagicMock()
+        websocket.send_text = AsyncMock(side_effect=RuntimeError("closed"))
+        await server.manager.register(websocket, 1, "broken", "broken-token")
+
+        response = await server.forward(domain="broken", path="/api", body={"q": 1})
+        assert response.status == 500
+        assert response.error == "closed"
+        server._log_writer.enqueue.assert_called_once()
+        entry = server._log_writer.enqueue.call_args.args[0]
+        assert entry["status_code"] == 500
+        assert entry["error"] == "closed"
+        assert entry["request_body"] == '{"q":1}'
+        assert entry["response_body"] is None
+
+    @pytest.mark.asyncio
+    async def test_message_handlers_dispatch(self):
+        """测试按 type 查表分发客户端消息"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        await server.manager.register(MagicMock(), 1, "dispatch", "dispatch-token")
+        conn = server.manager.get_connection_by_token("dispatch-token")
+        conn.last_heartbeat = 0.0
+        future = await server.manager.create_pending_request("req-dispatch")
+
+        handlers = server._message_handlers
+        await handlers["pong"]("dispatch-token", parse_message({"type": "pong"}))
+        response = TunnelResponse(id="req-dispatch", status=204)
+        await handlers["response"]("dispatch-token", response)
+
+        assert conn.last_heartbeat > 0
+        assert (await future) is response
+        assert "ping" not in handlers
+
+    @pytest.mark.asyncio
+    async def test_forward_cache_hit_skips_session(self):
+        """测试隧道模式命中缓存时不打开数据库会话"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        await server.initialize()
+        await server._create_tunnel(CreateTunnelRequest(domain="cached"), None)
+
+        async def send_text(frame: str):
+            request_id = json.loads(frame)["id"]
+            await server.manager.complete_request(
+                request_id, TunnelResponse(id=request_id, status=200)
+            )
+
+        websocket = MagicMock()
+        websocket.send_text = send_text
+        await server.manager.register(websocket, 1, "cached", "cached-token")
+
+        assert (await server.forward(domain="cached")).status == 200
+        read_session = server.db.read_session
+        server.db.read_session = MagicMock(side_effect=AssertionError("session opened"))
+        assert (await server.forward(domain="cached")).status == 200
+
+        server.db.read_session = read_session
+        await server.close()
+
+    @pytest.mark.asyncio
+    async def test_authenticate_cache_hit_touches_in_background(self):
+        """测试认证命中缓存时仍查主库，最后连接时间在后台写入"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        await server.initialize()
+        token = (await server._create_tunnel(CreateTunnelRequest(domain="reauth"), None)).token
+
+        first = await server._authenticate(token)
+        assert first.domain == "reauth"
+        assert not server._background_tasks
+
+        second = await server._authenticate(token)
+        assert second == first
+        assert len(server._background_tasks) == 1
+        await asyncio.gather(*server._background_tasks)
+        assert not server._background_tasks
+        await server.close()
+
+    @pytest.mark.asyncio
+    async def test_authenticate_rejects_regenerated_token(self):
+        """测试重新生成令牌后旧令牌被拒绝，即使缓存中仍有旧快照（如其他进程的缓存）"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        await server.initialize()
+        old_token = (await server._create_tunnel(CreateTunnelRequest(domain="rotate"), None)).token
+        stale = await server._authenticate(old_token)
+
+        new_token = (await server._regenerate_token("rotate", None)).token
+        assert await server._authenticate(old_token) is None
+        assert (await server._authenticate(new_token)).domain == "rotate"
+
+        # 模拟缓存滞后：旧快照仍在缓存中，认证仍以数据库为准并清除旧快照
+        server._tunnel_cache.put(stale)
+        assert await server._authenticate(old_token) is None
+        assert server._tunnel_cache.get(("token", old_token)) is None
+
+        await asyncio.gather(*server._background_tasks)
+        await server.close()
+
+    @pytest.mark.asyncio
+    async def test_malformed_frames_keep_tunnel_connected(self):
+        """测试格式错误的帧只被丢弃，隧道保持连接并继续处理后续消息"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        await server.initialize()
+        token = (await server._create_tunnel(CreateTunnelRequest(domain="sturdy"), None)).token
+
+        frames = [
+            {"type": "websocket.receive", "text": "[1]"},
+            {"type": "websocket.receive", "text": '"x"'},
+            {"type": "websocket.receive", "text": "{}"},
+            {"type": "websocket.receive", "text": '{"type": "stream_chunk", "data": "x"}'},
+            {"type": "websocket.receive", "text": '{"type": "stream_start", "status": 200}'},
+            {"type": "websocket.receive", "text": '{"type": "stream_end", "id": ["x"]}'},
+            {"type": "websocket.receive", "bytes": b"\x01short"},
+            {"type": "websocket.receive", "text": '{"type": "pong"}'},
+        ]
+        connected_at_end: list[bool] = []
+
+        async def receive():
+            if frames:
+                return frames.pop(0)
+            connected_at_end.append(server.manager.is_connected("sturdy"))
+            return {"type": "websocket.disconnect", "code": 1000}
+
+        websocket = MagicMock()
+        websocket.accept = AsyncMock()
+        websocket.send_text = AsyncMock()
+        websocket.close = AsyncMock()
+        websocket.receive_text = AsyncMock(return_value=json.dumps({"type": "auth", "token": token}))
+        websocket.receive = receive
+
+        await server._handle_websocket(websocket)
+
+        assert connected_at_end == [True]
+        assert server.manager.get_connection_by_token(token) is None
+        await asyncio.gather(*server._background_tasks)
+        await server.close()
+
+    def test_admin_api_key(self):
+        """测试管理 API 密钥校验"""
+        server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+            admin_api_key="s3cret",
+        ))
+        server._check_admin_api_key("s3cret")
+        for wrong in ("s3cre", "s3cret!", None, "密钥"):
+            with pytest.raises(HTTPException) as exc_info:
+                server._check_admin_api_key(wrong)
+            assert exc_info.value.status_code == 401
+
+        open_server = TunnelServer(config=TunnelServerConfig(
+            database_url="sqlite+aiosqlite:///:memory:",
+        ))
+        open_server._check_admin_api_key(None)
@@ -18,6 +18,8 @@ from tunely.protocol import (
     TcpDataMessage,
     TcpCloseMessage,
     MessageType,
+    decode_tcp_data_frame,
+    encode_tcp_data_frame,
     parse_message,
 )
 
@@ -98,6 +100,81 @@ class TestTcpProtocolMessages:
         assert parsed.error is None
 
 
+class TestTcpBinaryFrame:
+    """测试 TCP 数据二进制帧"""
+
+    CONN_ID = "0b1f6c2e-8a3d-4c55-9e57-3f2a1b6d7c80"
+
+    def test_roundtrip(self):
+        """测试编码后可还原连接 ID、序号和数据"""
+        frame = encode_tcp_data_frame(self.CONN_ID, b"\x00\xffHello", sequence=7)
+
+        assert len(frame) == 21 + 7
+        assert decode_tcp_data_frame(frame) == (self.CONN_ID, 7, b"\x00\xffHello")
+
+    def test_payload_is_not_copied(self):
+        """测试数据部分是帧的视图而不是副本"""
+        frame = encode_tcp_data_frame(self.CONN_ID, b"payload")
+        _, _, data = decode_tcp_data_frame(frame)
+        assert isinstance(data, memoryview)
+        assert data.obj is frame
+
+    def test_unknown_type_rejected(self):
+        """测试未知类型标记的帧被拒绝"""
+        frame = b"\x02" + encode_tcp_data_frame(self.CONN_ID, b"data")[1:]
+        with pytest.raises(ValueError):
+            decode_tcp_data_frame(frame)
+
+    def test_truncated_frame_rejected(self):
+        """测试过短的帧被拒绝"""
+        with pytest.raises(ValueError):
+            decode_tcp_data_frame(b"\x01abc")
+
+    @pytest.mark.asyncio
+    async def test_client_sends_binary_when_negotiated(self):
+        """测试协商后客户端以二进制帧发送数据"""
+        from tunely.client import TcpConnection
+
+        mock_websocket = MagicMock()
+        mock_websocket.send = AsyncMock()
+        conn = TcpConnection(
+            conn_id=self.CONN_ID,
+            target_host="localhost",
+            target_port=8080,
+            websocket=mock_websocket,
+            binary=True,
+        )
+
+        await conn._send_data(b"payload")
+
+        frame = mock_websocket.send.await_args.args[0]
+        assert decode_tcp_data_frame(frame) == (self.CONN_ID, 0, b"payload")
+
+    @pytest.mark.asyncio
+    async def test_server_falls_back_to_base64(self):
+        """测试未协商时服务端仍发送 Base64 JSON 消息"""
+        import json
+        from tunely.server import ActiveConnection, TunnelServer
+
+        server = TunnelServer()
+        websocket = MagicMock()
+        websocket.send_text = AsyncMock()
+        websocket.send_bytes = AsyncMock()
+        legacy = ActiveConnection(websocket=websocket, tunnel_id=1, domain="t", token="tk")
+
+        await server._send_tcp_data(legacy, self.CONN_ID, b"payload", sequence=3)
+
+        websocket.send_bytes.assert_not_awaited()
+        message = json.loads(websocket.send_text.await_args.args[0])
+        assert base64.b64decode(message["data"]) == b"payload"
+        assert message["sequence"] == 3
+
+        legacy.binary_tcp = True
+        await server._send_tcp_data(legacy, self.CONN_ID, b"payload", sequence=4)
+        frame = websocket.send_bytes.await_args.args[0]
+        assert decode_tcp_data_frame(frame) == (self.CONN_ID, 4, b"payload")
+
+
 class TestTcpConnectionClass:
     """测试 TcpConnection 类（客户端）"""
 
@@ -318,7 +395,7 @@ class TestTunnelManagerPendingTcpRequest:
         assert ok2 is True
 
         pending = manager._pending_tcp_requests["conn-200"]
-        assert pending.chunks == [b"Hello", b" World"]
+        assert pending.buffer == b"Hello World"
 
     @pytest.mark.asyncio
     async def test_handle_tcp_response_data_unknown_conn(self):
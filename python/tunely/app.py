@@ -24,13 +24,16 @@ Tunely Server - 独立的隧道服务应用
 import asyncio
 import logging
 from contextlib import asynccontextmanager
+from functools import lru_cache
 from typing import AsyncIterator
 
+import orjson
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from .server import TunnelServer, StreamStartMessage, StreamChunkMessage, StreamEndMessage
 from .config import TunnelServerConfig
@@ -82,6 +85,7 @@ def get_tunnel_server() -> TunnelServer:
     return tunnel_server
 
 
+@lru_cache(maxsize=1024)
 def extract_subdomain(host: str, base_domain: str) -> str | None:
     """
     从 Host 头中提取子域名
@@ -111,6 +115,44 @@ def extract_subdomain(host: str, base_domain: str) -> str | None:
     return None
 
 
+class SubdomainProxyMiddleware:
+    """
+    子域名转发中间件（纯 ASGI）
+
+    在 FastAPI 路由之前识别子域名请求并直接转发到隧道，
+    跳过路由匹配、依赖注入和响应模型处理；非子域名请求交给后续应用处理。
+    """
+
+    def __init__(self, app: ASGIApp, domain: str):
+        self.app = app
+        self.domain = domain
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        host = ""
+        for key, value in scope["headers"]:
+            if key == b"host":
+                host = value.decode("latin-1")
+                break
+
+        subdomain = extract_subdomain(host, self.domain)
+        if not subdomain:
+            await self.app(scope, receive, send)
+            return
+
+        full_path = scope["path"] or "/"
+        query_string = scope.get("query_string", b"")
+        if query_string:
+            full_path += f"?{query_string.decode('latin-1')}"
+
+        request = Request(scope, receive)
+        response = await forward_to_tunnel(request, subdomain, full_path)
+        await response(scope, receive, send)
+
+
 def create_lifespan(tunnel_srv: TunnelServer):
     """创建带有 TunnelServer 引用的 lifespan 函数"""
     
@@ -183,6 +225,10 @@ def create_full_app(
         lifespan=create_lifespan(tunnel_srv),
     )
     
+    # ============== 子域名转发中间件 ==============
+    # 先于 CORS 注册，使 CORS 中间件位于外层，转发响应同样带上 CORS 头
+    new_app.add_middleware(SubdomainProxyMiddleware, domain=domain)
+    
     # ============== CORS 中间件 ==============
     # 解析 CORS 来源配置
     cors_origins = settings.cors_origins.strip()
@@ -206,14 +252,8 @@ def create_full_app(
     # ============== 基础路由 ==============
     
     @new_app.get("/")
-    async def root(request: Request):
-        """根路径"""
-        host = request.headers.get("host", "")
-        subdomain = extract_subdomain(host, settings.domain)
-        
-        if subdomain:
-            return await forward_to_tunnel(request, subdomain, "/")
-        
+    async def root():
+        """根路径（子域名请求已由 SubdomainProxyMiddleware 转发）"""
         return {
             "service": "Tunely Server",
             "version": "0.3.0",
@@ -253,30 +293,6 @@ def create_full_app(
         """路径前缀模式 - 根路径转发"""
         return await forward_to_tunnel(request, tunnel_domain, "/")
     
-    # ============== 子域名模式路由（通用 catch-all） ==============
-    
-    @new_app.api_route(
-        "/{path:path}",
-        methods=["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"],
-    )
-    async def catch_all(request: Request, path: str):
-        """通用路由 - 子域名转发"""
-        host = request.headers.get("host", "")
-        subdomain = extract_subdomain(host, settings.domain)
-        
-        if subdomain:
-            full_path = f"/{path}"
-            if request.query_params:
-                full_path += f"?{request.query_params}"
-            return await forward_to_tunnel(request, subdomain, full_path)
-        
-        # 主域名访问且不是 API 路由 - 返回 404
-        return Response(
-            content='{"detail": "Not Found"}',
-            status_code=404,
-            media_type="application/json",
-        )
-    
     return new_app
 
 
@@ -323,13 +339,17 @@ async def forward_to_tunnel(
     
     # 读取请求体
     body = None
+    body_is_json = False
     if method in ("POST", "PUT", "PATCH"):
         body_bytes = await request.body()
-        if body_bytes:
+        if body_bytes[:1] in (b"{", b"["):
+            # JSON 对象/数组原样透传，省去解析再序列化（客户端按原文发送）
+            body = body_bytes.decode("utf-8", errors="replace")
+            body_is_json = True
+        elif body_bytes:
             try:
-                import json
-                body = json.loads(body_bytes)
-            except json.JSONDecodeError:
+                body = orjson.loads(body_bytes)
+            except orjson.JSONDecodeError:
                 # 非 JSON 请求体，转为字符串
                 body = body_bytes.decode("utf-8", errors="replace")
     
@@ -340,7 +360,7 @@ async def forward_to_tunnel(
     if is_sse:
         # SSE 流式响应
         return StreamingResponse(
-            stream_tunnel_response(server, domain, method, path, headers, body),
+            stream_tunnel_response(server, domain, method, path, headers, body, body_is_json),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -358,11 +378,16 @@ async def forward_to_tunnel(
                 headers=headers,
                 body=body,
                 timeout=settings.request_timeout,
+                parse_body=False,
+                body_is_json=body_is_json,
             )
-            
+
+            # HTTP 模式下响应体为原始文本直接透传；TCP 模式可能是解析后的结构
+            content = response.body
+            if not isinstance(content, (str, bytes)):
+                content = orjson.dumps(content)
             return Response(
-                content=response.body if isinstance(response.body, (str, bytes)) else 
-                    __import__("json").dumps(response.body),
+                content=content,
                 status_code=response.status,
                 headers=response.headers,
                 media_type=response.headers.get("content-type", "application/json"),
@@ -383,6 +408,7 @@ async def stream_tunnel_response(
     path: str,
     headers: dict,
     body: any,
+    body_is_json: bool = False,
 ) -> AsyncIterator[str]:
     """
     流式响应生成器（SSE 格式）
@@ -398,6 +424,7 @@ async def stream_tunnel_response(
             headers=headers,
             body=body,
             timeout=settings.request_timeout,
+            body_is_json=body_is_json,
         ):
             if isinstance(msg, StreamStartMessage):
                 # 流开始，可以发送初始事件
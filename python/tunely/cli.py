@@ -120,8 +120,17 @@ def serve(
 )
 @click.option("--reconnect", "-r", default=5.0, help="重连间隔（秒）")
 @click.option("--force", "-f", is_flag=True, help="强制抢占已有连接")
+@click.option("--no-compression", is_flag=True, help="关闭 WebSocket 压缩")
 @click.option("--verbose", "-v", is_flag=True, help="详细日志")
-def connect(server: str, token: str, target: str, reconnect: float, force: bool, verbose: bool):
+def connect(
+    server: str,
+    token: str,
+    target: str,
+    reconnect: float,
+    force: bool,
+    no_compression: bool,
+    verbose: bool,
+):
     """连接到隧道服务器"""
     setup_logging(verbose)
 
@@ -138,6 +147,7 @@ def connect(server: str, token: str, target: str, reconnect: float, force: bool,
         target_url=target,
         reconnect_interval=reconnect,
         force=force,
+        ws_compression=not no_compression,
     )
     client = TunnelClient(config=config)
 
@@ -21,38 +21,170 @@ WS-Tunnel 客户端 SDK
 
 import asyncio
 import base64
-import json
+import codecs
 import logging
 import time
 from datetime import datetime
-from typing import Callable, Dict, Optional
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import AsyncIterator, Callable, Dict, Optional
 from urllib.parse import urlparse
 
 import httpx
+import orjson
 import websockets
 from websockets.exceptions import ConnectionClosed
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
 
 from .config import TunnelClientConfig
 from .protocol import (
     AuthErrorMessage,
     AuthMessage,
     AuthOkMessage,
+    FEATURE_BINARY_TCP,
     MessageType,
+    PONG_FRAME,
     PingMessage,
-    PongMessage,
     TunnelRequest,
     TunnelResponse,
     StreamStartMessage,
-    StreamChunkMessage,
     StreamEndMessage,
     TcpConnectMessage,
     TcpDataMessage,
     TcpCloseMessage,
-    parse_message,
+    decode_tcp_data_frame,
+    dump_message_bytes,
+    encode_tcp_data_frame,
+    parse_auth_response,
+    parse_trusted_message,
 )
 
 logger = logging.getLogger(__name__)
 
+# 逐跳（hop-by-hop）头只对单个连接有效，不应转发（RFC 7230 6.1）
+_HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+})
+
+
+def forward_headers(headers: httpx.Headers) -> dict[str, str]:
+    """
+    提取需要转发给服务端的响应头
+
+    键统一为小写；去掉逐跳头及 Connection 头中列出的头；
+    同名头按 HTTP 规则用 ", " 合并。
+
+    Args:
+        headers: 目标服务的响应头
+
+    Returns:
+        转发用的响应头字典
+    """
+    skip = _HOP_BY_HOP_HEADERS
+    connection = headers.get("connection")
+    if connection:
+        skip = skip | {token.strip().lower() for token in connection.split(",")}
+
+    result: dict[str, str] = {}
+    for key, value in headers.multi_items():
+        if key in skip:
+            continue
+        if key in result:
+            result[key] = f"{result[key]}, {value}"
+        else:
+            result[key] = value
+    return result
+
+
+async def coalesce_chunks(
+    chunks: AsyncIterator[str],
+    flush_interval: float,
+    max_size: int,
+) -> AsyncIterator[str]:
+    """
+    合并短时间内连续到达的小数据块
+
+    缓冲区非空时，若 flush_interval 内没有新数据块到达，或缓冲内容达到 max_size，
+    则输出合并后的数据块。缓冲区为空时直接等待下一个数据块，不引入额外延迟。
+
+    Args:
+        chunks: 原始数据块迭代器
+        flush_interval: 最长合并等待时间（秒）
+        max_size: 合并后数据块的最大长度（字符）
+
+    Yields:
+        合并后的数据块
+    """
+    iterator = aiter(chunks)
+    pending: asyncio.Future | None = None
+    buffer: list[str] = []
+    buffered = 0
+
+    try:
+        while True:
+            if buffer:
+                # 有缓冲数据时，只等待 flush_interval；超时则先输出缓冲
+                if pending is None:
+                    pending = asyncio.ensure_future(anext(iterator))
+                done, _ = await asyncio.wait((pending,), timeout=flush_interval)
+                if not done:
+                    yield "".join(buffer)
+                    buffer.clear()
+                    buffered = 0
+                    continue
+
+            try:
+                chunk = await (pending if pending is not None else anext(iterator))
+            except StopAsyncIteration:
+                break
+            finally:
+                pending = None
+
+            if not chunk:
+                continue
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= max_size:
+                yield "".join(buffer)
+                buffer.clear()
+                buffered = 0
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+async def iter_utf8(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    将字节流增量解码为 UTF-8 文本
+
+    SSE 规定使用 UTF-8 编码，无需 httpx 按响应头探测字符集；
+    跨数据块的多字节字符由增量解码器拼接完整。
+
+    Args:
+        chunks: 原始字节块
+
+    Yields:
+        解码后的文本块（跳过空块）
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
 
 class TcpConnection:
     """
@@ -65,7 +197,14 @@ class TcpConnection:
     - 连接关闭处理
     """
 
-    def __init__(self, conn_id: str, target_host: str, target_port: int, websocket):
+    def __init__(
+        self,
+        conn_id: str,
+        target_host: str,
+        target_port: int,
+        websocket,
+        binary: bool = False,
+    ):
         """
         初始化 TCP 连接
         
@@ -74,11 +213,13 @@ class TcpConnection:
             target_host: 目标主机
             target_port: 目标端口
             websocket: WebSocket 连接（用于发送数据回服务端）
+            binary: 是否使用二进制帧发送数据（需服务端已协商 binary_tcp）
         """
         self.conn_id = conn_id
         self.target_host = target_host
         self.target_port = target_port
         self._websocket = websocket
+        self._binary = binary
         self._reader: Optional[asyncio.StreamReader] = None
         self._writer: Optional[asyncio.StreamWriter] = None
         self._read_task: Optional[asyncio.Task] = None
@@ -127,12 +268,18 @@ class TcpConnection:
     async def _send_data(self, data: bytes) -> None:
         """发送数据到服务端"""
         try:
-            message = TcpDataMessage(
+            if self._binary:
+                await self._websocket.send(
+                    encode_tcp_data_frame(self.conn_id, data, self._sequence)
+                )
+                return
+
+            message = TcpDataMessage.model_construct(
                 conn_id=self.conn_id,
                 data=base64.b64encode(data).decode('ascii'),
                 sequence=self._sequence,
             )
-            await self._websocket.send(message.model_dump_json())
+            await self._websocket.send(dump_message_bytes(message), text=True)
         except Exception as e:
             logger.error(f"发送 TCP 数据失败: {self.conn_id}, {e}")
 
@@ -142,11 +289,11 @@ class TcpConnection:
             return
         
         try:
-            message = TcpCloseMessage(
+            message = TcpCloseMessage.model_construct(
                 conn_id=self.conn_id,
                 error=error,
             )
-            await self._websocket.send(message.model_dump_json())
+            await self._websocket.send(dump_message_bytes(message), text=True)
         except Exception as e:
             logger.error(f"发送 TCP 关闭消息失败: {self.conn_id}, {e}")
 
@@ -172,11 +319,11 @@ class TcpConnection:
         # 先发送关闭消息（在设置 _closed 之前）
         if not self._closed:
             try:
-                message = TcpCloseMessage(
+                message = TcpCloseMessage.model_construct(
                     conn_id=self.conn_id,
                     error=error,
                 )
-                await self._websocket.send(message.model_dump_json())
+                await self._websocket.send(dump_message_bytes(message), text=True)
             except Exception as e:
                 logger.error(f"发送 TCP 关闭消息失败: {self.conn_id}, {e}")
         
@@ -213,6 +360,7 @@ class TunnelClient:
         token: str | None = None,
         target_url: str | None = None,
         config: TunnelClientConfig | None = None,
+        http_client: httpx.AsyncClient | None = None,
     ):
         """
         初始化客户端
@@ -220,8 +368,10 @@ class TunnelClient:
         Args:
             server_url: 服务端 WebSocket URL
             token: 隧道令牌
-            target_url: 本地目标服务 URL
+            target_url: 本地目标服务 URL（"unix:/path/to.sock" 表示 Unix 域套接字）
             config: 客户端配置（可选，优先级低于直接参数）
+            http_client: 自定义的目标服务 HTTP 客户端（可选，例如使用
+                httpx.ASGITransport 在进程内调用 ASGI 应用）；由调用方负责关闭
         """
         if config:
             self.config = config
@@ -238,12 +388,29 @@ class TunnelClient:
         self._domain: str | None = None
         self._reconnect_count = 0
 
+        # 服务端是否同意 TCP 数据使用二进制帧（认证时协商）
+        self._binary_tcp = False
+
+        # 到目标服务的共享 HTTP 客户端（懒加载，跨请求复用连接池）
+        self._http_client: httpx.AsyncClient | None = http_client
+        self._owns_http_client = http_client is None
+
+        # 并发执行中的请求任务（持有引用防止被回收）
+        self._inflight: set[asyncio.Task] = set()
+
+        # 请求配额：消息循环在派发请求前获取，配额耗尽时暂停读取 WebSocket，
+        # 由 TCP 流控把压力反馈给服务端；SSE 长连接开始流式发送后归还配额
+        self._request_semaphore = asyncio.BoundedSemaphore(self.config.max_concurrent_requests)
+        self._slot_holders: set[asyncio.Task] = set()
+
         # TCP 连接管理（TCP 模式使用）
         self._tcp_connections: Dict[str, TcpConnection] = {}
         
-        # 目标服务解析（TCP 模式使用）
+        # 目标服务解析（TCP 模式使用主机和端口）
         self._target_host: str = "localhost"
         self._target_port: int = 8080
+        self._target_base_url: str = self.config.target_url.rstrip("/")
+        self._target_uds: str | None = self.config.target_uds
         self._parse_target_url()
 
         # 回调函数
@@ -253,6 +420,12 @@ class TunnelClient:
 
     def _parse_target_url(self) -> None:
         """解析目标 URL，提取主机和端口（用于 TCP 模式）"""
+        if self.config.target_url.startswith("unix:"):
+            # Unix 域套接字：请求 URL 只用于 Host 头和路径
+            self._target_uds = self.config.target_url[len("unix:"):]
+            self._target_base_url = "http://localhost"
+            return
+
         try:
             parsed = urlparse(self.config.target_url)
             self._target_host = parsed.hostname or "localhost"
@@ -272,6 +445,32 @@ class TunnelClient:
         """分配的域名"""
         return self._domain
 
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """获取共享的 HTTP 客户端，复用到目标服务的 keep-alive 连接"""
+        if self._http_client is None or self._http_client.is_closed:
+            limits = httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_keepalive_connections,
+            )
+            transport = None
+            if self._target_uds:
+                transport = httpx.AsyncHTTPTransport(uds=self._target_uds, limits=limits)
+            # 共享客户端服务于不同的隧道使用者，不能保存目标服务下发的 Cookie，
+            # 否则一个用户的会话会被带到其他用户的请求中
+            self._http_client = httpx.AsyncClient(
+                limits=limits,
+                transport=transport,
+                cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+            )
+            self._owns_http_client = True
+        return self._http_client
+
+    async def _close_http_client(self) -> None:
+        """关闭共享的 HTTP 客户端（调用方传入的客户端不关闭）"""
+        if self._http_client is not None and self._owns_http_client:
+            await self._http_client.aclose()
+            self._http_client = None
+
     def on_connect(self, callback: Callable[[], None]) -> None:
         """设置连接成功回调"""
         self._on_connect = callback
@@ -316,11 +515,14 @@ class TunnelClient:
                 )
                 await asyncio.sleep(self.config.reconnect_interval)
 
+        await self._close_http_client()
+
     async def stop(self) -> None:
         """停止客户端"""
         self._running = False
         if self._websocket:
             await self._websocket.close()
+        await self._close_http_client()
 
     async def _connect_and_run(self) -> None:
         """连接并运行"""
@@ -330,6 +532,8 @@ class TunnelClient:
             self.config.server_url,
             ping_interval=30,
             ping_timeout=10,
+            compression=None,
+            extensions=self._ws_extensions(),
         ) as websocket:
             self._websocket = websocket
 
@@ -337,6 +541,7 @@ class TunnelClient:
             auth_message = AuthMessage(
                 token=self.config.token,
                 force=self.config.force,
+                features=[FEATURE_BINARY_TCP],
             )
             await websocket.send(auth_message.model_dump_json())
 
@@ -345,14 +550,14 @@ class TunnelClient:
                 websocket.recv(),
                 timeout=30.0,
             )
-            data = json.loads(raw_response)
-            response = parse_message(data)
+            response = parse_auth_response(raw_response)
 
             if isinstance(response, AuthErrorMessage):
                 raise Exception(f"认证失败: {response.error}")
 
             if isinstance(response, AuthOkMessage):
                 self._domain = response.domain
+                self._binary_tcp = FEATURE_BINARY_TCP in response.features
                 self._connected = True
                 self._reconnect_count = 0
 
@@ -362,30 +567,65 @@ class TunnelClient:
                     self._on_connect()
 
                 # 消息循环
-                await self._message_loop(websocket)
+                try:
+                    await self._message_loop(websocket)
+                finally:
+                    # 连接已断开，未完成的请求无法再回传响应
+                    await self._cancel_inflight()
+
+    def _ws_extensions(self) -> list[ClientPerMessageDeflateFactory]:
+        """
+        WebSocket 扩展：permessage-deflate 压缩
+
+        隧道消息多为 JSON 和 SSE 文本，重复度高，压缩收益明显；
+        使用最大滑动窗口，压缩内存级别与 websockets 默认值一致。
+        """
+        if not self.config.ws_compression:
+            return []
+        return [
+            ClientPerMessageDeflateFactory(
+                server_max_window_bits=15,
+                client_max_window_bits=15,
+                compress_settings={"memLevel": 5},
+            )
+        ]
 
     async def _message_loop(self, websocket) -> None:
         """消息处理循环"""
         async for raw_message in websocket:
             try:
-                data = json.loads(raw_message)
-                message = parse_message(data)
+                # 二进制帧只用于 TCP 数据
+                if isinstance(raw_message, bytes):
+                    conn_id, _, payload = decode_tcp_data_frame(raw_message)
+                    await self._write_tcp_data(conn_id, payload)
+                    continue
+
+                data = orjson.loads(raw_message)
+                message = parse_trusted_message(data)
 
                 if isinstance(message, PingMessage):
                     # 响应心跳
-                    await websocket.send(PongMessage().model_dump_json())
+                    await websocket.send(PONG_FRAME)
 
                 elif isinstance(message, TunnelRequest):
                     # 处理 HTTP 请求
                     if self._on_request:
                         self._on_request(message)
 
-                    # 执行请求
-                    # 对于普通响应，返回 TunnelResponse
-                    # 对于 SSE 响应，返回 None（流式消息已在 _execute_request 中发送）
-                    response = await self._execute_request(message)
-                    if response is not None:
-                        await websocket.send(response.model_dump_json())
+                    # 配额耗尽时立即返回 503，而不是暂停读取：停止读取会让
+                    # WebSocket 心跳超时，连接断开后所有执行中的请求都会被取消
+                    if self._request_semaphore.locked():
+                        await websocket.send(dump_message_bytes(self._error_response(
+                            message.id, 503, "Client overloaded", time.monotonic()
+                        )), text=True)
+                        continue
+
+                    # 在独立任务中执行请求，消息循环继续接收后续消息
+                    await self._request_semaphore.acquire()
+                    task = asyncio.create_task(self._handle_request(message, websocket))
+                    self._inflight.add(task)
+                    self._slot_holders.add(task)
+                    task.add_done_callback(self._on_request_done)
 
                 elif isinstance(message, TcpConnectMessage):
                     # 处理 TCP 连接建立
@@ -402,15 +642,55 @@ class TunnelClient:
                 else:
                     logger.warning(f"未知消息类型: {type(message)}")
 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 logger.error(f"JSON 解析错误: {e}")
             except Exception as e:
                 logger.error(f"处理消息错误: {e}", exc_info=True)
 
+    async def _handle_request(self, request: TunnelRequest, websocket) -> None:
+        """
+        执行请求并回传响应
+
+        对于普通响应，发送 TunnelResponse
+        对于 SSE 响应，流式消息已在 _execute_request 中发送
+        """
+        try:
+            response = await self._execute_request(request)
+            if response is not None:
+                await websocket.send(dump_message_bytes(response), text=True)
+        except Exception as e:
+            logger.error(f"处理请求错误: request_id={request.id}, {e}", exc_info=True)
+
+    def _on_request_done(self, task: asyncio.Task) -> None:
+        """请求任务结束：移除引用并归还配额"""
+        self._inflight.discard(task)
+        self._release_request_slot(task)
+
+    def _release_request_slot(self, task: asyncio.Task | None = None) -> None:
+        """归还任务持有的请求配额（每个任务只归还一次）"""
+        task = task or asyncio.current_task()
+        if task in self._slot_holders:
+            self._slot_holders.discard(task)
+            self._request_semaphore.release()
+
+    async def _cancel_inflight(self) -> None:
+        """取消所有执行中的请求任务"""
+        if not self._inflight:
+            return
+        tasks = list(self._inflight)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
     def _is_sse_response(self, headers: dict[str, str]) -> bool:
         """检查是否是 SSE 响应"""
-        content_type = headers.get("content-type", "").lower()
-        return "text/event-stream" in content_type
+        content_type = headers.get("content-type")
+        if content_type is None:
+            return False
+        if "text/event-stream" in content_type:
+            return True
+        # 媒体类型不区分大小写，但只有含大写字母时才需要转换后再比较
+        return not content_type.islower() and "text/event-stream" in content_type.lower()
 
     async def _execute_request(self, request: TunnelRequest) -> TunnelResponse | None:
         """
@@ -420,19 +700,25 @@ class TunnelClient:
         对于 SSE 响应，会发送 StreamStart/StreamChunk/StreamEnd 消息，不返回 TunnelResponse
         对于普通响应，返回 TunnelResponse
         """
-        start_time = time.time()
+        start_time = time.monotonic()
 
         try:
             # 构建完整 URL
-            url = f"{self.config.target_url.rstrip('/')}{request.path}"
-
-            # 解析请求体
-            body = None
-            if request.body:
-                try:
-                    body = json.loads(request.body)
-                except json.JSONDecodeError:
-                    body = request.body
+            url = f"{self._target_base_url}{request.path}"
+
+            # 请求体：服务端总是将请求体编码为 JSON 文本
+            # - JSON 字符串表示原始请求体是普通文本，解码后发送
+            # - 其余 JSON 值原样发送，省去解析再序列化的开销
+            headers = request.headers
+            content = request.body or None
+            if content:
+                if content[0] == '"':
+                    try:
+                        content = orjson.loads(content)
+                    except orjson.JSONDecodeError:
+                        pass
+                elif not any(key.lower() == "content-type" for key in headers):
+                    headers = {**headers, "content-type": "application/json"}
 
             # 使用 stream 模式发送请求，以便检测 SSE
             # 配置超时：connect 30秒，read 使用请求的超时时间，write 30秒
@@ -442,76 +728,107 @@ class TunnelClient:
                 write=30.0,
                 pool=30.0,
             )
-            async with httpx.AsyncClient(timeout=timeout_config) as client:
-                async with client.stream(
-                    method=request.method,
-                    url=url,
-                    headers=request.headers,
-                    json=body if isinstance(body, (dict, list)) else None,
-                    content=body if isinstance(body, str) else None,
-                ) as response:
-                    response_headers = dict(response.headers)
-                    
-                    # 检查是否是 SSE 响应
-                    if self._is_sse_response(response_headers):
-                        # SSE 流式响应处理
-                        await self._handle_sse_response(
-                            request_id=request.id,
-                            status=response.status_code,
-                            headers=response_headers,
-                            response=response,
-                            start_time=start_time,
-                        )
-                        return None  # SSE 响应已通过流式消息发送
-                    else:
-                        # 普通响应：读取完整内容
-                        response_body = await response.aread()
-                        duration_ms = int((time.time() - start_time) * 1000)
-
-                        return TunnelResponse(
-                            id=request.id,
-                            status=response.status_code,
-                            headers=response_headers,
-                            body=response_body.decode("utf-8", errors="replace"),
-                            duration_ms=duration_ms,
-                        )
+            client = self._get_http_client()
+            async with client.stream(
+                method=request.method,
+                url=url,
+                headers=headers,
+                content=content,
+                timeout=timeout_config,
+            ) as response:
+                response_headers = forward_headers(response.headers)
+                
+                # 检查是否是 SSE 响应
+                if self._is_sse_response(response_headers):
+                    # SSE 是长连接且逐块发送、内存占用有界，不再占用请求配额
+                    self._release_request_slot()
+
+                    # SSE 流式响应处理：短时间内到达的小数据块合并为一帧发送
+                    await self._send_stream_response(
+                        request_id=request.id,
+                        status=response.status_code,
+                        headers=response_headers,
+                        chunks=coalesce_chunks(
+                            iter_utf8(response.aiter_bytes()),
+                            flush_interval=self.config.stream_flush_interval,
+                            max_size=self.config.stream_batch_size,
+                        ),
+                        start_time=start_time,
+                    )
+                    return None  # SSE 响应已通过流式消息发送
+
+                if request.allow_stream and self._should_stream(response_headers):
+                    # 大响应或长度未知的响应：边读边发，避免整体缓冲在内存中
+                    await self._send_stream_response(
+                        request_id=request.id,
+                        status=response.status_code,
+                        headers=response_headers,
+                        chunks=iter_utf8(
+                            response.aiter_bytes(chunk_size=self.config.stream_batch_size)
+                        ),
+                        start_time=start_time,
+                    )
+                    return None
+
+                # 普通响应：读取完整内容
+                response_body = await response.aread()
+                duration_ms = int((time.monotonic() - start_time) * 1000)
+
+                # 字段类型已确定，跳过校验直接构造
+                return TunnelResponse.model_construct(
+                    id=request.id,
+                    status=response.status_code,
+                    headers=response_headers,
+                    body=response_body.decode("utf-8", errors="replace"),
+                    duration_ms=duration_ms,
+                )
 
         except httpx.TimeoutException:
-            duration_ms = int((time.time() - start_time) * 1000)
-            return TunnelResponse(
-                id=request.id,
-                status=504,
-                error="Target service timeout",
-                duration_ms=duration_ms,
-            )
+            return self._error_response(request.id, 504, "Target service timeout", start_time)
         except httpx.ConnectError as e:
-            duration_ms = int((time.time() - start_time) * 1000)
-            return TunnelResponse(
-                id=request.id,
-                status=503,
-                error=f"Target service unavailable: {e}",
-                duration_ms=duration_ms,
+            return self._error_response(
+                request.id, 503, f"Target service unavailable: {e}", start_time
             )
         except Exception as e:
-            duration_ms = int((time.time() - start_time) * 1000)
-            return TunnelResponse(
-                id=request.id,
-                status=500,
-                error=str(e),
-                duration_ms=duration_ms,
-            )
+            return self._error_response(request.id, 500, str(e), start_time)
+
+    @staticmethod
+    def _error_response(
+        request_id: str, status: int, error: str, start_time: float
+    ) -> TunnelResponse:
+        """
+        构造错误响应
+
+        目标服务故障时每个请求都走这里，字段类型已确定，跳过校验直接构造
+        """
+        return TunnelResponse.model_construct(
+            id=request_id,
+            status=status,
+            error=error,
+            duration_ms=int((time.monotonic() - start_time) * 1000),
+        )
 
-    async def _handle_sse_response(
+    def _should_stream(self, headers: dict[str, str]) -> bool:
+        """检查非 SSE 响应是否应以流式消息返回（超过阈值或长度未知）"""
+        content_length = headers.get("content-length")
+        if content_length is None:
+            return True
+        try:
+            return int(content_length) > self.config.stream_response_threshold
+        except ValueError:
+            return True
+
+    async def _send_stream_response(
         self,
         request_id: str,
         status: int,
         headers: dict[str, str],
-        response: httpx.Response,
+        chunks: AsyncIterator[str],
         start_time: float,
     ) -> None:
         """
-        处理 SSE 流式响应
-        
+        以流式消息发送响应（SSE 或大响应）
+
         发送 StreamStart -> StreamChunk* -> StreamEnd 消息
         """
         if not self._websocket:
@@ -525,29 +842,31 @@ class TunnelClient:
             headers=headers,
         )
         await self._websocket.send(start_msg.model_dump_json())
-        logger.debug(f"SSE 流开始: request_id={request_id}")
+        logger.debug(f"流式响应开始: request_id={request_id}")
 
         chunk_count = 0
         error_msg = None
 
         try:
             # 流式读取并发送数据块
-            async for chunk in response.aiter_text():
-                if chunk:
-                    chunk_msg = StreamChunkMessage(
-                        id=request_id,
-                        data=chunk,
-                        sequence=chunk_count,
-                    )
-                    await self._websocket.send(chunk_msg.model_dump_json())
-                    chunk_count += 1
+            # 数据块是最高频的消息，直接构造字典并用 orjson 编码，跳过 Pydantic 模型构建
+            async for chunk in chunks:
+                chunk_frame = orjson.dumps({
+                    "type": MessageType.STREAM_CHUNK.value,
+                    "id": request_id,
+                    "data": chunk,
+                    "sequence": chunk_count,
+                })
+                # orjson 输出即 UTF-8 字节，直接作为文本帧发送
+                await self._websocket.send(chunk_frame, text=True)
+                chunk_count += 1
 
         except Exception as e:
             error_msg = str(e)
-            logger.error(f"SSE 流读取错误: {e}")
+            logger.error(f"流式响应读取错误: {e}")
 
         # 发送 StreamEnd
-        duration_ms = int((time.time() - start_time) * 1000)
+        duration_ms = int((time.monotonic() - start_time) * 1000)
         end_msg = StreamEndMessage(
             id=request_id,
             error=error_msg,
@@ -555,7 +874,7 @@ class TunnelClient:
             total_chunks=chunk_count,
         )
         await self._websocket.send(end_msg.model_dump_json())
-        logger.debug(f"SSE 流结束: request_id={request_id}, chunks={chunk_count}, duration={duration_ms}ms")
+        logger.debug(f"流式响应结束: request_id={request_id}, chunks={chunk_count}, duration={duration_ms}ms")
 
     # ============== TCP 模式处理方法 ==============
 
@@ -574,6 +893,7 @@ class TunnelClient:
             target_host=self._target_host,
             target_port=self._target_port,
             websocket=websocket,
+            binary=self._binary_tcp,
         )
         
         # 尝试连接
@@ -585,25 +905,32 @@ class TunnelClient:
             logger.warning(f"TCP 连接失败: {conn_id}")
 
     async def _handle_tcp_data(self, message: TcpDataMessage) -> None:
+        """
+        处理 Base64 编码的 TCP 数据（未协商二进制帧的服务端）
+        """
+        try:
+            data = base64.b64decode(message.data)
+        except Exception as e:
+            logger.error(f"处理 TCP 数据错误: {message.conn_id}, {e}")
+            conn = self._tcp_connections.get(message.conn_id)
+            if conn:
+                await conn.close(str(e))
+            return
+        await self._write_tcp_data(message.conn_id, data)
+
+    async def _write_tcp_data(self, conn_id: str, data: bytes) -> None:
         """
         处理 TCP 数据传输
         
         将数据写入到对应的 TCP 连接
         """
-        conn_id = message.conn_id
         conn = self._tcp_connections.get(conn_id)
         
         if not conn:
             logger.warning(f"收到未知连接的数据: {conn_id}")
             return
         
-        try:
-            # 解码 base64 数据
-            data = base64.b64decode(message.data)
-            await conn.write_data(data)
-        except Exception as e:
-            logger.error(f"处理 TCP 数据错误: {conn_id}, {e}")
-            await conn.close(str(e))
+        await conn.write_data(data)
 
     async def _handle_tcp_close(self, message: TcpCloseMessage) -> None:
         """
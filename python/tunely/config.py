@@ -20,6 +20,10 @@ class TunnelServerConfig(BaseSettings):
         default="sqlite+aiosqlite:///./data/tunnels.db",
         description="数据库连接 URL（支持 SQLite, MySQL, PostgreSQL）",
     )
+    read_database_url: str | None = Field(
+        default=None,
+        description="只读副本连接 URL（可选，隧道列表/详情/日志查询走副本）",
+    )
 
     # WebSocket 配置
     ws_path: str = Field(default="/ws/tunnel", description="WebSocket 端点路径")
@@ -33,6 +37,30 @@ class TunnelServerConfig(BaseSettings):
     # 请求配置
     default_timeout: float = Field(default=1800.0, description="默认请求超时（秒）")
     max_pending_requests: int = Field(default=1000, description="最大待处理请求数")
+    stream_queue_size: int = Field(
+        default=1000, description="流式响应缓冲上限（消息数，消费过慢时丢弃最旧的数据块）"
+    )
+    tunnel_cache_ttl: float = Field(
+        default=30.0, description="隧道查询缓存有效期（秒，缓存域名/令牌到隧道的映射）"
+    )
+    request_count_flush_interval: float = Field(
+        default=0.1, description="隧道请求计数合并写入间隔（秒）"
+    )
+
+    # 请求日志（后台批量写入）
+    log_batch_size: int = Field(default=500, description="请求日志每批最多写入条数")
+    log_flush_interval: float = Field(
+        default=0.05, description="请求日志凑批最长等待时间（秒）"
+    )
+    log_queue_size: int = Field(
+        default=10000, description="请求日志队列上限（超出时丢弃新日志）"
+    )
+    log_body_limit: int = Field(
+        default=10000, description="请求/响应体记录上限（字符，最大 10000，0 表示不记录）"
+    )
+    log_retention_days: float | None = Field(
+        default=None, description="请求日志保留天数（设置后每小时清理过期日志）"
+    )
 
     # 分布式配置（可选）
     redis_url: str | None = Field(
@@ -84,16 +112,44 @@ class TunnelClientConfig(BaseSettings):
 
     # 目标服务
     target_url: str = Field(
-        default="http://localhost:8080", description="本地目标服务 URL"
+        default="http://localhost:8080",
+        description="本地目标服务 URL（\"unix:/path/to.sock\" 表示 Unix 域套接字）",
+    )
+    target_uds: str | None = Field(
+        default=None,
+        description="通过 Unix 域套接字连接目标服务（target_url 仅用于 Host 头和路径）",
     )
 
     # 连接配置
     reconnect_interval: float = Field(default=5.0, description="重连间隔（秒）")
     max_reconnect_attempts: int = Field(default=0, description="最大重连次数（0 表示无限）")
     force: bool = Field(default=False, description="是否强制抢占已有连接")
+    ws_compression: bool = Field(
+        default=True,
+        description="是否启用 WebSocket permessage-deflate 压缩（以 CPU 换带宽，二进制为主的负载可关闭）",
+    )
 
     # 请求配置
     request_timeout: float = Field(default=1800.0, description="请求超时（秒）")
+    max_connections: int = Field(default=100, description="到目标服务的最大连接数")
+    max_keepalive_connections: int = Field(
+        default=20, description="到目标服务的最大保活连接数"
+    )
+    max_concurrent_requests: int = Field(
+        default=64, description="最大并发处理请求数（达到上限时新请求立即返回 503）"
+    )
+
+    # 流式响应配置
+    stream_flush_interval: float = Field(
+        default=0.005, description="SSE 小数据块最长合并等待时间（秒）"
+    )
+    stream_batch_size: int = Field(
+        default=16384, description="SSE 合并后数据块的最大长度（字符）"
+    )
+    stream_response_threshold: int = Field(
+        default=262144,
+        description="非 SSE 响应超过此大小（字节）或长度未知时以流式消息返回",
+    )
 
     model_config = {
         "env_prefix": "WS_TUNNEL_CLIENT_",
@@ -10,6 +10,7 @@ WS-Tunnel 数据库模型
 from datetime import datetime, timezone
 from typing import Optional
 
+import orjson
 from sqlalchemy import Boolean, DateTime, Integer, String, Text, Index, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
@@ -64,8 +65,9 @@ class Tunnel(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=func.now(), nullable=False, comment="创建时间"
     )
+    # 与其他时间字段一致使用 UTC，不取数据库 now()（数据库时区可能不是 UTC）
     updated_at: Mapped[Optional[datetime]] = mapped_column(
-        DateTime, onupdate=func.now(), nullable=True, comment="更新时间"
+        DateTime, onupdate=lambda: datetime.now(timezone.utc), nullable=True, comment="更新时间"
     )
 
     # 统计信息（可选）
@@ -76,6 +78,11 @@ class Tunnel(Base):
         Integer, default=0, nullable=False, comment="总请求数"
     )
 
+    __table_args__ = (
+        # 只列启用隧道：WHERE enabled = ? AND id < ? ORDER BY id DESC
+        Index("idx_tunnels_enabled_id", "enabled", "id"),
+    )
+
     def __repr__(self) -> str:
         return f"<Tunnel(domain={self.domain!r}, enabled={self.enabled})>"
 
@@ -194,6 +201,8 @@ class TunnelRequestLog(Base):
         Index("idx_tunnel_request_logs_timestamp", "timestamp"),
         Index("idx_tunnel_request_logs_domain", "tunnel_domain"),
         Index("idx_tunnel_request_logs_status", "status_code"),
+        # 按隧道游标分页：WHERE tunnel_domain = ? AND (timestamp, id) < (?, ?)
+        Index("idx_tunnel_request_logs_domain_ts_id", "tunnel_domain", "timestamp", "id"),
     )
     
     def __repr__(self) -> str:
@@ -201,17 +210,16 @@ class TunnelRequestLog(Base):
     
     def to_dict(self) -> dict:
         """转换为字典（用于 API 返回）"""
-        import json
         return {
             "id": self.id,
             "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "tunnel_domain": self.tunnel_domain,
             "method": self.method,
             "path": self.path,
-            "request_headers": json.loads(self.request_headers) if self.request_headers else None,
+            "request_headers": orjson.loads(self.request_headers) if self.request_headers else None,
             "request_body": self.request_body[:500] if self.request_body else None,  # 只返回前 500 字符
             "status_code": self.status_code,
-            "response_headers": json.loads(self.response_headers) if self.response_headers else None,
+            "response_headers": orjson.loads(self.response_headers) if self.response_headers else None,
             "response_body": self.response_body[:500] if self.response_body else None,  # 只返回前 500 字符
             "error": self.error,
             "duration_ms": self.duration_ms,
@@ -1,7 +1,7 @@
 """
 WS-Tunnel 协议定义
 
-协议版本: 1.1 (SSE 支持)
+协议版本: 1.2 (二进制 TCP 帧)
 
 消息类型:
 - auth: 客户端认证请求
@@ -13,13 +13,31 @@ WS-Tunnel 协议定义
 - stream_chunk: 流式响应数据块
 - stream_end: 流式响应结束
 - ping/pong: 心跳保活
+
+TCP 数据在双方协商 binary_tcp 特性后改用 WebSocket 二进制帧传输，
+见 encode_tcp_data_frame / decode_tcp_data_frame。
 """
 
+import struct
+import time
+import uuid
 from datetime import datetime
 from enum import Enum
-from typing import Any
+from typing import Annotated, Any, Literal
+
+import orjson
+from pydantic import BaseModel, Field, TypeAdapter
+
+# 时间戳缓存：[秒, ISO 字符串]，同一秒内复用格式化结果
+_TS_CACHE: list[int | str] = [0, ""]
 
-from pydantic import BaseModel, Field
+
+def _now_iso() -> str:
+    """当前时间的 ISO 字符串（精确到秒，按秒缓存）"""
+    now = int(time.time())
+    if now != _TS_CACHE[0]:
+        _TS_CACHE[:] = [now, datetime.fromtimestamp(now).isoformat()]
+    return _TS_CACHE[1]
 
 
 class MessageType(str, Enum):
@@ -51,6 +69,9 @@ class MessageType(str, Enum):
 
 # ============== 认证消息 ==============
 
+# 可协商的协议特性：客户端在 AuthMessage 中声明，服务端在 AuthOkMessage 中回传双方都支持的部分
+FEATURE_BINARY_TCP = "binary_tcp"  # TCP 数据使用二进制帧（见 encode_tcp_data_frame）
+
 
 class AuthMessage(BaseModel):
     """客户端认证请求"""
@@ -59,25 +80,48 @@ class AuthMessage(BaseModel):
     token: str = Field(..., description="隧道令牌")
     client_version: str = Field(default="0.1.0", description="客户端版本")
     force: bool = Field(default=False, description="是否强制抢占已有连接")
+    features: list[str] = Field(default_factory=list, description="客户端支持的协议特性")
 
 
 class AuthOkMessage(BaseModel):
     """认证成功响应"""
 
-    type: MessageType = MessageType.AUTH_OK
+    type: Literal[MessageType.AUTH_OK] = MessageType.AUTH_OK
     domain: str = Field(..., description="分配的域名")
     tunnel_id: str = Field(..., description="隧道 ID")
     server_version: str = Field(default="0.1.0", description="服务端版本")
+    features: list[str] = Field(default_factory=list, description="本连接启用的协议特性")
 
 
 class AuthErrorMessage(BaseModel):
     """认证失败响应"""
 
-    type: MessageType = MessageType.AUTH_ERROR
+    type: Literal[MessageType.AUTH_ERROR] = MessageType.AUTH_ERROR
     error: str = Field(..., description="错误信息")
     code: str = Field(default="auth_failed", description="错误代码")
 
 
+# 认证响应：按 type 字段区分，pydantic-core 直接从 JSON 文本解析为对应模型
+AuthResponse = Annotated[AuthOkMessage | AuthErrorMessage, Field(discriminator="type")]
+_AUTH_RESPONSE_ADAPTER: TypeAdapter[AuthOkMessage | AuthErrorMessage] = TypeAdapter(AuthResponse)
+
+
+def parse_auth_response(raw: str | bytes) -> AuthOkMessage | AuthErrorMessage:
+    """
+    解析服务端的认证响应
+
+    Args:
+        raw: WebSocket 收到的原始 JSON 文本
+
+    Returns:
+        AuthOkMessage 或 AuthErrorMessage
+
+    Raises:
+        pydantic.ValidationError: 不是合法的认证响应
+    """
+    return _AUTH_RESPONSE_ADAPTER.validate_json(raw)
+
+
 # ============== 请求-响应消息 ==============
 
 
@@ -95,10 +139,13 @@ class TunnelRequest(BaseModel):
     headers: dict[str, str] = Field(default_factory=dict, description="HTTP 请求头")
     body: str | None = Field(default=None, description="请求体（JSON 字符串或其他）")
     timeout: float = Field(default=1800.0, description="超时时间（秒）")
+    allow_stream: bool = Field(
+        default=False, description="是否允许客户端以流式消息返回大响应（非 SSE）"
+    )
 
     # 元信息
     timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="请求时间"
+        default_factory=_now_iso, description="请求时间"
     )
 
 
@@ -121,7 +168,7 @@ class TunnelResponse(BaseModel):
     # 元信息
     duration_ms: int = Field(default=0, description="请求耗时（毫秒）")
     timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="响应时间"
+        default_factory=_now_iso, description="响应时间"
     )
 
 
@@ -140,7 +187,7 @@ class StreamStartMessage(BaseModel):
     status: int = Field(..., description="HTTP 状态码")
     headers: dict[str, str] = Field(default_factory=dict, description="HTTP 响应头")
     timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="开始时间"
+        default_factory=_now_iso, description="开始时间"
     )
 
 
@@ -155,9 +202,6 @@ class StreamChunkMessage(BaseModel):
     id: str = Field(..., description="请求 ID，与 TunnelRequest.id 对应")
     data: str = Field(..., description="数据块内容")
     sequence: int = Field(default=0, description="数据块序号，从 0 开始")
-    timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="发送时间"
-    )
 
 
 class StreamEndMessage(BaseModel):
@@ -173,7 +217,7 @@ class StreamEndMessage(BaseModel):
     duration_ms: int = Field(default=0, description="总耗时（毫秒）")
     total_chunks: int = Field(default=0, description="总数据块数")
     timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="结束时间"
+        default_factory=_now_iso, description="结束时间"
     )
 
 
@@ -190,7 +234,7 @@ class TcpConnectMessage(BaseModel):
     type: MessageType = MessageType.TCP_CONNECT
     conn_id: str = Field(..., description="连接唯一 ID")
     timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="连接时间"
+        default_factory=_now_iso, description="连接时间"
     )
 
 
@@ -205,9 +249,6 @@ class TcpDataMessage(BaseModel):
     conn_id: str = Field(..., description="连接 ID")
     data: str = Field(..., description="Base64 编码的二进制数据")
     sequence: int = Field(default=0, description="数据包序号")
-    timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="发送时间"
-    )
 
 
 class TcpCloseMessage(BaseModel):
@@ -221,34 +262,101 @@ class TcpCloseMessage(BaseModel):
     conn_id: str = Field(..., description="连接 ID")
     error: str | None = Field(default=None, description="错误信息（如果异常关闭）")
     timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="关闭时间"
+        default_factory=_now_iso, description="关闭时间"
     )
 
 
+# TCP 数据二进制帧: 1 字节类型标记 + 16 字节 conn_id（UUID 原始字节）+ 4 字节序号 + 原始数据
+BINARY_TCP_DATA = 0x01
+_TCP_DATA_HEADER = struct.Struct("!B16sI")
+
+
+def encode_tcp_data_frame(conn_id: str, data: bytes, sequence: int = 0) -> bytes:
+    """
+    将 TCP 数据编码为 WebSocket 二进制帧
+
+    Args:
+        conn_id: 连接 ID（UUID 字符串）
+        data: 原始 TCP 数据
+        sequence: 数据包序号
+
+    Returns:
+        二进制帧内容
+    """
+    header = _TCP_DATA_HEADER.pack(
+        BINARY_TCP_DATA, uuid.UUID(conn_id).bytes, sequence & 0xFFFFFFFF
+    )
+    return header + data
+
+
+def decode_tcp_data_frame(frame: bytes) -> tuple[str, int, memoryview]:
+    """
+    解析 TCP 数据二进制帧
+
+    数据部分以 memoryview 切片返回，不复制负载；写入 StreamWriter 或
+    拼接响应时可直接使用。
+
+    Args:
+        frame: 二进制帧内容
+
+    Returns:
+        (conn_id, sequence, data)
+
+    Raises:
+        ValueError: 帧格式错误
+    """
+    if len(frame) < _TCP_DATA_HEADER.size:
+        raise ValueError(f"Binary frame too short: {len(frame)} bytes")
+    tag, conn_id, sequence = _TCP_DATA_HEADER.unpack_from(frame)
+    if tag != BINARY_TCP_DATA:
+        raise ValueError(f"Unknown binary frame type: {tag}")
+    return str(uuid.UUID(bytes=conn_id)), sequence, memoryview(frame)[_TCP_DATA_HEADER.size:]
+
+
 # ============== 心跳消息 ==============
 
+# 高频消息（心跳、数据块、TCP 数据）不携带 timestamp，避免每条消息取时间并格式化；
+# 旧版本对端发来的 timestamp 字段会被忽略。
+
 
 class PingMessage(BaseModel):
     """心跳请求"""
 
     type: MessageType = MessageType.PING
-    timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="发送时间"
-    )
 
 
 class PongMessage(BaseModel):
     """心跳响应"""
 
     type: MessageType = MessageType.PONG
-    timestamp: str = Field(
-        default_factory=lambda: datetime.now().isoformat(), description="响应时间"
-    )
+
+
+# 预编码的心跳帧：对端只关心 type 字段，省去每次心跳构造模型和生成时间戳
+PING_FRAME: str = orjson.dumps({"type": MessageType.PING.value}).decode()
+PONG_FRAME: str = orjson.dumps({"type": MessageType.PONG.value}).decode()
 
 
 # ============== 消息解析 ==============
 
 
+# type 字段值 → 消息类
+_MESSAGE_CLASSES: dict[str, type[BaseModel]] = {
+    MessageType.AUTH.value: AuthMessage,
+    MessageType.AUTH_OK.value: AuthOkMessage,
+    MessageType.AUTH_ERROR.value: AuthErrorMessage,
+    MessageType.REQUEST.value: TunnelRequest,
+    MessageType.RESPONSE.value: TunnelResponse,
+    MessageType.STREAM_START.value: StreamStartMessage,
+    MessageType.STREAM_CHUNK.value: StreamChunkMessage,
+    MessageType.STREAM_END.value: StreamEndMessage,
+    MessageType.TCP_CONNECT.value: TcpConnectMessage,
+    MessageType.TCP_DATA.value: TcpDataMessage,
+    MessageType.TCP_CLOSE.value: TcpCloseMessage,
+    MessageType.PING.value: PingMessage,
+    MessageType.PONG.value: PongMessage,
+}
+
+
 def parse_message(data: dict[str, Any]) -> BaseModel:
     """
     解析消息
@@ -260,35 +368,100 @@ def parse_message(data: dict[str, Any]) -> BaseModel:
         对应类型的消息对象
 
     Raises:
-        ValueError: 未知消息类型
+        ValueError: 不是 JSON 对象或未知消息类型
     """
+    if not isinstance(data, dict):
+        raise ValueError(f"Message must be a JSON object, got {type(data).__name__}")
     msg_type = data.get("type")
+    if isinstance(msg_type, MessageType):
+        msg_type = msg_type.value
 
-    if msg_type == MessageType.AUTH:
-        return AuthMessage(**data)
-    elif msg_type == MessageType.AUTH_OK:
-        return AuthOkMessage(**data)
-    elif msg_type == MessageType.AUTH_ERROR:
-        return AuthErrorMessage(**data)
-    elif msg_type == MessageType.REQUEST:
-        return TunnelRequest(**data)
-    elif msg_type == MessageType.RESPONSE:
-        return TunnelResponse(**data)
-    elif msg_type == MessageType.STREAM_START:
-        return StreamStartMessage(**data)
-    elif msg_type == MessageType.STREAM_CHUNK:
-        return StreamChunkMessage(**data)
-    elif msg_type == MessageType.STREAM_END:
-        return StreamEndMessage(**data)
-    elif msg_type == MessageType.TCP_CONNECT:
-        return TcpConnectMessage(**data)
-    elif msg_type == MessageType.TCP_DATA:
-        return TcpDataMessage(**data)
-    elif msg_type == MessageType.TCP_CLOSE:
-        return TcpCloseMessage(**data)
-    elif msg_type == MessageType.PING:
-        return PingMessage(**data)
-    elif msg_type == MessageType.PONG:
-        return PongMessage(**data)
-    else:
+    cls = _MESSAGE_CLASSES.get(msg_type) if isinstance(msg_type, str) else None
+    if cls is None:
         raise ValueError(f"Unknown message type: {msg_type}")
+    return cls.model_validate(data)
+
+
+# 来自可信对端时跳过校验、直接构造的高频消息类型及其必需的标识字段
+# （服务端 → 客户端的请求与 TCP 消息，客户端 → 服务端的流式消息）
+# 标识字段仍需检查：处理函数按它查找待响应请求，缺失时不能让异常传到读取循环
+_TRUSTED_CONSTRUCT_TYPES = {
+    MessageType.REQUEST.value: "id",
+    MessageType.STREAM_START.value: "id",
+    MessageType.STREAM_CHUNK.value: "id",
+    MessageType.STREAM_END.value: "id",
+    MessageType.TCP_CONNECT.value: "conn_id",
+    MessageType.TCP_DATA.value: "conn_id",
+    MessageType.TCP_CLOSE.value: "conn_id",
+}
+
+# 心跳消息内容无关紧要，复用同一个实例
+_PING_MESSAGE = PingMessage()
+_PONG_MESSAGE = PongMessage()
+
+
+def parse_trusted_message(data: dict[str, Any]) -> BaseModel:
+    """
+    解析来自可信对端的消息
+
+    高频消息使用 model_construct 构造，只检查标识字段，跳过其余字段校验；
+    认证等一次性消息和普通响应仍走 parse_message 完整校验。
+
+    Args:
+        data: JSON 解析后的字典
+
+    Returns:
+        对应类型的消息对象
+
+    Raises:
+        ValueError: 不是 JSON 对象、未知消息类型或缺少标识字段
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"Message must be a JSON object, got {type(data).__name__}")
+    msg_type = data.get("type")
+    if msg_type == MessageType.PING.value:
+        return _PING_MESSAGE
+    if msg_type == MessageType.PONG.value:
+        return _PONG_MESSAGE
+    key = _TRUSTED_CONSTRUCT_TYPES.get(msg_type) if isinstance(msg_type, str) else None
+    if key is not None:
+        if not isinstance(data.get(key), str):
+            raise ValueError(f"Message {msg_type} requires string field {key!r}")
+        return _MESSAGE_CLASSES[msg_type].model_construct(**data)
+    return parse_message(data)
+
+
+# ============== 消息序列化 ==============
+
+
+def dump_message(message: BaseModel) -> str:
+    """
+    使用 orjson 直接序列化消息
+
+    跳过 Pydantic 序列化器，配合 model_construct 构造的消息使用；
+    仅适用于字段均为 JSON 原生类型（含 MessageType 枚举）的消息。
+
+    Args:
+        message: 消息对象
+
+    Returns:
+        JSON 文本
+    """
+    return orjson.dumps(message.__dict__).decode()
+
+
+def dump_message_bytes(message: BaseModel) -> bytes:
+    """
+    同 dump_message，但返回 UTF-8 编码的 JSON 字节
+
+    配合 websockets 的 send(data, text=True) 以文本帧发送，
+    省去先解码为 str、发送时再编码回 UTF-8 的两次拷贝。
+    （二进制帧仍只用于 TCP 数据，JSON 消息始终走文本帧。）
+
+    Args:
+        message: 消息对象
+
+    Returns:
+        JSON 文本的 UTF-8 字节
+    """
+    return orjson.dumps(message.__dict__)
@@ -4,21 +4,265 @@ WS-Tunnel 数据仓库
 提供隧道数据的 CRUD 操作
 """
 
+import asyncio
+import base64
+import logging
 import secrets
-from datetime import datetime, timezone
+import time
+import warnings
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional
 
-from typing import List, Optional
-from sqlalchemy import select, update, func, delete
+import orjson
+from sqlalchemy import (
+    Select, bindparam, case, event, select, update, func, delete, insert, text, tuple_
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .database import DatabaseManager
 from .models import Tunnel, TunnelRequestLog
 
+logger = logging.getLogger(__name__)
+
+
+# session.info 中待提交后执行的缓存失效
+_PENDING_INVALIDATIONS = "tunely_pending_invalidations"
+
+
+def _run_invalidations(session) -> None:
+    """事务提交后执行暂存的缓存失效"""
+    pending = session.info.get(_PENDING_INVALIDATIONS)
+    while pending:
+        cache, domain, token = pending.pop()
+        cache.invalidate(domain=domain, token=token)
+
+
+def _drop_invalidations(session) -> None:
+    """事务回滚时丢弃暂存的缓存失效（数据未变）"""
+    pending = session.info.get(_PENDING_INVALIDATIONS)
+    if pending:
+        pending.clear()
+
+
+# ============== 游标分页 ==============
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """
+    将最后一行的 (时间, ID) 编码为不透明的分页游标
+
+    Args:
+        timestamp: 排序时间列的值
+        row_id: 主键
+
+    Returns:
+        URL 安全的游标字符串
+    """
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    解析分页游标
+
+    Args:
+        cursor: encode_cursor 生成的游标
+
+    Returns:
+        (timestamp, row_id)
+
+    Raises:
+        ValueError: 游标格式错误
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, row_id = base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def encode_id_cursor(row_id: int) -> str:
+    """
+    将最后一行的主键编码为不透明的分页游标（按主键排序的列表使用）
+
+    Args:
+        row_id: 主键
+
+    Returns:
+        URL 安全的游标字符串
+    """
+    return base64.urlsafe_b64encode(str(row_id).encode()).decode("ascii").rstrip("=")
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """
+    解析 encode_id_cursor 生成的分页游标
+
+    Args:
+        cursor: encode_id_cursor 生成的游标
+
+    Returns:
+        row_id
+
+    Raises:
+        ValueError: 游标格式错误
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded).decode())
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+_UTC = timezone.utc
+
+
+def _utcnow() -> datetime:
+    """当前 UTC 时间（带时区）"""
+    return datetime.now(_UTC)
+
+
+def _new_token() -> str:
+    """生成隧道连接令牌（192 位随机数的十六进制，含前缀共 52 字符，不超过 token 列长度 64）"""
+    return f"tun_{secrets.token_hex(24)}"
+
+
+# 日志字段长度上限
+_TRUNCATE_LIMITS = {
+    "path": 1000,
+    "request_body": 10000,
+    "response_body": 10000,
+    "error": 2000,
+}
+
+
+def _apply_offset(query: Select, offset: int) -> Select:
+    """兼容旧的 offset 分页（深度翻页需扫描并丢弃 offset 行，已弃用）"""
+    if offset:
+        warnings.warn(
+            "offset 分页已弃用，请使用 after 游标分页",
+            DeprecationWarning,
+            stacklevel=3,
+        )
+        query = query.offset(offset)
+    return query
+
+
+# ============== 预构建查询 ==============
+
+# 热点查询在导入时构建一次，调用时只传绑定参数，省去每次构造表达式树
+_SELECT_TUNNEL_BY_DOMAIN = select(Tunnel).where(Tunnel.domain == bindparam("domain"))
+_SELECT_TUNNEL_BY_TOKEN = select(Tunnel).where(Tunnel.token == bindparam("token"))
+_LIST_TUNNELS = select(Tunnel).order_by(Tunnel.id.desc())
+_LIST_ENABLED_TUNNELS = _LIST_TUNNELS.where(Tunnel.enabled == True)
+
+# 批量计数单条 UPDATE 最多包含的令牌数（每个令牌占 3 个绑定参数）
+_INCREMENT_BATCH_SIZE = 500
+
+
+# ============== 隧道查询缓存 ==============
+
+
+@dataclass(frozen=True)
+class TunnelSnapshot:
+    """隧道查询快照（不绑定会话，可跨请求缓存）"""
+
+    id: int
+    domain: str
+    token: str
+    enabled: bool
+    mode: str
+
+    @classmethod
+    def from_tunnel(cls, tunnel: Tunnel) -> "TunnelSnapshot":
+        return cls(
+            id=tunnel.id,
+            domain=tunnel.domain,
+            token=tunnel.token,
+            enabled=tunnel.enabled,
+            mode=tunnel.mode,
+        )
+
+
+class TunnelCache:
+    """
+    进程内隧道查询 TTL 缓存
+
+    按域名和令牌缓存 TunnelSnapshot，隧道被修改时由 TunnelRepository 在事务提交后主动失效；
+    同一键的并发未命中通过按键加锁合并为一次查询
+    """
+
+    def __init__(self, ttl: float = 30.0, maxsize: int = 4096):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: dict[tuple[str, str], tuple[float, TunnelSnapshot]] = {}
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+    def get(self, key: tuple[str, str]) -> TunnelSnapshot | None:
+        """读取未过期的缓存项"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        return snapshot
+
+    def put(self, snapshot: TunnelSnapshot) -> None:
+        """同时按域名和令牌缓存快照"""
+        expires_at = time.monotonic() + self.ttl
+        for key in (("domain", snapshot.domain), ("token", snapshot.token)):
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.maxsize:
+                # 超出容量时淘汰最早写入的项
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (expires_at, snapshot)
+
+    def invalidate(self, domain: str | None = None, token: str | None = None) -> None:
+        """按域名或令牌失效缓存（连同同一隧道的另一个键）"""
+        for key in (("domain", domain), ("token", token)):
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                snapshot = entry[1]
+                self._entries.pop(("domain", snapshot.domain), None)
+                self._entries.pop(("token", snapshot.token), None)
+
+    def lock(self, key: tuple[str, str]) -> asyncio.Lock:
+        """获取按键的查询锁"""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+        self._locks.clear()
+
 
 class TunnelRepository:
     """隧道数据仓库"""
 
-    def __init__(self, session: AsyncSession):
+    def __init__(
+        self,
+        session: AsyncSession,
+        cache: TunnelCache | None = None,
+        read_session: AsyncSession | None = None,
+    ):
+        """
+        Args:
+            session: 数据库会话（写操作及写前读取）
+            cache: 隧道查询缓存（可选，用于 get_cached_by_domain / get_cached_by_token）
+            read_session: 只读会话（可选，查询方法走只读副本；注意副本复制延迟）
+        """
         self.session = session
+        self.cache = cache
+        self._reader = read_session or session
 
     async def create(
         self,
@@ -40,7 +284,7 @@ class TunnelRepository:
             创建的隧道对象
         """
         if not token:
-            token = f"tun_{secrets.token_urlsafe(32)}"
+            token = _new_token()
 
         tunnel = Tunnel(
             domain=domain,
@@ -55,78 +299,289 @@ class TunnelRepository:
 
     async def get_by_domain(self, domain: str) -> Tunnel | None:
         """根据域名获取隧道"""
-        result = await self.session.execute(
-            select(Tunnel).where(Tunnel.domain == domain)
-        )
+        result = await self._reader.execute(_SELECT_TUNNEL_BY_DOMAIN, {"domain": domain})
         return result.scalar_one_or_none()
 
     async def get_by_token(self, token: str) -> Tunnel | None:
         """根据令牌获取隧道"""
-        result = await self.session.execute(
-            select(Tunnel).where(Tunnel.token == token)
-        )
+        result = await self._reader.execute(_SELECT_TUNNEL_BY_TOKEN, {"token": token})
         return result.scalar_one_or_none()
 
+    async def get_cached_by_domain(self, domain: str) -> TunnelSnapshot | None:
+        """根据域名获取隧道快照（优先读缓存）"""
+        return await self._get_cached(("domain", domain), self.get_by_domain, domain)
+
+    async def get_cached_by_token(self, token: str) -> TunnelSnapshot | None:
+        """根据令牌获取隧道快照（优先读缓存）"""
+        return await self._get_cached(("token", token), self.get_by_token, token)
+
+    async def _get_cached(self, key, loader, value: str) -> TunnelSnapshot | None:
+        """读缓存，未命中时查询并写入（不缓存不存在的隧道）"""
+        if self.cache is None:
+            tunnel = await loader(value)
+            return TunnelSnapshot.from_tunnel(tunnel) if tunnel else None
+
+        snapshot = self.cache.get(key)
+        if snapshot is not None:
+            return snapshot
+        async with self.cache.lock(key):
+            snapshot = self.cache.get(key)
+            if snapshot is None:
+                tunnel = await loader(value)
+                if tunnel is None:
+                    return None
+                snapshot = TunnelSnapshot.from_tunnel(tunnel)
+                self.cache.put(snapshot)
+        return snapshot
+
+    def _invalidate(self, domain: str | None = None, token: str | None = None) -> None:
+        """
+        隧道被修改时失效缓存
+
+        失效在事务提交后执行：提交前失效的话，并发查询仍会读到已提交的旧数据
+        并回填缓存，直到 TTL 过期。事务回滚时不执行（数据未变）。
+        """
+        if self.cache is None:
+            return
+        info = self.session.info
+        pending = info.get(_PENDING_INVALIDATIONS)
+        if pending is None:
+            pending = info[_PENDING_INVALIDATIONS] = []
+            sync_session = self.session.sync_session
+            event.listen(sync_session, "after_commit", _run_invalidations)
+            event.listen(sync_session, "after_rollback", _drop_invalidations)
+        pending.append((self.cache, domain, token))
+
     async def list_all(
-        self, enabled_only: bool = False, limit: int = 100, offset: int = 0
+        self,
+        enabled_only: bool = False,
+        limit: int = 100,
+        offset: int = 0,
+        after: str | None = None,
     ) -> list[Tunnel]:
         """
-        列出所有隧道
+        列出所有隧道（按创建顺序倒序）
 
         Args:
             enabled_only: 是否只返回启用的隧道
             limit: 返回数量限制
-            offset: 偏移量
+            offset: 偏移量（已弃用，请使用 after）
+            after: 分页游标，返回该游标之后的隧道
         """
-        query = select(Tunnel).order_by(Tunnel.created_at.desc())
-        if enabled_only:
-            query = query.where(Tunnel.enabled == True)
-        query = query.limit(limit).offset(offset)
+        query = self._list_query(enabled_only, after).limit(limit)
+        query = _apply_offset(query, offset)
+
+        result = await self._reader.execute(query)
+        return result.scalars().all()
 
-        result = await self.session.execute(query)
-        return list(result.scalars().all())
+    async def list_page(
+        self,
+        enabled_only: bool = False,
+        limit: int = 100,
+        after: str | None = None,
+    ) -> tuple[list[Tunnel], str | None]:
+        """
+        游标分页列出隧道
+
+        Args:
+            enabled_only: 是否只返回启用的隧道
+            limit: 每页数量
+            after: 上一页返回的游标（None 表示第一页）
+
+        Returns:
+            (本页隧道, 下一页游标)；没有下一页时游标为 None
+        """
+        result = await self._reader.execute(
+            self._list_query(enabled_only, after).limit(limit + 1)
+        )
+        tunnels = result.scalars().all()
+        if len(tunnels) <= limit:
+            return tunnels, None
+        last = tunnels[limit - 1]
+        return tunnels[:limit], encode_id_cursor(last.id)
+
+    @staticmethod
+    def _list_query(enabled_only: bool, after: str | None) -> Select:
+        """
+        隧道列表查询：按创建顺序倒序
+
+        自增主键与创建顺序一致，直接按 id 做游标条件走主键范围扫描；
+        created_at 由数据库 now() 生成（SQLite 只精确到秒、且存储格式与绑定参数不同），
+        不适合作为游标比较列。
+        """
+        query = _LIST_ENABLED_TUNNELS if enabled_only else _LIST_TUNNELS
+        if after:
+            query = query.where(Tunnel.id < decode_id_cursor(after))
+        return query
 
     async def update_enabled(self, domain: str, enabled: bool) -> bool:
         """更新隧道启用状态"""
         result = await self.session.execute(
             update(Tunnel)
             .where(Tunnel.domain == domain)
-            .values(enabled=enabled, updated_at=datetime.now(timezone.utc))
+            .values(enabled=enabled, updated_at=_utcnow())
         )
+        self._invalidate(domain=domain)
         return result.rowcount > 0
 
+    async def update_fields(self, domain: str, **values) -> Tunnel | None:
+        """
+        更新隧道字段并返回更新后的隧道
+
+        支持 UPDATE ... RETURNING 的数据库一次往返完成更新与读取；
+        没有需要更新的字段时只查询。
+
+        Returns:
+            更新后的隧道；隧道不存在时返回 None
+        """
+        if not values:
+            return await self.get_by_domain(domain)
+
+        stmt = update(Tunnel).where(Tunnel.domain == domain).values(**values)
+        if self.session.bind.dialect.update_returning:
+            result = await self.session.execute(
+                stmt.returning(Tunnel),
+                execution_options={"populate_existing": True},
+            )
+            self._invalidate(domain=domain)
+            return result.scalar_one_or_none()
+
+        result = await self.session.execute(stmt)
+        self._invalidate(domain=domain)
+        if result.rowcount == 0:
+            return None
+        # 刚写入的数据从主库读取，不走只读副本
+        result = await self.session.execute(
+            _SELECT_TUNNEL_BY_DOMAIN,
+            {"domain": domain},
+            execution_options={"populate_existing": True},
+        )
+        return result.scalar_one_or_none()
+
+    async def authenticate(self, token: str) -> TunnelSnapshot | None:
+        """
+        客户端认证：查询令牌对应的隧道，启用时同时更新最后连接时间
+
+        支持 UPDATE ... RETURNING 的数据库一次往返完成更新与读取；
+        没有返回行（令牌无效或隧道已禁用）时再查询以区分两种情况。
+
+        Returns:
+            隧道快照；令牌无效时返回 None（已禁用的隧道 enabled 为 False）
+        """
+        if self.session.bind.dialect.update_returning:
+            result = await self.session.execute(
+                update(Tunnel)
+                .where(Tunnel.token == token, Tunnel.enabled.is_(True))
+                .values(last_connected_at=_utcnow())
+                .returning(Tunnel),
+                execution_options={"populate_existing": True},
+            )
+            tunnel = result.scalar_one_or_none()
+            if tunnel is not None:
+                snapshot = TunnelSnapshot.from_tunnel(tunnel)
+                if self.cache is not None:
+                    self.cache.put(snapshot)
+                return snapshot
+            return await self.get_cached_by_token(token)
+
+        snapshot = await self.get_cached_by_token(token)
+        if snapshot and snapshot.enabled:
+            await self.update_last_connected(token)
+        return snapshot
+
     async def update_last_connected(self, token: str) -> bool:
         """更新最后连接时间"""
         result = await self.session.execute(
             update(Tunnel)
             .where(Tunnel.token == token)
-            .values(last_connected_at=datetime.utcnow())
+            .values(last_connected_at=_utcnow())
         )
         return result.rowcount > 0
 
-    async def increment_requests(self, token: str, count: int = 1) -> bool:
-        """增加请求计数"""
-        result = await self.session.execute(
+    async def increment_requests(self, token: str, count: int = 1) -> int | None:
+        """
+        增加请求计数
+
+        Returns:
+            更新后的请求总数；隧道不存在时返回 None
+        """
+        stmt = (
             update(Tunnel)
             .where(Tunnel.token == token)
             .values(total_requests=Tunnel.total_requests + count)
         )
-        return result.rowcount > 0
+        if self.session.bind.dialect.update_returning:
+            # 支持 UPDATE ... RETURNING 的数据库一次往返同时完成更新与读取
+            result = await self.session.execute(stmt.returning(Tunnel.total_requests))
+            return result.scalar_one_or_none()
+
+        result = await self.session.execute(stmt)
+        if result.rowcount == 0:
+            return None
+        result = await self.session.execute(
+            select(Tunnel.total_requests).where(Tunnel.token == token)
+        )
+        return result.scalar_one_or_none()
+
+    async def increment_requests_many(self, counts: dict[str, int]) -> None:
+        """
+        批量增加多个隧道的请求计数
+
+        每批令牌合并为一条 UPDATE ... SET total_requests = total_requests + CASE token ... END，
+        一次往返完成，而不是每个令牌一条语句。
+
+        Args:
+            counts: 令牌 -> 增量
+        """
+        items = list(counts.items())
+        table = Tunnel.__table__
+        for start in range(0, len(items), _INCREMENT_BATCH_SIZE):
+            batch = dict(items[start:start + _INCREMENT_BATCH_SIZE])
+            await self.session.execute(
+                update(table)
+                .where(table.c.token.in_(list(batch)))
+                .values(
+                    total_requests=table.c.total_requests
+                    + case(batch, value=table.c.token, else_=0)
+                )
+            )
 
     async def delete(self, domain: str) -> bool:
         """删除隧道 - 使用 SQL DELETE 语句"""
         stmt = delete(Tunnel).where(Tunnel.domain == domain)
         result = await self.session.execute(stmt)
+        self._invalidate(domain=domain)
         return result.rowcount > 0
 
+    async def _lock_domain(self, domain: str) -> None:
+        """
+        在当前事务内对单个隧道加写锁，事务结束时自动释放
+
+        - PostgreSQL: 事务级 advisory 锁，不影响其他隧道
+        - MySQL: SELECT ... FOR UPDATE 行锁
+        - SQLite: 数据库级单写者，无需额外加锁
+        """
+        dialect = self.session.bind.dialect.name
+        if dialect == "postgresql":
+            await self.session.execute(
+                text("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))"),
+                {"key": f"tunely:token:{domain}"},
+            )
+        elif dialect == "mysql":
+            await self.session.execute(
+                select(Tunnel.id).where(Tunnel.domain == domain).with_for_update()
+            )
+
     async def regenerate_token(self, domain: str) -> str | None:
-        """重新生成令牌"""
-        new_token = f"tun_{secrets.token_urlsafe(32)}"
+        """重新生成令牌（同一隧道的并发重新生成按事务串行执行）"""
+        await self._lock_domain(domain)
+        new_token = _new_token()
         result = await self.session.execute(
             update(Tunnel)
             .where(Tunnel.domain == domain)
-            .values(token=new_token, updated_at=datetime.now(timezone.utc))
+            .values(token=new_token, updated_at=_utcnow())
         )
+        self._invalidate(domain=domain)
         if result.rowcount > 0:
             return new_token
         return None
@@ -135,9 +590,52 @@ class TunnelRepository:
 class TunnelRequestLogRepository:
     """隧道请求日志数据仓库"""
     
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, read_session: AsyncSession | None = None):
+        """
+        Args:
+            session: 数据库会话（写操作）
+            read_session: 只读会话（可选，日志查询走只读副本）
+        """
         self.session = session
+        self._reader = read_session or session
     
+    @staticmethod
+    def _log_values(
+        tunnel_domain: str,
+        method: str,
+        path: str,
+        request_headers: dict | None = None,
+        request_body: str | None = None,
+        status_code: int | None = None,
+        response_headers: dict | None = None,
+        response_body: str | None = None,
+        error: str | None = None,
+        duration_ms: int = 0,
+    ) -> dict:
+        """整理一条日志的列值（截断超长字段、序列化请求/响应头）"""
+        values = {
+            "tunnel_domain": tunnel_domain,
+            "method": method,
+            "path": path,
+            "request_headers": (
+                orjson.dumps(request_headers).decode() if request_headers else None
+            ),
+            "request_body": request_body or None,
+            "status_code": status_code,
+            "response_headers": (
+                orjson.dumps(response_headers).decode() if response_headers else None
+            ),
+            "response_body": response_body or None,
+            "error": error or None,
+            "duration_ms": duration_ms,
+        }
+        # 未超长的字段原样保留，不做切片复制
+        for field, limit in _TRUNCATE_LIMITS.items():
+            value = values[field]
+            if value is not None and len(value) > limit:
+                values[field] = value[:limit]
+        return values
+
     async def create(
         self,
         tunnel_domain: str,
@@ -152,42 +650,151 @@ class TunnelRequestLogRepository:
         duration_ms: int = 0,
     ) -> TunnelRequestLog:
         """创建请求日志记录"""
-        import json
-        
-        log = TunnelRequestLog(
+        log = TunnelRequestLog(**self._log_values(
             tunnel_domain=tunnel_domain,
             method=method,
-            path=path[:1000],  # 限制路径长度
-            request_headers=json.dumps(request_headers) if request_headers else None,
-            request_body=request_body[:10000] if request_body else None,  # 限制请求体长度
+            path=path,
+            request_headers=request_headers,
+            request_body=request_body,
             status_code=status_code,
-            response_headers=json.dumps(response_headers) if response_headers else None,
-            response_body=response_body[:10000] if response_body else None,  # 限制响应体长度
-            error=error[:2000] if error else None,  # 限制错误信息长度
+            response_headers=response_headers,
+            response_body=response_body,
+            error=error,
             duration_ms=duration_ms,
-        )
+        ))
         self.session.add(log)
+        # 主键在 INSERT 时回填，时间戳为客户端默认值，flush 后即可用，无需再 refresh
         await self.session.flush()
-        await self.session.refresh(log)
         return log
+
+    async def create_many(self, entries: list[dict]) -> None:
+        """
+        批量创建请求日志记录
+
+        所有记录通过一条多行 INSERT 写入，不回填主键
+
+        Args:
+            entries: 日志字段字典列表，键与 create 的参数相同
+        """
+        if not entries:
+            return
+        rows = [self._log_values(**entry) for entry in entries]
+        await self.session.execute(insert(TunnelRequestLog), rows)
     
     async def get_recent(
         self,
         tunnel_domain: str | None = None,
         limit: int = 100,
         offset: int = 0,
+        after: str | None = None,
     ) -> List[TunnelRequestLog]:
-        """获取最近的请求日志"""
-        query = select(TunnelRequestLog).order_by(TunnelRequestLog.timestamp.desc())
+        """
+        获取最近的请求日志
+
+        Args:
+            tunnel_domain: 隧道域名（None 表示全部）
+            limit: 返回数量限制
+            offset: 偏移量（已弃用，请使用 after）
+            after: 分页游标，返回该游标之后（更早）的日志
+        """
+        query = self._recent_query(tunnel_domain, after).limit(limit)
+        query = _apply_offset(query, offset)
         
+        result = await self._reader.execute(query)
+        return result.scalars().all()
+
+    async def get_recent_page(
+        self,
+        tunnel_domain: str | None = None,
+        limit: int = 100,
+        after: str | None = None,
+    ) -> tuple[List[TunnelRequestLog], str | None]:
+        """
+        游标分页获取请求日志
+
+        Args:
+            tunnel_domain: 隧道域名（None 表示全部）
+            limit: 每页数量
+            after: 上一页返回的游标（None 表示第一页）
+
+        Returns:
+            (本页日志, 下一页游标)；没有下一页时游标为 None
+        """
+        result = await self._reader.execute(
+            self._recent_query(tunnel_domain, after).limit(limit + 1)
+        )
+        logs = result.scalars().all()
+        if len(logs) <= limit:
+            return logs, None
+        last = logs[limit - 1]
+        return logs[:limit], encode_cursor(last.timestamp, last.id)
+
+    async def stream_recent(
+        self,
+        tunnel_domain: str | None = None,
+        after: str | None = None,
+        batch_size: int = 100,
+    ) -> AsyncIterator[TunnelRequestLog]:
+        """
+        流式遍历请求日志（按时间倒序），内存中只保留一个批次
+
+        Args:
+            tunnel_domain: 隧道域名（None 表示全部）
+            after: 分页游标，从该游标之后（更早）开始
+            batch_size: 每批从数据库读取的行数
+        """
+        query = self._recent_query(tunnel_domain, after).execution_options(
+            yield_per=batch_size
+        )
+        async for log in await self._reader.stream_scalars(query):
+            yield log
+
+    @staticmethod
+    def _recent_query(tunnel_domain: str | None, after: str | None) -> Select:
+        """日志查询：按 (timestamp, id) 倒序，游标条件走索引范围扫描"""
+        query = select(TunnelRequestLog).order_by(
+            TunnelRequestLog.timestamp.desc(), TunnelRequestLog.id.desc()
+        )
         if tunnel_domain:
             query = query.where(TunnelRequestLog.tunnel_domain == tunnel_domain)
-        
-        query = query.limit(limit).offset(offset)
-        
-        result = await self.session.execute(query)
-        return list(result.scalars().all())
+        if after:
+            timestamp, row_id = decode_cursor(after)
+            query = query.where(
+                tuple_(TunnelRequestLog.timestamp, TunnelRequestLog.id) < (timestamp, row_id)
+            )
+        return query
     
+    async def prune_older_than(self, days: float, batch_size: int = 1000) -> int:
+        """
+        分批删除早于保留期的日志
+
+        每批先按 timestamp 索引取出一批 ID 再按主键删除并提交，
+        避免单条大 DELETE 长时间持有锁（MySQL 也不支持在 IN 子查询中使用 LIMIT）
+
+        Args:
+            days: 保留天数
+            batch_size: 每批删除的行数
+
+        Returns:
+            删除的总行数
+        """
+        cutoff = _utcnow() - timedelta(days=days)
+        deleted = 0
+        while True:
+            result = await self.session.execute(
+                select(TunnelRequestLog.id)
+                .where(TunnelRequestLog.timestamp < cutoff)
+                .limit(batch_size)
+            )
+            ids = result.scalars().all()
+            if not ids:
+                return deleted
+            await self.session.execute(
+                delete(TunnelRequestLog).where(TunnelRequestLog.id.in_(ids))
+            )
+            await self.session.commit()
+            deleted += len(ids)
+
     async def count(self, tunnel_domain: str | None = None) -> int:
         """统计请求日志数量"""
         query = select(func.count(TunnelRequestLog.id))
@@ -195,5 +802,212 @@ class TunnelRequestLogRepository:
         if tunnel_domain:
             query = query.where(TunnelRequestLog.tunnel_domain == tunnel_domain)
         
-        result = await self.session.execute(query)
+        result = await self._reader.execute(query)
         return result.scalar_one() or 0
+
+    async def has_more(
+        self,
+        tunnel_domain: str | None = None,
+        after: str | None = None,
+        limit: int = 100,
+    ) -> bool:
+        """
+        判断游标之后是否还有超过 limit 条日志（只探测一行，不做全量统计）
+
+        Args:
+            tunnel_domain: 隧道域名（None 表示全部）
+            after: 分页游标（None 表示从最新开始）
+            limit: 每页数量
+        """
+        query = (
+            self._recent_query(tunnel_domain, after)
+            .with_only_columns(TunnelRequestLog.id)
+            .offset(limit)
+            .limit(1)
+        )
+        result = await self._reader.execute(query)
+        return result.first() is not None
+
+    async def estimate_count(self) -> int:
+        """
+        估算请求日志总数
+
+        PostgreSQL 读取 pg_class.reltuples 统计值（O(1)），
+        其他数据库或尚无统计信息时回退为精确 COUNT
+        """
+        if self._reader.bind.dialect.name == "postgresql":
+            result = await self._reader.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+                {"table": TunnelRequestLog.__tablename__},
+            )
+            estimate = result.scalar()
+            # 表从未 ANALYZE 时 reltuples 为 -1
+            if estimate is not None and estimate >= 0:
+                return estimate
+        return await self.count()
+
+
+# ============== 日志后台写入 ==============
+
+
+class RequestLogWriter:
+    """
+    请求日志后台批量写入器
+
+    请求路径只把日志放入队列，后台任务按批次（数量或时间窗口先到者）
+    调用 create_many 写入数据库，请求延迟不再受数据库延迟影响
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        max_batch: int = 500,
+        flush_interval: float = 0.05,
+        max_queue_size: int = 10000,
+        max_body_size: int = _TRUNCATE_LIMITS["request_body"],
+    ):
+        """
+        Args:
+            db: 数据库管理器
+            max_batch: 每批最多写入的日志条数
+            flush_interval: 收到第一条日志后最长等待凑批的时间（秒）
+            max_queue_size: 队列上限，超出时丢弃新日志
+            max_body_size: 请求/响应体记录上限（字符，0 表示不记录请求/响应体）
+        """
+        self.db = db
+        self._limits = {
+            **_TRUNCATE_LIMITS,
+            "request_body": min(max_body_size, _TRUNCATE_LIMITS["request_body"]),
+            "response_body": min(max_body_size, _TRUNCATE_LIMITS["response_body"]),
+        }
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """启动后台写入任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, entry: dict) -> None:
+        """
+        放入一条日志（不阻塞）
+
+        Args:
+            entry: 日志字段字典，键与 TunnelRequestLogRepository.create 的参数相同
+        """
+        # 入队前截断超长字段，避免排队期间继续持有完整的大请求/响应体
+        for field, limit in self._limits.items():
+            value = entry.get(field)
+            if value is not None and len(value) > limit:
+                entry[field] = value[:limit] if limit else None
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            logger.warning("请求日志队列已满，丢弃日志")
+
+    async def aclose(self) -> None:
+        """写完队列中剩余的日志后停止后台任务"""
+        if self._task is None:
+            return
+        await self._queue.put(self._STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        """后台循环：凑满一批或等待超时后写入"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is self._STOP:
+                break
+            batch = [entry]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    entry = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        entry = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if entry is self._STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self._write(batch)
+
+    async def _write(self, batch: list[dict]) -> None:
+        """在独立会话中写入一批日志，失败只记录警告"""
+        try:
+            async with self.db.session() as session:
+                await TunnelRequestLogRepository(session).create_many(batch)
+        except Exception as e:
+            logger.warning(f"批量写入请求日志失败: {len(batch)} 条, {e}")
+
+
+class IncrementBuffer:
+    """
+    隧道请求计数合并器
+
+    请求路径只在内存中累加计数，后台任务按固定间隔把累计的增量
+    合并为一条带 CASE 的 UPDATE 写入（见 TunnelRepository.increment_requests_many），
+    避免每个请求一次 UPDATE 及行锁竞争
+    """
+
+    def __init__(self, db: DatabaseManager, flush_interval: float = 0.1):
+        """
+        Args:
+            db: 数据库管理器
+            flush_interval: 写入间隔（秒）
+        """
+        self.db = db
+        self.flush_interval = flush_interval
+        self._counts: Counter[str] = Counter()
+        self._closing = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """启动后台写入任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def add(self, token: str, count: int = 1) -> None:
+        """累加一个隧道的请求计数（不阻塞）"""
+        self._counts[token] += count
+
+    async def aclose(self) -> None:
+        """停止后台任务并写入剩余计数"""
+        self._closing.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """写入当前累计的计数，失败时放回等待下次写入"""
+        if not self._counts:
+            return
+        counts, self._counts = self._counts, Counter()
+        try:
+            async with self.db.session() as session:
+                await TunnelRepository(session).increment_requests_many(counts)
+        except Exception as e:
+            logger.warning(f"写入请求计数失败: {e}")
+            self._counts.update(counts)
+
+    async def _run(self) -> None:
+        """后台循环：按间隔写入，关闭时退出"""
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._closing.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
@@ -28,27 +28,35 @@ WS-Tunnel 服务端 SDK
 """
 
 import asyncio
+import base64
+import hmac
+import itertools
 import json
 import logging
-import re
+import secrets
+import time
 import uuid
+from collections import deque
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Any, AsyncIterator
+from typing import Any, AsyncIterator, Awaitable, Callable
 
 import jwt as pyjwt
+import orjson
 from fastapi import APIRouter, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 
 from .config import TunnelServerConfig
 from .database import DatabaseManager
+from .models import Tunnel
 from .protocol import (
     AuthErrorMessage,
     AuthMessage,
     AuthOkMessage,
+    FEATURE_BINARY_TCP,
     MessageType,
+    PING_FRAME,
     PingMessage,
-    PongMessage,
     TunnelRequest,
     TunnelResponse,
     StreamStartMessage,
@@ -57,12 +65,77 @@ from .protocol import (
     TcpConnectMessage,
     TcpDataMessage,
     TcpCloseMessage,
+    decode_tcp_data_frame,
+    dump_message,
+    encode_tcp_data_frame,
     parse_message,
+    parse_trusted_message,
+)
+from .repository import (
+    IncrementBuffer,
+    RequestLogWriter,
+    TunnelCache,
+    TunnelRepository,
+    TunnelRequestLogRepository,
+    TunnelSnapshot,
 )
-from .repository import TunnelRepository, TunnelRequestLogRepository
 
 logger = logging.getLogger(__name__)
 
+# 内容固定的认证失败消息，导入时序列化一次
+_AUTH_ERROR_EXPECTED_AUTH = AuthErrorMessage(error="Expected auth message").model_dump_json()
+_AUTH_ERROR_NO_DATABASE = AuthErrorMessage(error="Database not initialized").model_dump_json()
+_AUTH_ERROR_INVALID_TOKEN = AuthErrorMessage(error="Invalid token").model_dump_json()
+_AUTH_ERROR_DISABLED = AuthErrorMessage(error="Tunnel is disabled").model_dump_json()
+
+# 域名允许的字符
+_DOMAIN_CHARS = b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-"
+
+
+def _valid_domain(name: str) -> bool:
+    """域名格式：字母数字开头，可包含中划线，长度 1-63"""
+    if not 1 <= len(name) <= 63 or not name.isascii() or name[0] == "-":
+        return False
+    # 删除所有允许的字符后应为空（bytes.translate 在 C 层逐字节查表）
+    return not name.encode().translate(None, _DOMAIN_CHARS)
+
+
+
+def _dump_body(body: Any) -> str:
+    """
+    序列化转发请求体
+
+    优先使用 orjson（C 实现，比标准库快一个数量级，大请求体不再长时间占用事件循环）；
+    orjson 不支持的值（如超过 64 位的整数）回退到标准库。
+    """
+    try:
+        return orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS).decode()
+    except TypeError:
+        return json.dumps(body)
+
+
+def _request_body(body: Any, body_is_json: bool) -> str | None:
+    """生成 TunnelRequest.body：已是 JSON 文本的请求体原样使用，其余序列化为 JSON"""
+    if not body:
+        return None
+    if body_is_json:
+        return body
+    return _dump_body(body)
+
+
+# 单个帧格式错误时可能抛出的异常：丢弃该帧，不断开隧道
+_MALFORMED_FRAME_ERRORS = (ValueError, TypeError, AttributeError, KeyError)
+
+
+# 请求 ID：进程随机前缀 + 自增计数，只需在本进程待响应请求中唯一
+_RID_PREFIX = secrets.token_hex(4)
+_rid_counter = itertools.count()
+
+
+def _next_request_id() -> str:
+    """生成请求 ID（不读取系统随机数，避免每个请求一次 getrandom）"""
+    return f"{_RID_PREFIX}{next(_rid_counter):x}"
+
 
 # ============== 数据结构 ==============
 
@@ -75,30 +148,38 @@ class ActiveConnection:
     tunnel_id: int
     domain: str
     token: str
-    connected_at: datetime = field(default_factory=datetime.now)
-    last_heartbeat: datetime = field(default_factory=datetime.now)
+    connected_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    # 单调时钟（与事件循环 loop.time() 同源），只用于计算间隔
+    last_heartbeat: float = field(default_factory=time.monotonic)
+    binary_tcp: bool = False  # 是否已协商 TCP 数据使用二进制帧
 
 
-@dataclass
+@dataclass(slots=True)
 class PendingRequest:
-    """待响应的请求（普通响应）"""
+    """待响应的请求（普通响应）
+
+    客户端可能以流式消息返回大响应，此时在这里累积数据块，
+    收到 StreamEndMessage 后再组装为 TunnelResponse。
+    """
 
     request_id: str
     future: asyncio.Future
-    created_at: datetime = field(default_factory=datetime.now)
+    stream_start: StreamStartMessage | None = None
+    chunks: list[str] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class PendingStreamRequest:
     """待响应的流式请求（SSE 支持）"""
 
     request_id: str
-    queue: asyncio.Queue  # 存储流式数据块
+    buffer: deque  # 存储流式消息（有界环形缓冲，满时自动丢弃最旧的一条）
+    event: asyncio.Event = field(default_factory=asyncio.Event)  # 有新消息时置位
     started: bool = False
     ended: bool = False
     start_message: StreamStartMessage | None = None
     end_message: StreamEndMessage | None = None
-    created_at: datetime = field(default_factory=datetime.now)
+    dropped: int = 0  # 缓冲满时丢弃的数据块数（开始消息会补发，不计入）
 
 
 @dataclass
@@ -111,11 +192,11 @@ class TcpConnectionState:
     writer: asyncio.StreamWriter
     read_task: asyncio.Task | None = None
     websocket: WebSocket | None = None
-    created_at: datetime = field(default_factory=datetime.now)
+    created_at: float = field(default_factory=time.monotonic)
     closed: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class PendingTcpRequest:
     """待响应的 TCP 请求（HTTP 触发的 TCP 转发）
 
@@ -126,15 +207,15 @@ class PendingTcpRequest:
     1. _forward_tcp 创建 PendingTcpRequest（含 Future）
     2. 发送 TcpConnectMessage + TcpDataMessage 给客户端
     3. 客户端建立到目标的真实 TCP 连接，转发数据
-    4. 客户端返回 TcpDataMessage（目标的响应数据）→ 累积到 chunks
+    4. 客户端返回 TcpDataMessage（目标的响应数据）→ 追加到 buffer
     5. 客户端返回 TcpCloseMessage → 解析 Future
     6. _forward_tcp 收到 Future 结果，返回累积的数据
     """
 
     conn_id: str
     future: asyncio.Future
-    chunks: list[bytes] = field(default_factory=list)
-    created_at: datetime = field(default_factory=datetime.now)
+    # 数据到达即原地追加，不保留各帧对象，完成时无需再 join 一遍
+    buffer: bytearray = field(default_factory=bytearray)
 
 
 # ============== 请求/响应模型 ==============
@@ -178,6 +259,22 @@ class TunnelInfo(BaseModel):
     total_requests: int = 0
 
 
+def _tunnel_info(tunnel: Tunnel, connected: bool) -> TunnelInfo:
+    """由数据库行构造 TunnelInfo（字段来自数据库，类型可信，跳过校验）"""
+    return TunnelInfo.model_construct(
+        domain=tunnel.domain,
+        name=tunnel.name,
+        description=tunnel.description,
+        enabled=tunnel.enabled,
+        connected=connected,
+        created_at=tunnel.created_at.isoformat() if tunnel.created_at else None,
+        last_connected_at=(
+            tunnel.last_connected_at.isoformat() if tunnel.last_connected_at else None
+        ),
+        total_requests=tunnel.total_requests,
+    )
+
+
 class UpdateTunnelRequest(BaseModel):
     """更新隧道请求"""
 
@@ -221,9 +318,15 @@ class TunnelManager:
     隧道管理器
 
     管理所有活跃的隧道连接和待响应的请求
+
+    所有状态只在事件循环线程中访问，两次 await 之间的字典操作天然原子，
+    因此使用普通字典、不加锁也不分片（分片只会给每次查找多一次取模和索引）。
     """
 
-    def __init__(self):
+    def __init__(self, stream_queue_size: int = 1000):
+        # 每个流式请求缓冲的最大消息数，超出时丢弃最旧的数据块
+        self._stream_queue_size = stream_queue_size
+
         # token → ActiveConnection
         self._connections: dict[str, ActiveConnection] = {}
 
@@ -242,7 +345,13 @@ class TunnelManager:
         # conn_id → PendingTcpRequest（TCP 模式 - HTTP 触发的 TCP 转发）
         self._pending_tcp_requests: dict[str, PendingTcpRequest] = {}
 
-        self._lock = asyncio.Lock()
+        # 后台关闭被替换连接的任务，持有引用避免被回收，关闭时等待完成
+        self._background_tasks: set[asyncio.Task] = set()
+
+    async def aclose(self) -> None:
+        """等待后台任务（关闭被替换的旧连接）完成"""
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
 
     async def register(
         self,
@@ -251,6 +360,7 @@ class TunnelManager:
         domain: str,
         token: str,
         force: bool = False,
+        binary_tcp: bool = False,
     ) -> tuple[bool, str | None]:
         """
         注册隧道连接
@@ -261,57 +371,77 @@ class TunnelManager:
             domain: 隧道域名
             token: 隧道令牌
             force: 是否强制抢占已有连接
+            binary_tcp: TCP 数据是否使用二进制帧
             
         Returns:
             (success, error_message) - 成功返回 (True, None)，失败返回 (False, error_message)
         """
-        async with self._lock:
-            # 检查是否已有连接
-            if token in self._connections:
-                old_conn = self._connections[token]
-                
-                # 检查旧连接是否健康（通过检查 WebSocket 状态）
-                try:
-                    is_healthy = old_conn.websocket.client_state.name == "CONNECTED"
-                except Exception:
-                    is_healthy = False
-                
-                if is_healthy and not force:
-                    seconds_since_heartbeat = (datetime.now() - old_conn.last_heartbeat).total_seconds()
-                    
-                    if seconds_since_heartbeat < 120:
-                        logger.warning(f"拒绝新连接: domain={domain}，已有活跃连接 (上次心跳 {seconds_since_heartbeat:.0f}s 前)")
-                        return (False, f"已有活跃连接存在，使用 --force 参数可强制抢占")
-                    else:
-                        logger.info(f"旧连接可能已过期 (上次心跳 {seconds_since_heartbeat:.0f}s 前)，自动替换: domain={domain}")
-                        force = True
-                
-                # 关闭旧连接（不健康或强制抢占或过期）
-                try:
-                    await old_conn.websocket.close(code=1000, reason="New connection (force)" if force else "Connection replaced")
-                except Exception:
-                    pass
-                logger.info(f"关闭旧连接: domain={domain}, force={force}")
+        # 单线程事件循环中，两次 await 之间的字典操作是原子的，无需加锁
+        old_conn = self._connections.get(token)
+        if old_conn is not None:
+            # 检查旧连接是否健康（通过检查 WebSocket 状态）
+            try:
+                is_healthy = old_conn.websocket.client_state.name == "CONNECTED"
+            except Exception:
+                is_healthy = False
 
-            conn = ActiveConnection(
-                websocket=websocket,
-                tunnel_id=tunnel_id,
-                domain=domain,
-                token=token,
-            )
-            self._connections[token] = conn
-            self._domain_token_map[domain] = token
+            if is_healthy and not force:
+                seconds_since_heartbeat = time.monotonic() - old_conn.last_heartbeat
+
+                if seconds_since_heartbeat < 120:
+                    logger.warning(f"拒绝新连接: domain={domain}，已有活跃连接 (上次心跳 {seconds_since_heartbeat:.0f}s 前)")
+                    return (False, f"已有活跃连接存在，使用 --force 参数可强制抢占")
+                else:
+                    logger.info(f"旧连接可能已过期 (上次心跳 {seconds_since_heartbeat:.0f}s 前)，自动替换: domain={domain}")
+                    force = True
+
+        conn = ActiveConnection(
+            websocket=websocket,
+            tunnel_id=tunnel_id,
+            domain=domain,
+            token=token,
+            binary_tcp=binary_tcp,
+        )
+        # 先替换映射，再在后台关闭旧连接，避免慢速 close 阻塞新的注册
+        self._connections[token] = conn
+        self._domain_token_map[domain] = token
+
+        if old_conn is not None:
+            if old_conn.domain != domain and self._domain_token_map.get(old_conn.domain) == token:
+                self._domain_token_map.pop(old_conn.domain, None)
+            reason = "New connection (force)" if force else "Connection replaced"
+            task = asyncio.create_task(self._close_replaced(old_conn, reason))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+            logger.info(f"关闭旧连接: domain={domain}, force={force}")
+
+        logger.info(f"隧道已连接: domain={domain}")
+        return (True, None)
 
-            logger.info(f"隧道已连接: domain={domain}")
-            return (True, None)
+    @staticmethod
+    async def _close_replaced(conn: ActiveConnection, reason: str) -> None:
+        """关闭被替换的旧连接"""
+        try:
+            await conn.websocket.close(code=1000, reason=reason)
+        except Exception:
+            pass
 
-    async def unregister(self, token: str) -> None:
-        """注销隧道连接"""
-        async with self._lock:
-            conn = self._connections.pop(token, None)
-            if conn:
-                self._domain_token_map.pop(conn.domain, None)
-                logger.info(f"隧道已断开: domain={conn.domain}")
+    async def unregister(self, token: str, websocket: WebSocket | None = None) -> None:
+        """
+        注销隧道连接
+
+        Args:
+            token: 隧道令牌
+            websocket: 若指定，仅当当前连接仍是该 WebSocket 时才注销
+                （避免被替换的旧连接在退出时注销新连接）
+        """
+        conn = self._connections.get(token)
+        if conn is None or (websocket is not None and conn.websocket is not websocket):
+            return
+        del self._connections[token]
+        if self._domain_token_map.get(conn.domain) == token:
+            del self._domain_token_map[conn.domain]
+        logger.info(f"隧道已断开: domain={conn.domain}")
 
     def get_connection_by_domain(self, domain: str) -> ActiveConnection | None:
         """根据域名获取连接"""
@@ -332,9 +462,14 @@ class TunnelManager:
         """列出所有已连接的域名"""
         return list(self._domain_token_map.keys())
 
+    @property
+    def pending_count(self) -> int:
+        """等待响应的请求数（普通 + 流式）"""
+        return len(self._pending_requests) + len(self._pending_stream_requests)
+
     async def create_pending_request(self, request_id: str) -> asyncio.Future:
         """创建待响应的请求（普通响应）"""
-        future = asyncio.get_event_loop().create_future()
+        future = asyncio.get_running_loop().create_future()
         self._pending_requests[request_id] = PendingRequest(
             request_id=request_id,
             future=future,
@@ -347,6 +482,23 @@ class TunnelManager:
         if pending and not pending.future.done():
             pending.future.set_result(response)
             return True
+        if request_id in self._pending_stream_requests:
+            # 流式请求收到了普通响应：转换为 start + chunk + end
+            await self.handle_stream_start(
+                StreamStartMessage(id=request_id, status=response.status, headers=response.headers)
+            )
+            if response.body:
+                await self.handle_stream_chunk(
+                    StreamChunkMessage(id=request_id, data=response.body)
+                )
+            return await self.handle_stream_end(
+                StreamEndMessage(
+                    id=request_id,
+                    error=response.error,
+                    duration_ms=response.duration_ms,
+                    total_chunks=1 if response.body else 0,
+                )
+            )
         return False
 
     async def fail_request(self, request_id: str, error: str) -> bool:
@@ -358,7 +510,7 @@ class TunnelManager:
         # 也检查流式请求
         stream_pending = self._pending_stream_requests.pop(request_id, None)
         if stream_pending:
-            await stream_pending.queue.put(None)  # 发送结束信号
+            self._offer(stream_pending, None)  # 发送结束信号
             return True
         return False
 
@@ -366,7 +518,7 @@ class TunnelManager:
         """更新心跳时间"""
         conn = self._connections.get(token)
         if conn:
-            conn.last_heartbeat = datetime.now()
+            conn.last_heartbeat = time.monotonic()
 
     # ============== 流式请求支持（SSE） ==============
 
@@ -374,18 +526,41 @@ class TunnelManager:
         """创建待响应的流式请求"""
         pending = PendingStreamRequest(
             request_id=request_id,
-            queue=asyncio.Queue(),
+            buffer=deque(maxlen=self._stream_queue_size),
         )
         self._pending_stream_requests[request_id] = pending
         return pending
 
+    @staticmethod
+    def _offer(pending: PendingStreamRequest, item: Any) -> None:
+        """
+        放入流式消息，缓冲满时丢弃最旧的一条
+
+        消费者过慢时不阻塞 WebSocket 读取循环，单个请求的内存占用有上限。
+        被丢弃的开始消息已保存在 pending.start_message，由 forward_stream 补发；
+        丢弃的数据块计入 pending.dropped，由 forward_stream 在结束消息中报告。
+        只在缓冲由空变为非空时需要唤醒消费者，Event.set() 对已置位的事件是空操作。
+        """
+        buffer = pending.buffer
+        if len(buffer) == buffer.maxlen and buffer[0] is not pending.start_message:
+            pending.dropped += 1
+            if pending.dropped == 1:
+                logger.warning(f"流式响应消费过慢，开始丢弃最旧的数据块: {pending.request_id}")
+        buffer.append(item)
+        pending.event.set()
+
     async def handle_stream_start(self, message: StreamStartMessage) -> bool:
         """处理流式响应开始"""
         pending = self._pending_stream_requests.get(message.id)
         if pending:
             pending.started = True
             pending.start_message = message
-            await pending.queue.put(message)
+            self._offer(pending, message)
+            return True
+        # 普通请求的大响应以流式消息返回
+        buffered = self._pending_requests.get(message.id)
+        if buffered:
+            buffered.stream_start = message
             return True
         return False
 
@@ -393,7 +568,11 @@ class TunnelManager:
         """处理流式数据块"""
         pending = self._pending_stream_requests.get(message.id)
         if pending and pending.started and not pending.ended:
-            await pending.queue.put(message)
+            self._offer(pending, message)
+            return True
+        buffered = self._pending_requests.get(message.id)
+        if buffered and buffered.stream_start:
+            buffered.chunks.append(message.data)
             return True
         return False
 
@@ -403,10 +582,24 @@ class TunnelManager:
         if pending:
             pending.ended = True
             pending.end_message = message
-            await pending.queue.put(message)
-            await pending.queue.put(None)  # 发送结束信号
+            self._offer(pending, message)
+            self._offer(pending, None)  # 发送结束信号
             # 注意：不立即删除，等迭代器完成后再清理
             return True
+        buffered = self._pending_requests.get(message.id)
+        if buffered and buffered.stream_start:
+            # 组装为完整的普通响应
+            return await self.complete_request(
+                message.id,
+                TunnelResponse(
+                    id=message.id,
+                    status=buffered.stream_start.status,
+                    headers=buffered.stream_start.headers,
+                    body="".join(buffered.chunks),
+                    error=message.error,
+                    duration_ms=message.duration_ms,
+                ),
+            )
         return False
 
     async def cleanup_stream_request(self, request_id: str) -> None:
@@ -475,7 +668,7 @@ class TunnelManager:
 
     async def create_pending_tcp_request(self, conn_id: str) -> asyncio.Future:
         """创建待响应的 TCP 请求"""
-        future = asyncio.get_event_loop().create_future()
+        future = asyncio.get_running_loop().create_future()
         self._pending_tcp_requests[conn_id] = PendingTcpRequest(
             conn_id=conn_id,
             future=future,
@@ -487,7 +680,7 @@ class TunnelManager:
         pending = self._pending_tcp_requests.get(conn_id)
         if not pending:
             return False
-        pending.chunks.append(data)
+        pending.buffer += data
         return True
 
     async def complete_tcp_request(self, conn_id: str, error: str | None = None) -> bool:
@@ -497,9 +690,8 @@ class TunnelManager:
             if error:
                 pending.future.set_result({"error": error, "data": b""})
             else:
-                # 合并所有数据块
-                full_data = b"".join(pending.chunks)
-                pending.future.set_result({"error": None, "data": full_data})
+                # 直接交出累积的缓冲区，不再复制
+                pending.future.set_result({"error": None, "data": pending.buffer})
             return True
         return False
 
@@ -526,17 +718,53 @@ class TunnelServer:
     def __init__(self, config: TunnelServerConfig | None = None):
         self.config = config or TunnelServerConfig()
         self.db: DatabaseManager | None = None
-        self.manager = TunnelManager()
+        self._log_writer: RequestLogWriter | None = None
+        self._request_counts: IncrementBuffer | None = None
+        self._tunnel_cache = TunnelCache(ttl=self.config.tunnel_cache_ttl)
+        # 后台写入任务（持有引用防止被回收，关闭时等待完成）
+        self._background_tasks: set[asyncio.Task] = set()
+        admin_key = self.config.admin_api_key
+        self._admin_key_bytes = admin_key.encode() if admin_key else None
+        self.manager = TunnelManager(stream_queue_size=self.config.stream_queue_size)
         self.router = APIRouter(tags=["Tunnel"])
         self._tcp_server: asyncio.Server | None = None
+        self._prune_task: asyncio.Task | None = None
+
+        # type 字段值 → 客户端消息处理函数，统一签名 (token, message)
+        manager = self.manager
+        self._message_handlers: dict[str, Callable[[str, Any], Awaitable[Any]]] = {
+            MessageType.PONG.value: lambda token, msg: manager.update_heartbeat(token),
+            MessageType.RESPONSE.value: lambda token, msg: manager.complete_request(msg.id, msg),
+            # 流式消息（SSE 支持）
+            MessageType.STREAM_START.value: lambda token, msg: manager.handle_stream_start(msg),
+            MessageType.STREAM_CHUNK.value: lambda token, msg: manager.handle_stream_chunk(msg),
+            MessageType.STREAM_END.value: lambda token, msg: manager.handle_stream_end(msg),
+            # TCP 消息
+            MessageType.TCP_DATA.value: lambda token, msg: self._handle_tcp_data_from_client(msg),
+            MessageType.TCP_CLOSE.value: lambda token, msg: self._handle_tcp_close_from_client(msg),
+        }
 
         # 注册路由
         self._register_routes()
 
     async def initialize(self) -> None:
         """初始化服务器"""
-        self.db = DatabaseManager(self.config.database_url)
+        self.db = DatabaseManager(self.config.database_url, self.config.read_database_url)
         await self.db.initialize()
+        self._log_writer = RequestLogWriter(
+            self.db,
+            max_batch=self.config.log_batch_size,
+            flush_interval=self.config.log_flush_interval,
+            max_queue_size=self.config.log_queue_size,
+            max_body_size=self.config.log_body_limit,
+        )
+        self._log_writer.start()
+        self._request_counts = IncrementBuffer(
+            self.db, flush_interval=self.config.request_count_flush_interval
+        )
+        self._request_counts.start()
+        if self.config.log_retention_days is not None:
+            self._prune_task = asyncio.create_task(self._prune_logs_loop())
         logger.info("TunnelServer 初始化完成")
 
         # 如果配置了 TCP 监听端口，启动 TCP 监听
@@ -550,10 +778,35 @@ class TunnelServer:
             self._tcp_server.close()
             await self._tcp_server.wait_closed()
             logger.info("TCP 监听器已关闭")
+        if self._prune_task:
+            self._prune_task.cancel()
+            await asyncio.gather(self._prune_task, return_exceptions=True)
+        # 先写完队列中的请求日志和计数再关闭数据库
+        if self._log_writer:
+            await self._log_writer.aclose()
+        if self._request_counts:
+            await self._request_counts.aclose()
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await self.manager.aclose()
         if self.db:
             await self.db.close()
         logger.info("TunnelServer 已关闭")
 
+    async def _prune_logs_loop(self, interval: float = 3600.0) -> None:
+        """定期清理超过保留期的请求日志"""
+        while True:
+            try:
+                async with self.db.session() as session:
+                    deleted = await TunnelRequestLogRepository(session).prune_older_than(
+                        self.config.log_retention_days
+                    )
+                if deleted:
+                    logger.info(f"已清理过期请求日志: {deleted} 条")
+            except Exception as e:
+                logger.warning(f"清理请求日志失败: {e}")
+            await asyncio.sleep(interval)
+
     def _register_routes(self) -> None:
         """注册路由"""
 
@@ -632,11 +885,17 @@ class TunnelServer:
         async def get_tunnel_logs(
             domain: str,
             limit: int = Query(100, ge=1, le=1000),
-            offset: int = Query(0, ge=0),
+            offset: int = Query(0, ge=0, description="已弃用，请使用 after 游标"),
+            after: str | None = Query(None, description="上一页返回的 next_cursor"),
+            include_total: bool = Query(
+                True, description="是否返回总数（大表上 COUNT 较慢，翻页时可关闭）"
+            ),
             x_api_key: str | None = Header(None, alias="x-api-key"),
         ):
             """获取隧道请求历史日志"""
-            return await self._get_tunnel_logs(domain, limit, offset, x_api_key)
+            return await self._get_tunnel_logs(
+                domain, limit, offset, x_api_key, after=after, include_total=include_total
+            )
 
         @self.router.get("/api/info")
         async def get_server_info():
@@ -667,18 +926,16 @@ class TunnelServer:
             return result
 
     def _check_admin_api_key(self, api_key: str | None) -> None:
-        """检查管理 API 密钥"""
-        if self.config.admin_api_key:
-            if api_key != self.config.admin_api_key:
-                raise HTTPException(status_code=401, detail="Invalid API key")
-
-    # 域名格式：字母数字开头，可包含中划线，长度 1-63
-    DOMAIN_PATTERN = re.compile(r"^[a-zA-Z0-9][-a-zA-Z0-9]{0,62}$")
+        """检查管理 API 密钥（常量时间比较，避免按耗时逐字节猜测密钥）"""
+        if self._admin_key_bytes and not hmac.compare_digest(
+            (api_key or "").encode(), self._admin_key_bytes
+        ):
+            raise HTTPException(status_code=401, detail="Invalid API key")
 
     async def _check_availability(self, name: str) -> CheckAvailabilityResponse:
         """检查隧道名称是否可用"""
         # 验证格式
-        if not self.DOMAIN_PATTERN.match(name):
+        if not _valid_domain(name):
             return CheckAvailabilityResponse(
                 available=False,
                 name=name,
@@ -689,7 +946,7 @@ class TunnelServer:
             raise HTTPException(status_code=500, detail="Database not initialized")
 
         async with self.db.session() as session:
-            repo = TunnelRepository(session)
+            repo = TunnelRepository(session, cache=self._tunnel_cache)
             existing = await repo.get_by_domain(name)
 
             if existing:
@@ -711,6 +968,8 @@ class TunnelServer:
 
         token: str | None = None
         tunnel_domain: str | None = None
+        success = False
+        monitor_task: asyncio.Task | None = None
 
         try:
             # 等待认证消息
@@ -718,13 +977,11 @@ class TunnelServer:
                 websocket.receive_text(),
                 timeout=30.0,
             )
-            data = json.loads(raw_message)
+            data = orjson.loads(raw_message)
             message = parse_message(data)
 
             if not isinstance(message, AuthMessage):
-                await websocket.send_text(
-                    AuthErrorMessage(error="Expected auth message").model_dump_json()
-                )
+                await websocket.send_text(_AUTH_ERROR_EXPECTED_AUTH)
                 await websocket.close(code=1008)
                 return
 
@@ -732,87 +989,83 @@ class TunnelServer:
 
             # 验证令牌
             if not self.db:
-                await websocket.send_text(
-                    AuthErrorMessage(error="Database not initialized").model_dump_json()
-                )
+                await websocket.send_text(_AUTH_ERROR_NO_DATABASE)
                 await websocket.close(code=1011)
                 return
 
-            async with self.db.session() as session:
-                repo = TunnelRepository(session)
-                tunnel = await repo.get_by_token(token)
+            tunnel = await self._authenticate(token)
 
-                if not tunnel:
-                    await websocket.send_text(
-                        AuthErrorMessage(error="Invalid token").model_dump_json()
-                    )
-                    await websocket.close(code=1008)
-                    return
-
-                if not tunnel.enabled:
-                    await websocket.send_text(
-                        AuthErrorMessage(error="Tunnel is disabled").model_dump_json()
-                    )
-                    await websocket.close(code=1008)
-                    return
+            if not tunnel:
+                await websocket.send_text(_AUTH_ERROR_INVALID_TOKEN)
+                await websocket.close(code=1008)
+                return
 
-                tunnel_domain = tunnel.domain
+            if not tunnel.enabled:
+                await websocket.send_text(_AUTH_ERROR_DISABLED)
+                await websocket.close(code=1008)
+                return
 
-                # 更新最后连接时间
-                await repo.update_last_connected(token)
+            tunnel_domain = tunnel.domain
 
-                # 尝试注册连接
-                force = getattr(message, 'force', False)
-                success, error = await self.manager.register(
-                    websocket=websocket,
-                    tunnel_id=tunnel.id,
-                    domain=tunnel.domain,
-                    token=token,
-                    force=force,
-                )
-                
-                if not success:
-                    await websocket.send_text(
-                        AuthErrorMessage(
-                            error=error or "Connection rejected",
-                            code="connection_exists",
-                        ).model_dump_json()
-                    )
-                    await websocket.close(code=1008)
-                    return
+            # 尝试注册连接
+            force = getattr(message, 'force', False)
+            binary_tcp = FEATURE_BINARY_TCP in message.features
+            success, error = await self.manager.register(
+                websocket=websocket,
+                tunnel_id=tunnel.id,
+                domain=tunnel.domain,
+                token=token,
+                force=force,
+                binary_tcp=binary_tcp,
+            )
 
-                # 发送认证成功
+            if not success:
                 await websocket.send_text(
-                    AuthOkMessage(
-                        domain=tunnel.domain,
-                        tunnel_id=str(tunnel.id),
+                    AuthErrorMessage(
+                        error=error or "Connection rejected",
+                        code="connection_exists",
                     ).model_dump_json()
                 )
+                await websocket.close(code=1008)
+                return
 
-            # 处理消息循环
+            # 发送认证成功
+            await websocket.send_text(
+                AuthOkMessage(
+                    domain=tunnel.domain,
+                    tunnel_id=str(tunnel.id),
+                    features=[FEATURE_BINARY_TCP] if binary_tcp else [],
+                ).model_dump_json()
+            )
+
+            monitor_task = asyncio.create_task(self._monitor_heartbeat(websocket, token))
+
+            # 处理消息循环：直接读取 ASGI 帧（文本帧为 JSON 消息、二进制帧为 TCP 数据），
+            # 不使用 iter_text()，它遇到二进制帧会出错
             while True:
-                raw_message = await websocket.receive_text()
-                data = json.loads(raw_message)
-                message = parse_message(data)
-
-                if isinstance(message, PongMessage):
-                    await self.manager.update_heartbeat(token)
-                elif isinstance(message, TunnelResponse):
-                    await self.manager.complete_request(message.id, message)
-                # 流式消息处理（SSE 支持）
-                elif isinstance(message, StreamStartMessage):
-                    await self.manager.handle_stream_start(message)
-                elif isinstance(message, StreamChunkMessage):
-                    await self.manager.handle_stream_chunk(message)
-                elif isinstance(message, StreamEndMessage):
-                    await self.manager.handle_stream_end(message)
-                # TCP 消息处理
-                elif isinstance(message, TcpDataMessage):
-                    await self._handle_tcp_data_from_client(message)
-                elif isinstance(message, TcpCloseMessage):
-                    await self._handle_tcp_close_from_client(message)
-                else:
-                    logger.warning(f"未知消息类型: {type(message)}")
+                frame = await websocket.receive()
+                if frame["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(frame.get("code", 1000))
+
+                # 单个格式错误的帧只丢弃并记录，不断开整个隧道
+                try:
+                    binary = frame.get("bytes")
+                    if binary is not None:
+                        # 二进制帧只用于 TCP 数据
+                        conn_id, _, payload = decode_tcp_data_frame(binary)
+                        await self._route_tcp_data(conn_id, payload)
+                        continue
+
+                    data = orjson.loads(frame["text"])
+                    # 已认证的客户端：流式消息和心跳跳过校验直接构造
+                    message = parse_trusted_message(data)
+                    handler = self._message_handlers.get(data["type"])
+                    if handler:
+                        await handler(token, message)
+                    else:
+                        logger.warning(f"未知消息类型: {type(message)}")
+                except _MALFORMED_FRAME_ERRORS as e:
+                    logger.warning(f"丢弃无法解析的消息: domain={tunnel_domain}, error={e!r}")
 
         except WebSocketDisconnect:
             logger.info(f"WebSocket 断开: domain={tunnel_domain}")
@@ -825,8 +1078,78 @@ class TunnelServer:
         except Exception as e:
             logger.error(f"WebSocket 错误: {e}", exc_info=True)
         finally:
+            if monitor_task:
+                monitor_task.cancel()
             if token and success:
-                await self.manager.unregister(token)
+                await self.manager.unregister(token, websocket)
+
+    async def _authenticate(self, token: str) -> TunnelSnapshot | None:
+        """
+        查询令牌对应的隧道并记录连接时间
+
+        认证始终以主库为准：进程内缓存可能滞后于其他进程的禁用或令牌重置。
+        - 缓存命中（多为快速重连）：握手只做一次主库查询，最后连接时间在后台更新
+        - 未命中：一次 UPDATE ... RETURNING 完成查询与更新，并回填缓存
+        会话只覆盖数据库读写，网络发送和注册都在会话关闭后进行，不占用连接池。
+        """
+        cached = self._tunnel_cache.get(("token", token))
+        async with self.db.session() as session:
+            repo = TunnelRepository(session, cache=self._tunnel_cache)
+            if cached is None:
+                return await repo.authenticate(token)
+            tunnel = await repo.get_by_token(token)
+            snapshot = TunnelSnapshot.from_tunnel(tunnel) if tunnel else None
+
+        if snapshot is None or snapshot != cached:
+            self._tunnel_cache.invalidate(token=token)
+        if snapshot is not None and snapshot.enabled:
+            task = asyncio.create_task(self._touch_last_connected(token))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        return snapshot
+
+    async def _touch_last_connected(self, token: str) -> None:
+        """后台更新最后连接时间，失败只记录警告"""
+        try:
+            async with self.db.session() as session:
+                await TunnelRepository(session).update_last_connected(token)
+        except Exception as e:
+            logger.warning(f"更新最后连接时间失败: {e}")
+
+    async def _monitor_heartbeat(self, websocket: WebSocket, token: str) -> None:
+        """
+        定期向客户端发送心跳
+
+        连续多次（heartbeat_timeout / heartbeat_interval，默认 3 次）未收到 pong 时
+        注销并关闭连接，避免半开连接一直占用域名和待响应请求。
+        """
+        interval = self.config.heartbeat_interval
+        max_misses = max(1, self.config.heartbeat_timeout // interval)
+        misses = 0
+        while True:
+            sent_at = time.monotonic()
+            try:
+                await websocket.send_text(PING_FRAME)
+            except Exception:
+                return
+            await asyncio.sleep(interval)
+
+            conn = self.manager.get_connection_by_token(token)
+            if conn is None or conn.websocket is not websocket:
+                return
+            if conn.last_heartbeat >= sent_at:
+                misses = 0
+                continue
+
+            misses += 1
+            if misses >= max_misses:
+                logger.warning(f"连续 {misses} 次未收到心跳响应，断开连接: domain={conn.domain}")
+                await self.manager.unregister(token, websocket)
+                try:
+                    await websocket.close(code=1011, reason="Heartbeat timeout")
+                except Exception:
+                    pass
+                return
 
     def _verify_jwt_token(self, authorization: str | None) -> dict | None:
         """验证 JWT Bearer token，返回 payload 或 None"""
@@ -869,7 +1192,7 @@ class TunnelServer:
             raise HTTPException(status_code=500, detail="Database not initialized")
 
         async with self.db.session() as session:
-            repo = TunnelRepository(session)
+            repo = TunnelRepository(session, cache=self._tunnel_cache)
 
             # 检查域名是否已存在
             existing = await repo.get_by_domain(request.domain)
@@ -898,26 +1221,13 @@ class TunnelServer:
         if not self.db:
             raise HTTPException(status_code=500, detail="Database not initialized")
 
-        async with self.db.session() as session:
-            repo = TunnelRepository(session)
+        async with self.db.read_session() as session:
+            repo = TunnelRepository(session, cache=self._tunnel_cache)
             # 移除 limit 限制，返回所有隧道（原默认 limit=100）
             tunnels = await repo.list_all(limit=999999)
 
-            return [
-                TunnelInfo(
-                    domain=t.domain,
-                    name=t.name,
-                    description=t.description,
-                    enabled=t.enabled,
-                    connected=self.manager.is_connected(t.domain),
-                    created_at=t.created_at.isoformat() if t.created_at else None,
-                    last_connected_at=(
-                        t.last_connected_at.isoformat() if t.last_connected_at else None
-                    ),
-                    total_requests=t.total_requests,
-                )
-                for t in tunnels
-            ]
+            connected = set(self.manager.list_connected_domains())
+            return [_tunnel_info(t, t.domain in connected) for t in tunnels]
 
     async def _get_tunnel(self, domain: str, api_key: str | None) -> TunnelInfo:
         """获取隧道详情"""
@@ -926,25 +1236,14 @@ class TunnelServer:
         if not self.db:
             raise HTTPException(status_code=500, detail="Database not initialized")
 
-        async with self.db.session() as session:
-            repo = TunnelRepository(session)
+        async with self.db.read_session() as session:
+            repo = TunnelRepository(session, cache=self._tunnel_cache)
             tunnel = await repo.get_by_domain(domain)
 
             if not tunnel:
                 raise HTTPException(status_code=404, detail="Tunnel not found")
 
-            return TunnelInfo(
-                domain=tunnel.domain,
-                name=tunnel.name,
-                description=tunnel.description,
-                enabled=tunnel.enabled,
-                connected=self.manager.is_connected(tunnel.domain),
-                created_at=tunnel.created_at.isoformat() if tunnel.created_at else None,
-                last_connected_at=(
-                    tunnel.last_connected_at.isoformat() if tunnel.last_connected_at else None
-                ),
-                total_requests=tunnel.total_requests,
-            )
+            return _tunnel_info(tunnel, self.manager.is_connected(tunnel.domain))
 
     async def _update_tunnel(
         self, domain: str, request: UpdateTunnelRequest, api_key: str | None
@@ -955,45 +1254,23 @@ class TunnelServer:
         if not self.db:
             raise HTTPException(status_code=500, detail="Database not initialized")
 
+        # 更新字段
+        update_values = {}
+        if request.name is not None:
+            update_values['name'] = request.name
+        if request.description is not None:
+            update_values['description'] = request.description
+        if request.enabled is not None:
+            update_values['enabled'] = request.enabled
+
         async with self.db.session() as session:
-            repo = TunnelRepository(session)
-            tunnel = await repo.get_by_domain(domain)
+            repo = TunnelRepository(session, cache=self._tunnel_cache)
+            tunnel = await repo.update_fields(domain, **update_values)
 
             if not tunnel:
                 raise HTTPException(status_code=404, detail="Tunnel not found")
 
-            # 更新字段
-            update_values = {}
-            if request.name is not None:
-                update_values['name'] = request.name
-            if request.description is not None:
-                update_values['description'] = request.description
-            if request.enabled is not None:
-                update_values['enabled'] = request.enabled
-                update_values['updated_at'] = datetime.now(timezone.utc)
-
-            if update_values:
-                from sqlalchemy import update as sql_update
-                await session.execute(
-                    sql_update(Tunnel)
-                    .where(Tunnel.domain == domain)
-                    .values(**update_values)
-                )
-                await session.commit()
-                await session.refresh(tunnel)
-
-            return TunnelInfo(
-                domain=tunnel.domain,
-                name=tunnel.name,
-                description=tunnel.description,
-                enabled=tunnel.enabled,
-                connected=self.manager.is_connected(tunnel.domain),
-                created_at=tunnel.created_at.isoformat() if tunnel.created_at else None,
-                last_connected_at=(
-                    tunnel.last_connected_at.isoformat() if tunnel.last_connected_at else None
-                ),
-                total_requests=tunnel.total_requests,
-            )
+            return _tunnel_info(tunnel, self.manager.is_connected(tunnel.domain))
 
     async def _regenerate_token(
         self, domain: str, api_key: str | None
@@ -1005,7 +1282,7 @@ class TunnelServer:
             raise HTTPException(status_code=500, detail="Database not initialized")
 
         async with self.db.session() as session:
-            repo = TunnelRepository(session)
+            repo = TunnelRepository(session, cache=self._tunnel_cache)
             new_token = await repo.regenerate_token(domain)
 
             if not new_token:
@@ -1016,22 +1293,44 @@ class TunnelServer:
             return RegenerateTokenResponse(domain=domain, token=new_token)
 
     async def _get_tunnel_logs(
-        self, domain: str, limit: int, offset: int, api_key: str | None
+        self,
+        domain: str,
+        limit: int,
+        offset: int,
+        api_key: str | None,
+        after: str | None = None,
+        include_total: bool = True,
     ) -> dict:
-        """获取隧道请求历史日志"""
+        """
+        获取隧道请求历史日志（游标分页；offset 仅为兼容旧调用方保留）
+
+        是否有下一页由 next_cursor 表示；include_total=False 时不执行 COUNT，total 为 None
+        """
         self._check_admin_api_key(api_key)
 
         if not self.db:
             raise HTTPException(status_code=500, detail="Database not initialized")
 
-        async with self.db.session() as session:
+        async with self.db.read_session() as session:
             log_repo = TunnelRequestLogRepository(session)
-            logs = await log_repo.get_recent(tunnel_domain=domain, limit=limit, offset=offset)
-            total = await log_repo.count(tunnel_domain=domain)
+            next_cursor = None
+            try:
+                if offset:
+                    logs = await log_repo.get_recent(
+                        tunnel_domain=domain, limit=limit, offset=offset
+                    )
+                else:
+                    logs, next_cursor = await log_repo.get_recent_page(
+                        tunnel_domain=domain, limit=limit, after=after
+                    )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            total = await log_repo.count(tunnel_domain=domain) if include_total else None
 
             return {
                 "total": total,
                 "logs": [log.to_dict() for log in logs],
+                "next_cursor": next_cursor,
             }
 
     async def _delete_tunnel(
@@ -1045,7 +1344,7 @@ class TunnelServer:
             raise HTTPException(status_code=500, detail="Database not initialized")
 
         async with self.db.session() as session:
-            repo = TunnelRepository(session)
+            repo = TunnelRepository(session, cache=self._tunnel_cache)
             
             # 验证权限:Admin API Key 或隧道自己的 Token
             if tunnel_token:
@@ -1076,6 +1375,8 @@ class TunnelServer:
         headers: dict[str, str] | None = None,
         body: Any = None,
         timeout: float = 1800.0,
+        parse_body: bool = True,
+        body_is_json: bool = False,
     ) -> ForwardResponse:
         """
         转发请求到隧道（支持 HTTP 和 TCP 模式）
@@ -1087,6 +1388,9 @@ class TunnelServer:
             headers: 请求头（TCP 模式忽略）
             body: 请求体（TCP 模式为原始二进制数据）
             timeout: 超时时间（秒）
+            parse_body: 是否尝试将响应体解析为 JSON；原样透传响应的调用方传 False，
+                省去解析后再序列化（TCP 模式忽略）
+            body_is_json: body 已是 JSON 文本时传 True，原样放入请求而不再序列化
 
         Returns:
             ForwardResponse
@@ -1099,20 +1403,28 @@ class TunnelServer:
                 error=f"Tunnel not connected: {domain}",
             )
 
+        # 待响应请求过多时直接拒绝，避免内存随积压无限增长
+        if self.manager.pending_count >= self.config.max_pending_requests:
+            return ForwardResponse(status=503, error="overloaded")
+
         # 查询隧道模式
         tunnel_mode = "http"  # 默认 HTTP 模式（向后兼容）
-        if self.db:
-            async with self.db.session() as session:
-                repo = TunnelRepository(session)
-                tunnel = await repo.get_by_domain(domain)
-                if tunnel:
-                    tunnel_mode = tunnel.mode
+        # 缓存命中时不创建会话，只有未命中才打开只读会话查库
+        tunnel = self._tunnel_cache.get(("domain", domain))
+        if tunnel is None and self.db:
+            async with self.db.read_session() as session:
+                repo = TunnelRepository(session, cache=self._tunnel_cache)
+                tunnel = await repo.get_cached_by_domain(domain)
+        if tunnel:
+            tunnel_mode = tunnel.mode
 
         # 根据模式选择转发方式
         if tunnel_mode == "tcp":
             return await self._forward_tcp(domain, body, timeout)
         else:
-            return await self._forward_http(domain, method, path, headers, body, timeout)
+            return await self._forward_http(
+                domain, method, path, headers, body, timeout, parse_body, body_is_json
+            )
 
     async def _forward_http(
         self,
@@ -1122,161 +1434,92 @@ class TunnelServer:
         headers: dict[str, str] | None,
         body: Any,
         timeout: float,
+        parse_body: bool = True,
+        body_is_json: bool = False,
     ) -> ForwardResponse:
         """HTTP 模式转发（原 forward 方法的逻辑）"""
         conn = self.manager.get_connection_by_domain(domain)
         if not conn:
             return ForwardResponse(status=503, error=f"Tunnel not connected: {domain}")
 
-        request_id = str(uuid.uuid4())
-        request = TunnelRequest(
+        request_id = _next_request_id()
+        # 字段类型已确定，跳过校验直接构造，发送时用 orjson 序列化
+        request = TunnelRequest.model_construct(
             id=request_id,
             method=method,
             path=path,
             headers=headers or {},
-            body=json.dumps(body) if body else None,
+            body=_request_body(body, body_is_json),
             timeout=timeout,
+            allow_stream=True,
         )
 
+        response: TunnelResponse | None = None
+        error_msg: str | None = None
+        duration_ms = 0
         try:
             # 创建 Future 等待响应
             future = await self.manager.create_pending_request(request_id)
 
             # 发送请求
-            await conn.websocket.send_text(request.model_dump_json())
+            await conn.websocket.send_text(dump_message(request))
 
-            # 等待响应
-            start_time = asyncio.get_event_loop().time()
-            response = await asyncio.wait_for(future, timeout=timeout)
-            duration_ms = int((asyncio.get_event_loop().time() - start_time) * 1000)
+            # 等待响应（asyncio.timeout 只挂一个定时器，不像 wait_for 额外包装和回调）
+            loop = asyncio.get_running_loop()
+            start_time = loop.time()
+            async with asyncio.timeout(timeout):
+                response = await future
+            duration_ms = int((loop.time() - start_time) * 1000)
+            status_code = response.status
 
-            # 更新统计和记录日志
-            if self.db:
-                async with self.db.session() as session:
-                    tunnel_repo = TunnelRepository(session)
-                    await tunnel_repo.increment_requests(conn.token)
-                    
-                    # 记录请求日志
-                    log_repo = TunnelRequestLogRepository(session)
-                    try:
-                        response_body_str = None
-                        if response.body:
-                            try:
-                                response_body_str = json.dumps(json.loads(response.body))
-                            except:
-                                response_body_str = str(response.body)[:10000]
-                        
-                        request_body_str = None
-                        if body:
-                            try:
-                                request_body_str = json.dumps(body)
-                            except:
-                                request_body_str = str(body)[:10000]
-                        
-                        await log_repo.create(
-                            tunnel_domain=domain,
-                            method=method,
-                            path=path,
-                            request_headers=headers,
-                            request_body=request_body_str,
-                            status_code=response.status,
-                            response_headers=response.headers,
-                            response_body=response_body_str,
-                            error=response.error,
-                            duration_ms=duration_ms,
-                        )
-                        await session.commit()
-                    except Exception as e:
-                        # 日志记录失败不应该影响请求处理
-                        logger.warning(f"记录请求日志失败: {e}")
-                        await session.rollback()
-
-            # Parse body: try JSON first, fall back to raw string
-            parsed_body = None
-            if response.body:
-                try:
-                    parsed_body = json.loads(response.body)
-                except (json.JSONDecodeError, ValueError):
-                    parsed_body = response.body
-
-            return ForwardResponse(
-                status=response.status,
-                headers=response.headers,
-                body=parsed_body,
-                duration_ms=duration_ms,
-                error=response.error,
-            )
+            # 更新统计（后台合并写入）
+            if self._request_counts:
+                self._request_counts.add(conn.token)
 
         except asyncio.TimeoutError:
             error_msg = "Request timeout"
+            status_code = 504
+            duration_ms = int(timeout * 1000)
             await self.manager.fail_request(request_id, error_msg)
-            
-            # 记录错误日志
-            if self.db:
-                async with self.db.session() as session:
-                    log_repo = TunnelRequestLogRepository(session)
-                    try:
-                        request_body_str = None
-                        if body:
-                            try:
-                                request_body_str = json.dumps(body)
-                            except:
-                                request_body_str = str(body)[:10000]
-                        
-                        await log_repo.create(
-                            tunnel_domain=domain,
-                            method=method,
-                            path=path,
-                            request_headers=headers,
-                            request_body=request_body_str,
-                            status_code=504,
-                            error=error_msg,
-                            duration_ms=int(timeout * 1000),
-                        )
-                        await session.commit()
-                    except Exception as e:
-                        logger.warning(f"记录请求日志失败: {e}")
-                        await session.rollback()
-            
-            return ForwardResponse(
-                status=504,
-                error=error_msg,
-            )
         except Exception as e:
             error_msg = str(e)
+            status_code = 500
             await self.manager.fail_request(request_id, error_msg)
-            
-            # 记录错误日志
-            if self.db:
-                async with self.db.session() as session:
-                    log_repo = TunnelRequestLogRepository(session)
-                    try:
-                        request_body_str = None
-                        if body:
-                            try:
-                                request_body_str = json.dumps(body)
-                            except:
-                                request_body_str = str(body)[:10000]
-                        
-                        await log_repo.create(
-                            tunnel_domain=domain,
-                            method=method,
-                            path=path,
-                            request_headers=headers,
-                            request_body=request_body_str,
-                            status_code=500,
-                            error=error_msg,
-                            duration_ms=0,
-                        )
-                        await session.commit()
-                    except Exception as e:
-                        logger.warning(f"记录请求日志失败: {e}")
-                        await session.rollback()
-            
-            return ForwardResponse(
-                status=500,
-                error=error_msg,
-            )
+
+        # 三条路径共用一次日志记录（后台批量写入，不阻塞响应）
+        if self._log_writer:
+            self._log_writer.enqueue({
+                "tunnel_domain": domain,
+                "method": method,
+                "path": path,
+                "request_headers": headers,
+                "request_body": request.body,
+                "status_code": status_code,
+                "response_headers": response.headers if response else None,
+                "response_body": response.body if response else None,
+                "error": response.error if response else error_msg,
+                "duration_ms": duration_ms,
+            })
+
+        if response is None:
+            return ForwardResponse(status=status_code, error=error_msg)
+
+        # Parse body: try JSON first, fall back to raw string
+        parsed_body = response.body if not parse_body else None
+        if parse_body and response.body:
+            try:
+                parsed_body = orjson.loads(response.body)
+            except orjson.JSONDecodeError:
+                parsed_body = response.body
+
+        # 字段均来自已校验的 TunnelResponse，跳过校验直接构造
+        return ForwardResponse.model_construct(
+            status=response.status,
+            headers=response.headers,
+            body=parsed_body,
+            duration_ms=duration_ms,
+            error=response.error,
+        )
 
     async def _forward_tcp(
         self,
@@ -1296,22 +1539,21 @@ class TunnelServer:
         6. 客户端发送 TcpCloseMessage → 解析 Future
         7. 返回累积的响应数据
         """
-        import base64
-
         conn = self.manager.get_connection_by_domain(domain)
         if not conn:
             return ForwardResponse(status=503, error=f"Tunnel not connected: {domain}")
 
         conn_id = str(uuid.uuid4())
-        start_time = asyncio.get_event_loop().time()
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
 
         try:
             # 1. 创建待响应请求
             future = await self.manager.create_pending_tcp_request(conn_id)
 
             # 2. 发送 TCP 连接建立消息
-            connect_msg = TcpConnectMessage(conn_id=conn_id)
-            await conn.websocket.send_text(connect_msg.model_dump_json())
+            connect_msg = TcpConnectMessage.model_construct(conn_id=conn_id)
+            await conn.websocket.send_text(dump_message(connect_msg))
 
             # 3. 发送数据
             if body:
@@ -1321,20 +1563,15 @@ class TunnelServer:
                 elif isinstance(body, str):
                     data = body.encode("utf-8")
                 else:
-                    data = json.dumps(body).encode("utf-8")
+                    data = _dump_body(body).encode("utf-8")
 
-                # 编码为 base64 并发送
-                data_msg = TcpDataMessage(
-                    conn_id=conn_id,
-                    data=base64.b64encode(data).decode("ascii"),
-                    sequence=0,
-                )
-                await conn.websocket.send_text(data_msg.model_dump_json())
+                await self._send_tcp_data(conn, conn_id, data, sequence=0)
 
             # 4. 等待客户端响应（TcpDataMessage 累积 + TcpCloseMessage 完成）
-            result = await asyncio.wait_for(future, timeout=timeout)
+            async with asyncio.timeout(timeout):
+                result = await future
 
-            elapsed = asyncio.get_event_loop().time() - start_time
+            elapsed = loop.time() - start_time
             duration_ms = int(elapsed * 1000)
 
             if result.get("error"):
@@ -1362,11 +1599,11 @@ class TunnelServer:
             await self.manager.cleanup_tcp_request(conn_id)
             # 通知客户端关闭
             try:
-                close_msg = TcpCloseMessage(conn_id=conn_id)
-                await conn.websocket.send_text(close_msg.model_dump_json())
+                close_msg = TcpCloseMessage.model_construct(conn_id=conn_id)
+                await conn.websocket.send_text(dump_message(close_msg))
             except Exception:
                 pass
-            elapsed = asyncio.get_event_loop().time() - start_time
+            elapsed = loop.time() - start_time
             return ForwardResponse(
                 status=504,
                 error="TCP forward timeout",
@@ -1375,7 +1612,7 @@ class TunnelServer:
         except Exception as e:
             await self.manager.cleanup_tcp_request(conn_id)
             logger.error(f"TCP forward error: {e}", exc_info=True)
-            elapsed = asyncio.get_event_loop().time() - start_time
+            elapsed = loop.time() - start_time
             return ForwardResponse(
                 status=500,
                 error=str(e),
@@ -1394,15 +1631,14 @@ class TunnelServer:
         if not data:
             return {"status": 200, "body": ""}
 
-        text = data.decode("utf-8", errors="replace")
-
-        # 尝试解析为 JSON
+        # 尝试解析为 JSON（orjson 直接解析字节，无需先解码）
         try:
-            body = json.loads(text)
-            return {"status": 200, "body": body}
-        except (json.JSONDecodeError, ValueError):
+            return {"status": 200, "body": orjson.loads(data)}
+        except orjson.JSONDecodeError:
             pass
 
+        text = data.decode("utf-8", errors="replace")
+
         # 尝试解析为 HTTP 响应
         if text.startswith("HTTP/"):
             try:
@@ -1450,6 +1686,7 @@ class TunnelServer:
         headers: dict[str, str] | None = None,
         body: Any = None,
         timeout: float = 1800.0,
+        body_is_json: bool = False,
     ) -> AsyncIterator[StreamStartMessage | StreamChunkMessage | StreamEndMessage]:
         """
         转发请求到隧道并返回流式响应（SSE 支持）
@@ -1458,7 +1695,8 @@ class TunnelServer:
         返回一个 AsyncIterator，依次产生：
         1. StreamStartMessage - 流开始，包含 HTTP 状态码和响应头
         2. StreamChunkMessage* - 零个或多个数据块
-        3. StreamEndMessage - 流结束，包含统计信息
+        3. StreamEndMessage - 流结束，包含统计信息；消费过慢导致数据块被丢弃时，
+           error 中会注明丢弃的数据块数
 
         如果目标不是 SSE 响应，将收到一个包含完整响应的 StreamChunkMessage，
         然后立即收到 StreamEndMessage。
@@ -1470,6 +1708,7 @@ class TunnelServer:
             headers: 请求头
             body: 请求体
             timeout: 超时时间（秒）
+            body_is_json: body 已是 JSON 文本时传 True，原样放入请求而不再序列化
 
         Yields:
             StreamStartMessage | StreamChunkMessage | StreamEndMessage
@@ -1489,15 +1728,21 @@ class TunnelServer:
             yield StreamStartMessage(id="error", status=503, headers={})
             yield StreamEndMessage(id="error", error=f"Tunnel not connected: {domain}")
             return
+        if self.manager.pending_count >= self.config.max_pending_requests:
+            yield StreamStartMessage(id="error", status=503, headers={})
+            yield StreamEndMessage(id="error", error="overloaded")
+            return
 
-        request_id = str(uuid.uuid4())
-        request = TunnelRequest(
+        request_id = _next_request_id()
+        # 字段类型已确定，跳过校验直接构造，发送时用 orjson 序列化
+        request = TunnelRequest.model_construct(
             id=request_id,
             method=method,
             path=path,
             headers=headers or {},
-            body=json.dumps(body) if body else None,
+            body=_request_body(body, body_is_json),
             timeout=timeout,
+            allow_stream=True,
         )
 
         try:
@@ -1505,40 +1750,58 @@ class TunnelServer:
             pending = await self.manager.create_stream_request(request_id)
 
             # 发送请求
-            await conn.websocket.send_text(request.model_dump_json())
+            await conn.websocket.send_text(dump_message(request))
 
-            # 从队列中读取流式数据
-            start_time = datetime.now()
+            # 从缓冲中读取流式数据：缓冲非空时连续取出，只有取空后才等待唤醒
+            start_sent = False
             while True:
-                try:
-                    # 使用超时等待
-                    message = await asyncio.wait_for(
-                        pending.queue.get(),
-                        timeout=timeout
-                    )
-                except asyncio.TimeoutError:
-                    # 超时，发送错误结束消息
-                    yield StreamEndMessage(
-                        id=request_id,
-                        error="Stream timeout",
-                    )
-                    break
+                if not pending.buffer:
+                    pending.event.clear()
+                    try:
+                        async with asyncio.timeout(timeout):
+                            await pending.event.wait()
+                    except asyncio.TimeoutError:
+                        # 超时，发送错误结束消息
+                        yield StreamEndMessage(
+                            id=request_id,
+                            error="Stream timeout",
+                        )
+                        break
+                message = pending.buffer.popleft()
 
                 if message is None:
                     # 流结束
                     break
 
-                yield message
+                # 按身份比较而非 isinstance：结束消息之后必有 None 哨兵，无需单独判断
+                if message is pending.start_message:
+                    start_sent = True
+                elif not start_sent and pending.start_message:
+                    # 开始消息因队列溢出被丢弃，先补发
+                    start_sent = True
+                    yield pending.start_message
+
+                if message is pending.end_message and pending.dropped:
+                    # 数据不完整，在结束消息中告知调用方丢弃的数据块数
+                    dropped_error = f"Dropped {pending.dropped} stream chunks: consumer too slow"
+                    message = message.model_copy(update={
+                        "error": f"{message.error}; {dropped_error}" if message.error
+                        else dropped_error,
+                    })
 
-                if isinstance(message, StreamEndMessage):
-                    break
+                yield message
 
             # 更新统计
-            if self.db and pending.started:
-                async with self.db.session() as session:
-                    repo = TunnelRepository(session)
-                    await repo.increment_requests(conn.token)
+            if self._request_counts and pending.started:
+                self._request_counts.add(conn.token)
 
+        except WebSocketDisconnect as e:
+            # 隧道连接在发送请求时断开属于常见情况，不记录堆栈
+            logger.info(f"Stream forward aborted, tunnel disconnected: {domain}")
+            yield StreamEndMessage(
+                id=request_id,
+                error=f"Tunnel disconnected: {e.code}",
+            )
         except Exception as e:
             logger.error(f"Stream forward error: {e}", exc_info=True)
             yield StreamEndMessage(
@@ -1583,8 +1846,6 @@ class TunnelServer:
         3. 发送 TcpConnectMessage 通知客户端建立到目标的连接
         4. 双向转发数据: 外部 TCP <-> WebSocket <-> 客户端 <-> 目标服务
         """
-        import base64
-
         conn_id = str(uuid.uuid4())
         peer = writer.get_extra_info("peername")
         logger.info(f"收到 TCP 连接: {peer} -> conn_id={conn_id}")
@@ -1620,14 +1881,14 @@ class TunnelServer:
 
         try:
             # 通知客户端建立到目标的 TCP 连接
-            connect_msg = TcpConnectMessage(conn_id=conn_id)
-            await tunnel_conn.websocket.send_text(connect_msg.model_dump_json())
+            connect_msg = TcpConnectMessage.model_construct(conn_id=conn_id)
+            await tunnel_conn.websocket.send_text(dump_message(connect_msg))
 
             # 启动从外部 TCP 读取数据的任务
             tcp_conn = await self.manager.get_tcp_connection(conn_id)
             if tcp_conn:
                 tcp_conn.read_task = asyncio.create_task(
-                    self._tcp_read_loop(conn_id, reader, tunnel_conn.websocket)
+                    self._tcp_read_loop(conn_id, reader, tunnel_conn)
                 )
                 # 等待读取任务完成（连接关闭或出错）
                 await tcp_conn.read_task
@@ -1637,8 +1898,8 @@ class TunnelServer:
         finally:
             # 通知客户端关闭连接
             try:
-                close_msg = TcpCloseMessage(conn_id=conn_id)
-                await tunnel_conn.websocket.send_text(close_msg.model_dump_json())
+                close_msg = TcpCloseMessage.model_construct(conn_id=conn_id)
+                await tunnel_conn.websocket.send_text(dump_message(close_msg))
             except Exception:
                 pass
             await self.manager.remove_tcp_connection(conn_id)
@@ -1647,13 +1908,11 @@ class TunnelServer:
         self,
         conn_id: str,
         reader: asyncio.StreamReader,
-        websocket: WebSocket,
+        tunnel_conn: ActiveConnection,
     ) -> None:
         """
         持续从外部 TCP 连接读取数据，通过 WebSocket 发送给客户端
         """
-        import base64
-
         sequence = 0
         try:
             while True:
@@ -1663,13 +1922,7 @@ class TunnelServer:
                     logger.info(f"TCP 连接对端关闭: conn_id={conn_id}")
                     break
 
-                # 编码并发送
-                data_msg = TcpDataMessage(
-                    conn_id=conn_id,
-                    data=base64.b64encode(data).decode("ascii"),
-                    sequence=sequence,
-                )
-                await websocket.send_text(data_msg.model_dump_json())
+                await self._send_tcp_data(tunnel_conn, conn_id, data, sequence)
                 sequence += 1
                 logger.debug(f"TCP->WS: conn_id={conn_id}, size={len(data)}, seq={sequence}")
         except asyncio.CancelledError:
@@ -1679,30 +1932,56 @@ class TunnelServer:
 
     # ============== TCP 模式支持方法（WebSocket 消息处理） ==============
 
+    async def _send_tcp_data(
+        self,
+        tunnel_conn: ActiveConnection,
+        conn_id: str,
+        data: bytes,
+        sequence: int,
+    ) -> None:
+        """发送 TCP 数据给客户端：已协商时用二进制帧，否则回退为 Base64 JSON 消息"""
+        if tunnel_conn.binary_tcp:
+            await tunnel_conn.websocket.send_bytes(
+                encode_tcp_data_frame(conn_id, data, sequence)
+            )
+            return
+
+        data_msg = TcpDataMessage.model_construct(
+            conn_id=conn_id,
+            data=base64.b64encode(data).decode("ascii"),
+            sequence=sequence,
+        )
+        await tunnel_conn.websocket.send_text(dump_message(data_msg))
+
     async def _handle_tcp_data_from_client(self, message: TcpDataMessage) -> None:
+        """处理从客户端接收的 Base64 编码 TCP 数据（未协商二进制帧的客户端）"""
+        try:
+            data = base64.b64decode(message.data)
+        except Exception as e:
+            logger.error(f"处理 TCP 数据错误: {message.conn_id}, {e}")
+            return
+        await self._route_tcp_data(message.conn_id, data)
+
+    async def _route_tcp_data(self, conn_id: str, data: bytes) -> None:
         """
-        处理从客户端接收的 TCP 数据
+        路由从客户端接收的 TCP 数据
 
         两种场景:
         1. HTTP 触发的 TCP 转发 -> 累积到 PendingTcpRequest
         2. 服务端 TCP 监听 -> 写入到真实 TCP 连接
         """
-        import base64
-
         try:
-            data = base64.b64decode(message.data)
-
             # 优先检查是否有待响应的 HTTP 触发的 TCP 请求
-            if await self.manager.handle_tcp_response_data(message.conn_id, data):
-                logger.debug(f"TCP 响应数据累积: conn_id={message.conn_id}, size={len(data)}")
+            if await self.manager.handle_tcp_response_data(conn_id, data):
+                logger.debug(f"TCP 响应数据累积: conn_id={conn_id}, size={len(data)}")
                 return
 
             # 其次检查是否有真实 TCP 连接（服务端监听场景）
-            success = await self.manager.handle_tcp_data(message.conn_id, data)
+            success = await self.manager.handle_tcp_data(conn_id, data)
             if not success:
-                logger.warning(f"无法路由 TCP 数据: conn_id={message.conn_id}")
+                logger.warning(f"无法路由 TCP 数据: conn_id={conn_id}")
         except Exception as e:
-            logger.error(f"处理 TCP 数据错误: {message.conn_id}, {e}")
+            logger.error(f"处理 TCP 数据错误: {conn_id}, {e}")
 
     async def _handle_tcp_close_from_client(self, message: TcpCloseMessage) -> None:
         """
@@ -407,7 +407,6 @@ export class TunnelClient {
             id: requestId,
             data: chunk,
             sequence: chunkCount,
-            timestamp: new Date().toISOString(),
           };
           ws.send(JSON.stringify(chunkMsg));
           chunkCount++;
@@ -1,7 +1,7 @@
 /**
  * WS-Tunnel 协议定义
  *
- * 协议版本: 1.0
+ * 协议版本: 1.2
  */
 
 export enum MessageType {
@@ -31,6 +31,7 @@ export interface AuthMessage {
   token: string;
   client_version?: string;
   force?: boolean;
+  features?: string[];
 }
 
 export interface AuthOkMessage {
@@ -38,6 +39,7 @@ export interface AuthOkMessage {
   domain: string;
   tunnel_id: string;
   server_version?: string;
+  features?: string[];
 }
 
 export interface AuthErrorMessage {
@@ -56,6 +58,7 @@ export interface TunnelRequest {
   headers: Record<string, string>;
   body?: string | null;
   timeout?: number;
+  allow_stream?: boolean;
   timestamp?: string;
 }
 
@@ -85,7 +88,6 @@ export interface StreamChunkMessage {
   id: string;
   data: string;
   sequence?: number;
-  timestamp?: string;
 }
 
 export interface StreamEndMessage {
@@ -101,12 +103,10 @@ export interface StreamEndMessage {
 
 export interface PingMessage {
   type: MessageType.PING;
-  timestamp?: string;
 }
 
 export interface PongMessage {
   type: MessageType.PONG;
-  timestamp?: string;
 }
 
 // ============== 消息联合类型 ==============
@@ -137,7 +137,6 @@ export function createAuthMessage(token: string, force: boolean = false): AuthMe
 export function createPongMessage(): PongMessage {
   return {
     type: MessageType.PONG,
-    timestamp: new Date().toISOString(),
   };
 }
 